@@ -1,37 +1,258 @@
+import asyncio, hmac, os, time
 import uvicorn
-from fastapi import FastAPI, Request
-from detection import rule_detect
-from ml_detection import ml_detect  # ML 탐지기 (예: IsolationForest 등)
+from fastapi import Depends, FastAPI, HTTPException, Request
+from detection import REST_ROUTER, _ip_stats, cache_stats, reload_openapi, stage_stats
+from ml_detection import ml_predict_rows, model_stats, reload_models, start_watcher  # ML 탐지기 (예: IsolationForest 등)
+from microbatch import MicroBatcher
+from executor import DetectExecutor, Overloaded, detect_records, screen, trace_record
+from parsed_request import ParsedRequest
+import eventlog
+import metrics
+import retrain
+import ruletrace
 
 app = FastAPI()
 
-from fastapi.responses import JSONResponse
+# 룰 / ML 연산은 실행기(DETECT_EXECUTOR)에서 돌려 이벤트 루프를 막지 않음
+_executor = DetectExecutor()
+
+# 동시 /detect 호출의 ML 추론을 모아서 한 번에 예측 (예측도 실행기에서)
+_ml_batcher = MicroBatcher(ml_predict_rows,
+                           runner=None if _executor.mode == "inline" else _executor.run)
+
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+# 이벤트 루프 지연 측정 주기 (초)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+# /detect/batch: 레코드 수 상한 (넘으면 413), 실행기 작업 하나에 넣는 레코드 수
+DETECT_BATCH_MAX   = int(os.getenv("DETECT_BATCH_MAX", "1000"))
+DETECT_BATCH_CHUNK = int(os.getenv("DETECT_BATCH_CHUNK", "64"))
+# /admin/* 인증: ADMIN_TOKEN 이 있으면 X-Admin-Token 헤더가 같아야 함, 없으면 루프백 주소에서 온 요청만 허용
+ADMIN_TOKEN        = os.getenv("ADMIN_TOKEN", "")
+_LOOPBACK          = ("127.0.0.1", "::1", "localhost")
+
+def _require_admin(request: Request):
+    if ADMIN_TOKEN:
+        if hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+            return
+    elif request.client is not None and request.client.host in _LOOPBACK:
+        return
+    raise HTTPException(status_code=403, detail="admin endpoint: X-Admin-Token required (or loopback when ADMIN_TOKEN is unset)")
+
+async def _watch_loop_lag():
+    # sleep 이 예정보다 늦게 깨어난 만큼 = 루프를 막은 시간
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.LOOP_LAG.observe(max(0.0, loop.time() - t - LOOP_LAG_INTERVAL))
+
+@app.on_event("startup")
+def _start_executor():
+    _executor.start()
+
+@app.on_event("startup")
+def _start_model_watcher():
+    # models/CURRENT 가 바뀌면 백그라운드에서 새 번들 적재 → 사전 검증 → 교체 (재시작 없음)
+    start_watcher()
+
+@app.on_event("startup")
+def _start_retrain():
+    # 룰을 통과한 요청의 특징 행 표본 → RETRAIN_INTERVAL_SEC 마다 별도 프로세스에서 재학습 → 사전 검증 후 교체
+    retrain.start(trainer=True)
+
+@app.on_event("startup")
+async def _start_loop_lag():
+    app.state.loop_lag_task = asyncio.create_task(_watch_loop_lag())
+
+@app.on_event("shutdown")
+def _stop_executor():
+    _executor.shutdown()
+
+def _verdict(method: str, anomaly) -> dict:
+    metrics.VERDICTS.inc(method)
+    return {"anomaly": anomaly, "method": method}
+
+def _overloaded(e: Overloaded):
+    metrics.VERDICTS.inc("error")
+    eventlog.warning("overload", detail=str(e))
+    return JSONResponse(
+        status_code=503,
+        content={"anomaly": "error", "detail": str(e)},
+        headers={"Retry-After": "1"},
+    )
 
 @app.post("/detect")
 async def detect(request: Request):
+    t0 = time.perf_counter()
     try:
-        data = await request.json()
+        # 본문은 한 번만 파싱 (헤더 소문자 정규화 / UA / 경로 토큰 …) → 룰과 ML 이 함께 사용
+        req = ParsedRequest(await request.json())
 
-        # 1단계: 룰 기반 탐지
-        if rule_detect(data):
-            print("[RULE] 탐지됨!")
-            return {"anomaly": True, "method": "rule"}
+        # 1단계: 룰 기반 탐지 (+ 통과 시 ML 특징 추출)
+        stage, row = await _executor.run(screen, req)
+        if stage == "rule":
+            eventlog.info("detect_rule", ip=req.ip, path=req.path)
+            return _verdict("rule", True)
 
-        # 2단계: ML 기반 탐지
-        if ml_detect(data):
-            print("[ML] 탐지됨!")
-            return {"anomaly": True, "method": "ml"}
+        # 2단계: ML 기반 탐지 (마이크로 배치)
+        if row is not None and await _ml_batcher.submit(row):
+            eventlog.info("detect_ml", ip=req.ip, path=req.path)
+            return _verdict("ml", True)
 
-        return {"anomaly": False, "method": "normal"}
+        return _verdict("normal", False)
     
+    except Overloaded as e:
+        return _overloaded(e)
+    except Exception as e:
+        metrics.VERDICTS.inc("error")
+        eventlog.error("error", detail=str(e))
+        return JSONResponse(
+            status_code=400,
+            content={"anomaly": "error", "detail": str(e)}
+        )
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, "detect")
+
+@app.post("/detect/batch")
+async def detect_batch(request: Request):
+    # 요청 레코드 목록을 받아 같은 순서로 판정 결과 목록을 반환
+    t0 = time.perf_counter()
+    try:
+        records = await request.json()
+        if not isinstance(records, list):
+            raise ValueError("request body must be a JSON list")
+    except Exception as e:
+        metrics.VERDICTS.inc("error")
+        eventlog.error("error", detail=str(e))
+        return JSONResponse(
+            status_code=400,
+            content={"anomaly": "error", "detail": str(e)}
+        )
+
+    if len(records) > DETECT_BATCH_MAX:
+        metrics.VERDICTS.inc("error")
+        return JSONResponse(
+            status_code=413,
+            content={"anomaly": "error", "detail": f"batch too large ({len(records)} > {DETECT_BATCH_MAX})"}
+        )
+
+    # DETECT_BATCH_CHUNK 개씩 나눠 순서대로 실행기에 넣음 → 작업 하나가 워커를 오래 잡지 않고,
+    # 조각마다 대기열 자리를 얻으므로 과부하 판정(503)도 단건 /detect 와 같은 기준
+    results = []
+    try:
+        step = max(1, DETECT_BATCH_CHUNK)
+        for i in range(0, len(records), step):
+            results += await _executor.run(detect_records, records[i:i + step])
+    except Overloaded as e:
+        return _overloaded(e)
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, "detect_batch")
+    for r in results:
+        metrics.VERDICTS.inc("error" if r["anomaly"] == "error" else r["method"])
+    return {"results": results}
 
+@app.post("/detect/trace")
+async def detect_trace(request: Request, profile: str = ""):
+    # 룰 판정 기록 반환 (FINAL_SCORE_THRESHOLD 조정 / 느린 단계 확인용). IP 상태는 실제 요청처럼 갱신됨
+    # profile=cprofile | pyinstrument 이면 프로파일 요약 포함 (RULE_TRACE_REQUEST_PROFILE=1 일 때만)
+    if profile and not ruletrace.REQUEST_PROFILE:
+        return JSONResponse(
+            status_code=403,
+            content={"anomaly": "error", "detail": "profile= is disabled (set RULE_TRACE_REQUEST_PROFILE=1)"}
+        )
+    try:
+        data = await request.json()
+        return await _executor.run(trace_record, data, profile)
+    except Overloaded as e:
+        return _overloaded(e)
     except Exception as e:
-        print(f"[ERROR] {e}")
+        eventlog.error("error", detail=str(e))
         return JSONResponse(
             status_code=400,
             content={"anomaly": "error", "detail": str(e)}
         )
 
+@app.get("/detect/batch/stats")
+def batch_stats():
+    return _ml_batcher.stats()
+
+@app.get("/stats/executor")
+def executor_stats():
+    # 실행 모드, 실행 중/최대 동시 작업 수, 대기열 초과로 거절된 요청 수
+    return _executor.stats()
+
+@app.get("/stats/log")
+def log_stats():
+    # 기록 / 샘플링·초당 제한·큐 초과로 버린 로그 이벤트 수
+    return eventlog.stats()
+
+# 수집 시점에 읽는 게이지: 상태 저장소(_ip_stats / ip_states) 점유율, 실행기 대기열, 로그 버림 수
+@metrics.gauge_fn
+def _gauges():
+    out = metrics.flatten("waf_state", "상태 백엔드 stats() 값", _ip_stats.stats())
+    out += metrics.flatten("waf_executor", "탐지 실행기 stats() 값", _executor.stats())
+    out += metrics.flatten("waf_log", "이벤트 로그 stats() 값", eventlog.stats())
+    out += metrics.flatten("waf_rule_cache", "룰 판정 캐시 stats() 값", cache_stats())
+    out += metrics.flatten("waf_rule_stage", "룰 즉시 차단 단계 측정 비용 / 차단율", stage_stats()["stages"])
+    stats = model_stats()
+    stats["retrain"] = {k: v for k, v in stats["retrain"].items() if k != "last_run"}
+    out += metrics.flatten("waf_model", "ML 모델 리로드 / 재학습 stats() 값",
+                           {k: v for k, v in stats.items() if k != "last_reload"})
+    out += metrics.flatten("waf_ml_batch", "ML 마이크로 배치 stats() 값",
+                           {k: v for k, v in _ml_batcher.stats().items() if k != "sizes"})
+    return out
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/state")
+def state_stats():
+    # 상태 백엔드(IP 빈도 카운터 / ML 행동 상태)의 점유율과 축출 횟수
+    return _ip_stats.stats()
+
+@app.get("/stats/rules/cache")
+def rule_cache_stats():
+    # 상태 없는 점수 지문 캐시 / GraphQL 판정 캐시의 항목 수와 적중률 (이 프로세스 기준.
+    # process 실행 모드의 자식 포함 합계는 /metrics 의 waf_rule_cache_total)
+    return cache_stats()
+
+@app.get("/stats/rules/stages")
+def rule_stage_stats():
+    # 즉시 차단 단계(geo / tls / graphql)의 현재 실행 순서와 표본 측정 비용 / 차단율 (이 프로세스 기준)
+    return stage_stats()
+
+@app.post("/admin/openapi/reload", dependencies=[Depends(_require_admin)])
+def openapi_reload():
+    # 재시작 없이 OpenAPI 스펙(REST 스키마 화이트리스트) 재적재
+    ok = reload_openapi()
+    return {"reloaded": ok, "routes": REST_ROUTER.size}
+
+@app.post("/admin/models/reload", dependencies=[Depends(_require_admin)])
+def models_reload(version: str = "", force: bool = False):
+    # 재시작 없이 ML 모델 번들 교체 (version 없으면 models/CURRENT). 사전 검증에 실패하면 기존 모델 유지
+    # 처리 중인 요청은 기존 모델로 끝남. process 실행 모드의 자식은 CURRENT 감시로 ML_RELOAD_POLL_SEC 안에 따라옴
+    rep = reload_models(version or None, force)
+    if not rep["reloaded"] and rep.get("reason") != "already active":
+        return JSONResponse(status_code=409, content=rep)
+    return rep
+
+@app.post("/admin/models/retrain", dependencies=[Depends(_require_admin)])
+def models_retrain():
+    # 다음 주기를 기다리지 않고 지금 재학습을 백그라운드로 시작 (학습은 별도 프로세스)
+    # 결과는 /stats/models 의 retrain.running / retrain.last_run. 이미 진행 중이면 409
+    if not retrain.start_run():
+        return JSONResponse(status_code=409, content={"started": False, "reason": "retrain already running",
+                                                      "status": "/stats/models"})
+    return JSONResponse(status_code=202, content={"started": True, "status": "/stats/models"},
+                        headers={"Location": "/stats/models"})
+
+@app.get("/stats/models")
+def models_stats():
+    # 현재 / 직전 모델 버전, 리로드 / 거절 횟수, 마지막 리로드 사전 검증 결과
+    return model_stats()
+
 @app.get("/")
 def root():
     return {"message": "WAF Microservice is running"}
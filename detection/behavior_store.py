@@ -0,0 +1,134 @@
+# behavior_store.py
+"""
+ML 시간 윈도우 특징용 IP별 행동 상태 저장소
+──────────────────────────────────────────────
+  - 요청마다 전체 deque 를 다시 훑지 않고 특징을 증분 유지 (요청당 상각 O(1))
+      req_count                : 60초 창 이벤트 deque 길이
+      req_count_in_last_10s    : 10초 창 타임스탬프 deque 길이
+      unique_paths_in_last_60s : 60초 창 경로 refcount 다중집합의 키 개수
+      interval                 : 창 안의 직전 요청과의 간격 (없으면 0)
+  - 메모리 상한
+      IP 당 이벤트 MAX_EVENTS_PER_IP, 전체 이벤트 MAX_TOTAL_EVENTS, 추적 IP MAX_TRACKED_IPS
+      넘치면 가장 오래 쉰 IP 부터 축출
+  - 마지막 요청 후 IDLE_TTL 초가 지난 IP 는 자동 정리
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Tuple
+
+LONG_WINDOW        = 60
+SHORT_WINDOW       = 10
+IDLE_TTL           = 60          # 초. 이후에는 창이 모두 비므로 상태를 유지할 이유가 없음
+MAX_TRACKED_IPS    = 200_000
+MAX_EVENTS_PER_IP  = 4_096
+MAX_TOTAL_EVENTS   = 1_000_000
+TTL_SWEEP_STEP     = 4           # 요청마다 만료 검사할 IP 수
+
+
+class _IPState:
+    __slots__ = ("events", "recent", "paths", "last_ts")
+
+    def __init__(self):
+        self.events: deque = deque()            # (ts, path), 60초 창
+        self.recent: deque = deque()            # ts, 10초 창
+        self.paths: Dict[str, int] = {}         # 60초 창 경로 → 등장 횟수
+        self.last_ts = 0.0
+
+
+class BehaviorStore:
+    def __init__(self, max_ips=MAX_TRACKED_IPS, max_events_per_ip=MAX_EVENTS_PER_IP,
+                 max_total_events=MAX_TOTAL_EVENTS, idle_ttl=IDLE_TTL):
+        self.max_ips = max_ips
+        self.max_events_per_ip = max_events_per_ip
+        self.max_total_events = max_total_events
+        self.idle_ttl = idle_ttl
+        self._states: "OrderedDict[str, _IPState]" = OrderedDict()   # 앞쪽일수록 오래 쉰 IP
+        self._events = 0
+        self._lock = threading.Lock()
+        self.evicted_ttl = 0
+        self.evicted_cap = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, ip) -> bool:
+        return ip in self._states
+
+    # ─── 내부 ───
+    def _pop_event(self, st: _IPState):
+        _, p = st.events.popleft()
+        n = st.paths[p] - 1
+        if n:
+            st.paths[p] = n
+        else:
+            del st.paths[p]
+        self._events -= 1
+
+    def _drop(self, ip: str):
+        st = self._states.pop(ip)
+        self._events -= len(st.events)
+
+    def _evict(self, now: float):
+        states = self._states
+        # 나이 만료 (앞쪽 몇 개만 검사)
+        for _ in range(TTL_SWEEP_STEP):
+            if not states:
+                break
+            ip, st = next(iter(states.items()))
+            if now - st.last_ts <= self.idle_ttl:
+                break
+            self._drop(ip)
+            self.evicted_ttl += 1
+        # 하드 상한
+        while states and (len(states) > self.max_ips or self._events > self.max_total_events):
+            self._drop(next(iter(states)))
+            self.evicted_cap += 1
+
+    # ─── 공개 API ───
+    def observe(self, ip: str, path: str, now: float) -> Tuple[int, float, int, int]:
+        """
+        요청 1건을 기록하고 (req_count, interval, req_count_in_last_10s,
+        unique_paths_in_last_60s) 를 반환.
+        """
+        with self._lock:
+            st = self._states.get(ip)
+            if st is None:
+                st = self._states[ip] = _IPState()
+            else:
+                self._states.move_to_end(ip)
+
+            events, recent = st.events, st.recent
+            lo = now - LONG_WINDOW
+            while events and events[0][0] <= lo:
+                self._pop_event(st)
+            lo = now - SHORT_WINDOW
+            while recent and recent[0] <= lo:
+                recent.popleft()
+
+            interval = now - events[-1][0] if events else 0
+            if len(events) >= self.max_events_per_ip:
+                self._pop_event(st)
+            if len(recent) >= self.max_events_per_ip:
+                recent.popleft()
+
+            events.append((now, path))
+            recent.append(now)
+            st.paths[path] = st.paths.get(path, 0) + 1
+            st.last_ts = now
+            self._events += 1
+
+            result = (len(events), interval, len(recent), len(st.paths))
+            self._evict(now)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "tracked_ips" : len(self._states),
+            "events"      : self._events,
+            "max_ips"     : self.max_ips,
+            "max_events"  : self.max_total_events,
+            "evicted_ttl" : self.evicted_ttl,
+            "evicted_cap" : self.evicted_cap,
+        }
@@ -0,0 +1,78 @@
+# bench_ratelimit.py
+"""
+IP 빈도 제한 구조 메모리/처리량 벤치마크
+  - 기존 방식: OrderedDict[ip] = {"count", "start"} (고정 윈도우)
+  - 새 방식:   ratelimit.SlidingWindowLimiter (슬롯 + array 컬럼, 슬라이딩 윈도우)
+  - 신규 등록 / 재방문 / 상한이 찬 뒤 새 IP 만 계속 들어오는 경우(churn)의 처리량
+사용법: python bench_ratelimit.py [추적 IP 수]   (기본 1,000,000)
+"""
+import gc, sys, time, tracemalloc
+from collections import OrderedDict
+from ratelimit import SlidingWindowLimiter
+
+WINDOW_SEC = 60
+CHURN      = 100_000       # 상한 도달 후 새 IP 수 (스푸핑 IP 폭주)
+
+
+class _OrderedDictLimiter:
+    """기존 detection.stage_ip 구조 (비교용)."""
+    def __init__(self, cap):
+        self.d, self.cap = OrderedDict(), cap
+
+    def hit(self, ip, now):
+        st = self.d.get(ip)
+        if st is None or now - st["start"] > WINDOW_SEC:
+            self.d[ip] = st = {"count": 1, "start": now}
+        else:
+            st["count"] += 1
+        self.d.move_to_end(ip)
+        while len(self.d) > self.cap:
+            self.d.popitem(last=False)
+        return st["count"]
+
+
+def _ips(n):
+    return [f"{(i >> 24) & 255}.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(1, n + 1)]
+
+
+def bench(name, make, ips, churn):
+    n = len(ips)
+    now = 1_000_000.0
+
+    # 메모리: tracemalloc 은 할당을 느리게 하므로 처리량과 따로 측정
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    lim = make()
+    for ip in ips:
+        lim.hit(ip, now)
+    mem = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del lim
+    gc.collect()
+
+    lim = make()
+    t0 = time.perf_counter()
+    for ip in ips:                         # 신규 IP 등록
+        lim.hit(ip, now)
+    t_ins = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for ip in ips:                         # 이미 추적 중인 IP 재방문
+        lim.hit(ip, now + 1)
+    t_hit = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for ip in churn:                       # 상한이 찬 상태에서 처음 보는 IP (만료된 슬롯 없음 → 매번 축출)
+        lim.hit(ip, now + 2)
+    t_churn = time.perf_counter() - t0
+    print(f"{name:<22} mem={mem / 2**20:8.1f} MiB ({mem / n:6.1f} B/IP)  "
+          f"insert={n / t_ins / 1e3:8.0f} k/s  hit={n / t_hit / 1e3:8.0f} k/s  "
+          f"churn={len(churn) / t_churn / 1e3:8.0f} k/s")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    ips = _ips(n + CHURN)
+    ips, churn = ips[:n], ips[n:]
+    print(f"tracked IPs: {n:,}  churn: {CHURN:,} new IPs at capacity")
+    bench("OrderedDict (기존)", lambda: _OrderedDictLimiter(n), ips, churn)
+    bench("SlidingWindowLimiter", lambda: SlidingWindowLimiter(WINDOW_SEC, n), ips, churn)
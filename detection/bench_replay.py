@@ -0,0 +1,254 @@
+# bench_replay.py
+"""
+탐지 파이프라인 재생 벤치마크 (HTTP 없이 프로세스 안에서 rule_detect → ML 순서로 재생)
+──────────────────────────────────────────────
+  - 입력: traffic_log.csv (generate 스크립트 형식) 또는 /detect 요청 본문을 한 줄씩 담은 JSONL
+  - 요청은 timestamp 순으로 정렬해 재생하고, detection.clock / ml_detection.clock 을
+    현재 요청의 timestamp 로 바꿔 시간 윈도우 특징이 매번 같게 나오도록 함
+  - 처리량 / 판정은 서비스와 같은 rule_detect (적응형 단계 순서 + 점수 캐시) 로 측정
+  - 단계별 시간은 깨끗한 IP 상태로 rule_detect_traced (선언 순서, 캐시 없음) 를 한 번 더 재생해 따로 측정.
+    두 경로의 룰 차단 수가 다르면 실패
+  - 출력: 처리량(req/s), 단계별 p50 / p99 / p999 (µs), 판정 수, RSS / 상태 저장소 증가량
+  - --baseline 파일(기본 bench_baseline.json, 저장소에 포함)과 비교해 처리량 / p99 가 허용 범위(--tolerance)
+    이상 나빠지거나 판정 수가 달라지면 종료 코드 1. 기준 파일이 없어도 (--save-baseline 이 아니면) 1
+
+사용법
+  python bench_replay.py [입력 파일] [--repeat N] [--save-baseline] [--baseline 경로] [--tolerance 0.2]
+  (판정이 의도적으로 바뀐 변경이면 --save-baseline 으로 기준을 다시 저장)
+"""
+
+import os
+os.environ.setdefault("STATE_BACKEND", "memory")    # 재생은 항상 깨끗한 프로세스 내부 상태로
+os.environ.setdefault("RULE_TRACE_SAMPLE", "0")
+
+import argparse, csv, gc, json, sys, time
+from typing import Dict, List
+
+import numpy as np
+
+import detection
+import ml_detection
+import state_backend
+from detection import rule_detect, rule_detect_traced
+from ml_detection import ml_features, ml_predict_rows
+from parsed_request import ParsedRequest
+
+BASE_DIR         = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT    = os.path.join(BASE_DIR, "traffic_log.csv")
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "bench_baseline.json")
+PERCENTILES      = (50, 99, 99.9)
+P99_SLACK_US     = 2.0     # p99 비교 절대 여유 (1 µs 안팎 단계는 타이머 / 스케줄링 잡음이 비율보다 큼)
+
+
+# ───────────── 입력 ─────────────
+def _csv_payload(row: dict) -> dict:
+    """traffic_log.csv 한 줄 → /detect 요청 본문."""
+    headers = {"User-Agent": row.get("ua") or ""}
+    for col, name in (("referer", "Referer"), ("authorization", "Authorization"), ("accept_type", "Accept")):
+        if row.get(col):
+            headers[name] = row[col]
+    n_cookie = int(float(row.get("cookie_count") or 0))
+    return {
+        "ip"       : row["ip"],
+        "timestamp": float(row["timestamp"]),
+        "method"   : row.get("method") or "GET",
+        "path"     : row.get("path") or "/",
+        "headers"  : headers,
+        "cookies"  : {f"c{i}": "1" for i in range(n_cookie)},
+    }
+
+
+def load_requests(path: str) -> List[dict]:
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            reqs = [_csv_payload(r) for r in csv.DictReader(f)]
+    else:
+        with open(path, encoding="utf-8") as f:
+            reqs = [json.loads(line) for line in f if line.strip()]
+    t0 = time.time()
+    for r in reqs:
+        r.setdefault("timestamp", t0)
+    reqs.sort(key=lambda r: float(r["timestamp"]))
+    return reqs
+
+
+# ───────────── 재생 ─────────────
+class ReplayClock:
+    """현재 재생 중인 요청의 timestamp 를 돌려주는 시계."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _rss_kib() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def replay(reqs: List[dict], clock: ReplayClock, repeat: int = 1) -> dict:
+    span = float(reqs[-1]["timestamp"]) - float(reqs[0]["timestamp"]) + 1.0
+
+    stages: Dict[str, List[int]] = {}
+    verdicts = {"rule": 0, "ml": 0, "normal": 0, "error": 0}
+    ns = time.perf_counter_ns
+
+    gc.collect()
+    rss0, state0 = _rss_kib(), detection._ip_stats.stats()
+    t_start = ns()
+    for k in range(repeat):
+        shift = k * span                    # 반복할 때마다 시간을 밀어 윈도우가 이어지게
+        for data in reqs:
+            if shift:
+                data = dict(data, timestamp=float(data["timestamp"]) + shift)
+            clock.now = float(data["timestamp"])
+            t0 = ns()
+            try:
+                req = ParsedRequest(data)           # app.py 처럼 한 번 파싱해 룰 / ML 이 함께 사용
+                tp = ns()
+                blocked = rule_detect(req)
+                t1 = ns()
+                stages.setdefault("parse", []).append(tp - t0)
+                stages.setdefault("rule_detect", []).append(t1 - tp)
+                if blocked:
+                    verdicts["rule"] += 1
+                    stages.setdefault("total", []).append(t1 - t0)
+                    continue
+                row = ml_features(req)
+                t2 = ns()
+                hit = row is not None and ml_predict_rows([row])[0]
+                t3 = ns()
+                stages.setdefault("ml_features", []).append(t2 - t1)
+                stages.setdefault("ml_predict", []).append(t3 - t2)
+                stages.setdefault("total", []).append(t3 - t0)
+                verdicts["ml" if hit else "normal"] += 1
+            except Exception:
+                verdicts["error"] += 1
+    elapsed = (ns() - t_start) * 1e-9
+    rss1, state1 = _rss_kib(), detection._ip_stats.stats()
+    traced_blocks = _replay_traced(reqs, clock, repeat, span, stages)
+
+    n = len(reqs) * repeat
+    return {
+        "requests" : n,
+        "seconds"  : round(elapsed, 3),
+        "rps"      : round(n / elapsed, 1) if elapsed else 0.0,
+        "stages_us": {st: {f"p{p:g}": round(float(np.percentile(v, p)) / 1e3, 1) for p in PERCENTILES}
+                      for st, v in sorted(stages.items())},
+        "verdicts" : verdicts,
+        "traced_rule_blocks": traced_blocks,
+        "memory"   : {
+            "rss_kib_delta"  : rss1 - rss0,
+            "rate_tracked"   : state1["rate"]["tracked"] - state0["rate"]["tracked"],
+            "behavior_events": state1["behavior"]["events"] - state0["behavior"]["events"],
+        },
+    }
+
+
+def _replay_traced(reqs: List[dict], clock: ReplayClock, repeat: int, span: float,
+                   stages: Dict[str, List[int]]) -> int:
+    """판정 기록 경로를 깨끗한 IP 상태로 다시 재생해 단계별 시간을 stages 에 추가. 룰 차단 수 반환."""
+    live = detection._ip_stats
+    detection._ip_stats = state_backend.create_backend(
+        "memory", rate_window=detection.WINDOW_SEC, rate_capacity=detection.MAX_IP_TRACK)
+    ns = time.perf_counter_ns
+    blocked = 0
+    try:
+        for k in range(repeat):
+            shift = k * span
+            for data in reqs:
+                if shift:
+                    data = dict(data, timestamp=float(data["timestamp"]) + shift)
+                clock.now = float(data["timestamp"])
+                try:
+                    req = ParsedRequest(data)
+                    t0 = ns()
+                    tr = rule_detect_traced(req)
+                    t1 = ns()
+                except Exception:
+                    continue
+                for st, v in tr.timings_ns.items():
+                    stages.setdefault(st, []).append(v)
+                stages.setdefault("rule_detect_traced", []).append(t1 - t0)
+                blocked += tr.blocked
+    finally:
+        detection._ip_stats = live
+    return blocked
+
+
+# ───────────── 기준 비교 ─────────────
+def compare(result: dict, base: dict, tol: float) -> List[str]:
+    """기준보다 나빠진 항목 목록 (비어 있으면 통과)."""
+    bad = []
+    if result["traced_rule_blocks"] != result["verdicts"]["rule"]:
+        bad.append(f"rule_detect_traced blocks {result['traced_rule_blocks']} != rule_detect {result['verdicts']['rule']}")
+    if result["rps"] < base["rps"] * (1 - tol):
+        bad.append(f"rps {result['rps']} < {base['rps']} × {1 - tol:.2f} = {base['rps'] * (1 - tol):.1f}")
+    for st, cur in result["stages_us"].items():
+        ref = base.get("stages_us", {}).get(st)
+        if ref and cur["p99"] > ref["p99"] * (1 + tol) and cur["p99"] - ref["p99"] > P99_SLACK_US:
+            bad.append(f"{st} p99 {cur['p99']}µs > {ref['p99']}µs × {1 + tol:.2f}")
+    if base.get("requests") == result["requests"] and base.get("verdicts") != result["verdicts"]:
+        bad.append(f"verdicts {result['verdicts']} != baseline {base['verdicts']}")
+    return bad
+
+
+def _print(result: dict):
+    print(f"requests {result['requests']}  {result['seconds']} s  → {result['rps']} req/s")
+    print(f"{'stage':<20}{'p50 µs':>10}{'p99 µs':>10}{'p999 µs':>10}")
+    for st, q in result["stages_us"].items():
+        print(f"{st:<20}{q['p50']:>10}{q['p99']:>10}{q['p99.9']:>10}")
+    print("verdicts", result["verdicts"], " traced rule blocks", result["traced_rule_blocks"])
+    print("memory  ", result["memory"])
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="탐지 파이프라인 재생 벤치마크")
+    ap.add_argument("input", nargs="?", default=DEFAULT_INPUT, help="traffic_log.csv 또는 JSONL")
+    ap.add_argument("--repeat", type=int, default=1, help="입력을 몇 번 이어서 재생할지")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="허용 악화 비율 (0.2 = 20%%)")
+    args = ap.parse_args(argv)
+
+    reqs = load_requests(args.input)
+    if not reqs:
+        print("입력이 비어 있음")
+        return 1
+    clock = ReplayClock()
+    detection.clock = ml_detection.clock = clock
+
+    # 예열: 모델 / 정규식 / 캐시 첫 호출 비용을 측정에서 제외 (상태는 별도 IP 로)
+    for data in reqs[:50]:
+        warm = dict(data, ip="198.51.100.1")
+        clock.now = float(warm["timestamp"])
+        if not detection.rule_detect(warm):
+            row = ml_features(warm)
+            if row is not None:
+                ml_predict_rows([row])
+
+    result = replay(reqs, clock, args.repeat)
+    _print(result)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"기준 저장: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"기준 파일 없음 ({args.baseline}). --save-baseline 으로 저장")
+        return 1
+    with open(args.baseline, encoding="utf-8") as f:
+        bad = compare(result, json.load(f), args.tolerance)
+    for line in bad:
+        print("REGRESSION", line)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
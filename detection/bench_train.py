@@ -0,0 +1,110 @@
+# bench_train.py
+"""
+학습 파이프라인 규모 벤치마크 (train_pipeline.py 를 행 수별로 실행해 시간 / 최대 메모리 측정)
+──────────────────────────────────────────────
+  - gernerate_traffic.py 의 값 풀로 합성 로그 CSV 를 만듦 (NumPy 로 청크 단위 생성, 한 번 만든 파일은 재사용)
+      정상 IP ~ 행 수 / 200 개 (Zipf 분포), 공격 IP 는 짧은 시간에 몰아서 요청 (IP 당 이벤트 상한까지 도달)
+      경로는 기본 경로 + /product/<id> 로 고유 경로 수가 행 수에 따라 늘어남
+  - 행 수마다 새 프로세스로 train_pipeline.main 을 실행하고 os.wait4 로 그 프로세스의 최대 RSS 를 읽음
+      cold : 특징 계산 + 학습 + 번들 저장
+      warm : 같은 입력으로 다시 실행 (특징 캐시 memmap 적재 + 학습)
+
+사용법
+  python bench_train.py [--rows 1000000 10000000 50000000] [--data-dir /tmp/bench_train] [--keep]
+"""
+
+from __future__ import annotations
+import argparse, json, os, shutil, subprocess, sys, time
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
+GEN_CHUNK  = 1_000_000
+DAY        = 86_400.0
+T0         = 1_754_300_000.0
+
+
+# ───────────── 합성 로그 ─────────────
+def synth_csv(path: str, rows: int, seed: int = 0):
+    import gernerate_traffic as g
+    rng = np.random.default_rng(seed)
+    pick = lambda pool, k: np.asarray(pool, dtype=object)[rng.integers(0, len(pool), k)]
+    n_ip = max(10, rows // 200)
+    attack = [p for ps in g.attack_paths.values() for p in ps]
+    tmp = path + ".tmp"
+    for a in range(0, rows, GEN_CHUNK):
+        k = min(GEN_CHUNK, rows - a)
+        bad = rng.random(k) < 0.05
+        ip = np.array([f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+                       for i in np.minimum(rng.zipf(1.3, k), n_ip)], dtype=object)
+        ts = T0 + (a + np.arange(k)) * (DAY / rows) + rng.normal(0, 0.5, k)
+        # 공격 IP: 청크마다 몇 초 안에 몰아서
+        ip[bad] = pick(g.abnormal_ips, bad.sum())
+        ts[bad] = T0 + (a + k / 2) * (DAY / rows) + rng.uniform(0, 5, bad.sum())
+        path_ = pick(g.normal_paths, k)
+        prod = rng.random(k) < 0.3
+        path_[prod] = ["/product/%d" % i for i in rng.integers(0, max(100, rows // 100), prod.sum())]
+        path_[bad] = pick(attack, bad.sum())
+        df = pd.DataFrame({
+            "ip"           : ip,
+            "timestamp"    : np.round(ts, 6),
+            "method"       : np.where(bad, pick(g.abnormal_methods, k), pick(g.normal_method_type, k)),
+            "path"         : path_,
+            "ua"           : np.where(bad, pick(g.abnormal_uas, k), pick(g.normal_ua_list, k)),
+            "referer"      : np.where(bad, pick(g.abnormal_referers, k), pick(g.normal_referers, k)),
+            "authorization": np.where(bad, pick(g.abnormal_authorizations, k), pick(g.normal_authorizations, k)),
+            "accept_type"  : np.where(bad, pick(g.abnormal_accepts, k), pick(g.normal_accept_type, k)),
+            "cookie_count" : np.where(bad, 0, rng.integers(0, 10, k)),
+        })
+        df.to_csv(tmp, mode="w" if a == 0 else "a", header=a == 0, index=False)
+    os.replace(tmp, path)
+
+
+# ───────────── 측정 ─────────────
+def run(args: list, report: str) -> dict:
+    """train_pipeline 을 새 프로세스로 실행 → 그 프로세스의 보고서 + 벽시계 시간 / 최대 RSS."""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "train_pipeline.py"), *args,
+                             "--report", report], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    if status != 0:
+        raise RuntimeError(f"train_pipeline {args} exited with {status}")
+    with open(report, encoding="utf-8") as f:
+        out = json.load(f)
+    out.update(wall_sec=round(wall, 1), max_rss_mb=round(usage.ru_maxrss / 1024))
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="학습 파이프라인 규모 벤치마크")
+    ap.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000])
+    ap.add_argument("--data-dir", default="/tmp/bench_train")
+    ap.add_argument("--keep", action="store_true", help="특징 캐시 / 번들을 지우지 않음")
+    args = ap.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    print(f"{'rows':>12} {'run':<5} {'wall s':>8} {'features s':>11} {'train s':>8} "
+          f"{'peak RSS MB':>12} {'X MB':>8}")
+    for rows in args.rows:
+        src = os.path.join(args.data_dir, f"traffic_{rows}.csv")
+        if not os.path.exists(src):
+            t0 = time.perf_counter()
+            synth_csv(src, rows)
+            print(f"# {src} 생성 {time.perf_counter() - t0:.0f}s, {os.path.getsize(src) / 2**20:,.0f} MB")
+        work = os.path.join(args.data_dir, f"run_{rows}")
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        common = [src, "--cache-dir", os.path.join(work, "cache"), "--bundle-root", os.path.join(work, "models")]
+        for name in ("cold", "warm"):
+            r = run(common, os.path.join(work, "report.json"))
+            print(f"{rows:>12,} {name:<5} {r['wall_sec']:>8.1f} {r['features_sec']:>11.1f} "
+                  f"{r['train_sec']:>8.1f} {r['max_rss_mb']:>12,} {rows * 13 * 8 / 2**20:>8,.0f}")
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,29 +9,45 @@ Stages
   3.   GeoIP 국가 차단
   4.   TLS Fingerprint (JA4 > JA3) 블랙리스트·불일치
   5.   GraphQL Depth / Complexity / Introspection
+         (쿼리 해시 → 판정 LRU 캐시, 괄호 깊이 사전 검사, 한도 초과 즉시 중단하는 반복형 분석)
   6.   추가 휴리스틱 점수 (쿠키·리퍼러·언어/국가 등)
+  1 / 4 / 6 은 IP 상태를 보지 않으므로 요청 지문(헤더 이름·UA·TLS FP·메서드·국가 등) → 결과 LRU/TTL 캐시
 최종   누적 점수 ≥ THRESHOLD  or  즉시 차단 룰 중 하나라도 True ⇒ anomaly
+각 단계는 요청당 한 번 파싱한 parsed_request.ParsedRequest 를 읽음 (dict 로 호출하면 여기서 변환)
+
+실행 순서 (STAGES 에 비용 추정 / 즉시 차단 여부 / 부수 효과 여부를 선언)
+  0 → 2 고정 (IP 카운터는 0 을 통과한 요청만 센다), 3 / 4 / 5 는 표본 측정한 '차단 1 건당 비용' 순,
+  1 / 6 점수는 즉시 차단 판정이 모두 끝난 뒤, 최종 점수 비교는 마지막. 판정 기록(trace)은 0 → 6 선언 순서
 """
 
 from __future__ import annotations
-import time, json, re
+import hashlib, os, re, threading, time
 from collections import OrderedDict
-from pathlib import Path
-from typing import Dict, Optional
+from itertools import accumulate
+from typing import Dict, Iterable, Optional
+
+import geoip
+import metrics
+import ruletrace
+import state_backend
+from parsed_request import BROWSER_KEY_TOKENS, ParsedRequest, as_parsed
+from rest_router import RestRouter
 
 # ───────────── 설정 상수 ─────────────
 # IP Rate limit
 WINDOW_SEC          = 60
 IP_THRESHOLD        = 100       # 분당 허용 수
-MAX_IP_TRACK        = 500_000   # 딕셔너리 상한
+MAX_IP_TRACK        = 500_000   # 추적 IP 상한
 
 # 본문/헤더
 MAX_BODY_BYTES      = 64 * 1024    # 64 KB
 MIN_HEADER_COUNT    = 6
 SUSPECT_PATH_TOKENS = ("/wp-", "/phpmyadmin", "/.env", "/etc/passwd", "/manager/html")
 
-# GeoIP
-GEOIP_DB_PATH       = "data/GeoLite2-Country.mmdb"
+# REST 스키마 (OpenAPI)
+OPENAPI_PATH        = "openapi.json"
+
+# GeoIP (DB 경로/조회 모드/캐시 크기는 geoip.py)
 BLOCKED_COUNTRIES   = {"RU", "CN"}
 
 # TLS FP 블랙리스트 (JA3/JA4)
@@ -57,6 +73,19 @@ GRAPHQL_DEPTH_LIMIT      = 8
 GRAPHQL_COMPLEXITY_LIMIT = 1000
 GRAPHQL_FIELD_WEIGHT_DEF = 5
 GRAPHQL_FIELD_WEIGHT_OVR = {"id": 1, "name": 2}
+GRAPHQL_NODE_LIMIT       = 10_000   # 분석 중 방문할 선택 노드 상한 (fragment 펼침 폭주 방지)
+GRAPHQL_PRESCAN_DEPTH    = 64       # 파싱 전 { / [ 중첩 상한 (넘으면 파싱 없이 차단)
+GRAPHQL_CACHE_SIZE       = int(os.getenv("GRAPHQL_CACHE_SIZE", "16384"))   # 쿼리 해시 → 판정 캐시 크기
+
+# 상태 없는 점수 (브라우저 프로파일 + TLS + 추가 점수) 지문 캐시
+SCORE_CACHE_SIZE = int(os.getenv("SCORE_CACHE_SIZE", "65536"))
+SCORE_CACHE_TTL  = float(os.getenv("SCORE_CACHE_TTL", "300"))   # 초 (룰 / GeoIP 변경이 늦게 반영되는 한도)
+
+# 즉시 차단 단계 순서 (geo / tls / graphql 을 표본 측정한 '차단 1 건당 비용' 순으로 실행)
+RULE_ADAPTIVE_ORDER = os.getenv("RULE_ADAPTIVE_ORDER", "1") != "0"   # 0 이면 선언 순서 고정
+RULE_ORDER_EVERY    = int(os.getenv("RULE_ORDER_EVERY", "64"))      # 표본 몇 건마다 순서 재계산
+RULE_ORDER_DECAY    = 0.05      # 비용 / 차단율 EWMA 가중치 (표본 1 건)
+RULE_ORDER_MIN_RATE = 1e-3      # 차단율 하한 (한 번도 막지 않은 단계끼리는 비용 순)
 
 # 점수 가중치
 SCORES = {
@@ -66,6 +95,7 @@ SCORES = {
     "ua_tls_mismatch":         55,
     "method_path_mismatch":    65,
     # Medium
+    "no_user_agent":           30,
     "missing_sec_fetch":       30,
     "too_few_headers":         28,
     "no_cookie_same_site":     20,
@@ -84,210 +114,558 @@ SCORES = {
 FINAL_SCORE_THRESHOLD = 77
 MAX_NEGATIVE_BONUS = 20   # 음수 가중치 한계
 
+# 브라우저 종류 판별용 UA 토큰(BROWSER_KEY_TOKENS)은 parsed_request.py 에서 요청 파싱 시 판별
+
 # ───────────── 내부 상태 ─────────────
-_ip_stats: "OrderedDict[str, Dict[str, float|int]]" = OrderedDict()
-_geo_reader = None
-REST_TABLE: list[tuple[re.Pattern,set[str]]] = []
+# IP별 슬라이딩 윈도우 카운터 (STATE_BACKEND: 프로세스 내부 / 공유 메모리 / Redis)
+_ip_stats = state_backend.get_backend(rate_window=WINDOW_SEC, rate_capacity=MAX_IP_TRACK)
+REST_ROUTER = RestRouter()
+# 요청에 timestamp 가 없을 때 쓰는 현재 시각 (재생 벤치마크에서 교체)
+clock = time.time
 
 # ───────────── 유틸 ─────────────
-def _headers_lower(h: dict) -> dict:
-    return {k.lower(): v for k, v in h.items()}
-
-def _trim_ip_stats():
-    while len(_ip_stats) > MAX_IP_TRACK:
-        _ip_stats.popitem(last=False)
-
-def _load_geo() :
-    global _geo_reader
-    if _geo_reader is None:
-        import geoip2.database
-        _geo_reader = geoip2.database.Reader(GEOIP_DB_PATH)
-    return _geo_reader
-
-def _country(ip: str) -> Optional[str]:
-    try:
-        return _load_geo().country(ip).country.iso_code
-    except Exception:
-        return None
-
-def _load_openapi(path="openapi.json"):
-    if REST_TABLE: return
-    try:
-        spec = json.loads(Path(path).read_text())
-    except FileNotFoundError:
-        return
-    param = re.compile(r'{[^/]+}')
-    for p, item in spec["paths"].items():
-        REST_TABLE.append((re.compile('^'+param.sub('[^/]+', p)+'$'),
-                           {m.lower() for m in item}))
+class _LruCache:
+    """
+    키 → 판정 LRU (스레드 안전). size 0 이면 저장하지 않음, ttl > 0 이면 ttl 초 지난 항목은 없는 것으로 봄.
+    조회 결과는 metrics.RULE_CACHE{cache=name} 와 stats() 의 hits / misses 로 집계.
+    """
+    __slots__ = ("name", "size", "ttl", "hits", "misses", "_d", "_lock")
+
+    def __init__(self, name: str, size: int, ttl: float = 0.0):
+        self.name, self.size, self.ttl = name, size, ttl
+        self.hits = self.misses = 0
+        self._d: "OrderedDict[object, tuple]" = OrderedDict()   # 키 → (만료 시각, 값)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            ent = self._d.get(key)
+            if ent is not None and self.ttl and ent[0] < time.monotonic():
+                del self._d[key]
+                ent = None
+            if ent is None:
+                self.misses += 1
+            else:
+                self._d.move_to_end(key)
+                self.hits += 1
+        metrics.RULE_CACHE.inc(self.name, "miss" if ent is None else "hit")
+        return None if ent is None else ent[1]
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        exp = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._d[key] = (exp, value)
+            self._d.move_to_end(key)
+            if len(self._d) > self.size:
+                self._d.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._d.clear()
+
+    def stats(self) -> dict:
+        n = self.hits + self.misses
+        return {"size": self.size, "entries": len(self._d), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / n, 4) if n else 0.0}
+
+# 상태 없는 점수 지문 캐시 (→ _stateless_cached)
+_score_cache = _LruCache("score", SCORE_CACHE_SIZE, SCORE_CACHE_TTL)
+
+def _pts(key: str, hits: Optional[list]) -> int:
+    # SCORES[key] 반환. 판정 기록 중이면(hits) 어떤 키가 점수를 더했는지 남김
+    if hits is not None:
+        hits.append(key)
+    return SCORES[key]
+
+# ───────────── 룰 컴파일 (다중 패턴 매처) ─────────────
+class _TokenMatcher:
+    """
+    여러 부분 문자열 목록을 트라이 형태의 정규식 하나로 컴파일.
+    scan() 한 번으로 매칭된 모든 카테고리를 비트마스크로 반환한다.
+    각 노드의 분기는 첫 글자가 모두 다르므로 위치당 비용은 목록 길이가 아닌
+    알파벳 크기에 묶인다.
+    """
+    def __init__(self, groups: Dict[int, Iterable[str]]):
+        trie: dict = {}
+        for mask, tokens in groups.items():
+            for tok in tokens:
+                if not tok:
+                    continue
+                node = trie
+                for ch in tok:
+                    node = node.setdefault(ch, {})
+                node[""] = node.get("", 0) | mask
+        # 위치마다 가장 긴 토큰만 매칭되므로, 그 토큰의 접두사인 토큰들의 마스크를 합쳐 둔다
+        self._masks: Dict[str, int] = {}
+        self._collect(trie, "", 0)
+        body = self._build(trie)
+        self._rex = re.compile("(?=(" + body + "))") if body else None
+
+    def _collect(self, node: dict, prefix: str, acc: int):
+        acc |= node.get("", 0)
+        if "" in node:
+            self._masks[prefix] = acc
+        for ch, sub in node.items():
+            if ch:
+                self._collect(sub, prefix + ch, acc)
+
+    def _build(self, node: dict) -> str:
+        alts = [re.escape(ch) + self._build(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    def scan(self, text: str) -> int:
+        if self._rex is None:
+            return 0
+        m = 0
+        masks = self._masks
+        for hit in self._rex.finditer(text):
+            m |= masks[hit.group(1)]
+        return m
+
+# 카테고리 비트
+UA_M_BLACKLIST = 1 << 0
+UA_M_BROWSER   = 1 << 1
+PATH_M_SUSPECT = 1 << 0
+
+_UA_MATCHER: _TokenMatcher
+_PATH_MATCHER: _TokenMatcher
+
+def _compile_rules():
+    """UA/경로 부분 문자열 목록을 매처로 컴파일 (시작 시 1회, 목록 변경 시 재호출)."""
+    global _UA_MATCHER, _PATH_MATCHER
+    _UA_MATCHER   = _TokenMatcher({UA_M_BLACKLIST: UA_BLACKLIST, UA_M_BROWSER: BROWSER_UA_TOKENS})
+    _PATH_MATCHER = _TokenMatcher({PATH_M_SUSPECT: SUSPECT_PATH_TOKENS})
+    _score_cache.clear()
+_compile_rules()
+
+def _load_openapi(path=OPENAPI_PATH):
+    if REST_ROUTER: return
+    REST_ROUTER.load(path)
 _load_openapi()
 
+def reload_openapi(path=OPENAPI_PATH) -> bool:
+    """재시작 없이 OpenAPI 스펙 재적재. 실패하면 기존 라우터 유지."""
+    return REST_ROUTER.load(path)
+
 # ───────────── Stage 0: 경량 즉시 차단 ─────────────
-def stage_light(h, method, path, body_len) -> bool:
-    if body_len > MAX_BODY_BYTES:
+def stage_light(p: ParsedRequest) -> bool:
+    if p.body_len > MAX_BODY_BYTES:
         return True
-    if any(tok in path.lower() for tok in SUSPECT_PATH_TOKENS):
+    if _PATH_MATCHER.scan(p.path.lower()) & PATH_M_SUSPECT:
         return True
     # REST 스키마 화이트리스트
-    if REST_TABLE:
-        for rex, methods in REST_TABLE:
-            if rex.match(path):
-                if method not in methods:
-                    return True         # 메서드 불일치
-                break
-        else:
+    if REST_ROUTER:
+        methods = REST_ROUTER.match_segments(p.path_segments)
+        if methods is None:
             return True                 # 정의되지 않은 경로
+        if p.method_lower not in methods:
+            return True                 # 메서드 불일치
     return False
 
 # ───────────── Stage 1: 브라우저 헤더/UA ─────────────
-def score_browser(h, score):
-    ua = h.get("user-agent","").lower()
+def score_browser(p: ParsedRequest, score, hits=None):
+    h, ua = p.headers, p.ua
     if not ua:
-        return score + 30
-    if any(b in ua for b in UA_BLACKLIST):
-        return score + SCORES["ua_blacklist"]
-    is_browser = any(tok in ua for tok in BROWSER_UA_TOKENS)
+        return score + _pts("no_user_agent", hits)
+    m = _UA_MATCHER.scan(ua)
+    if m & UA_M_BLACKLIST:
+        return score + _pts("ua_blacklist", hits)
+    is_browser = bool(m & UA_M_BROWSER)
     if is_browser and "accept" not in h:
-        score += SCORES["no_accept_browser"]
+        score += _pts("no_accept_browser", hits)
 
-    # 브라우저별 필수 헤더 검사
-    key = ("chrome" if ("chrome" in ua or "crios" in ua) else
-           "edge" if "edg" in ua else
-           "safari" if ("safari" in ua and "chrome" not in ua) else
-           "firefox" if "firefox" in ua else None)
+    # 브라우저별 필수 헤더 검사 (BROWSER_KEY_TOKENS 순서가 우선순위)
+    key = p.browser
     if key:
         must = BROWSER_HEADER_PROFILE[key]["must"]
         missing = must - h.keys()
         if missing:
-            score += SCORES["missing_sec_fetch"]
+            score += _pts("missing_sec_fetch", hits)
         else:
-            score += SCORES["has_sec_fetch_all"]
+            score += _pts("has_sec_fetch_all", hits)
 
     # Client‑Hints
     if key in ("chrome","edge"):
         if "sec-ch-ua" not in h:
-            score += SCORES["client_hints_missing"]
+            score += _pts("client_hints_missing", hits)
         else:
-            score += SCORES["has_client_hints"]
+            score += _pts("has_client_hints", hits)
     return score
 
 # ───────────── Stage 2: IP 빈도 ─────────────
 def stage_ip(ip, now) -> bool:
     if not ip: return False
-    st = _ip_stats.get(ip)
-    if st is None or now - st["start"] > WINDOW_SEC:
-        _ip_stats[ip] = {"count":1,"start":now}
-    else:
-        st["count"] += 1
-    _ip_stats.move_to_end(ip)
-    if len(_ip_stats) > MAX_IP_TRACK:
-        _trim_ip_stats()
-    return _ip_stats[ip]["count"] > IP_THRESHOLD
+    # 최근 WINDOW_SEC 초 추정 요청 수 (두 버킷 보간)
+    return _ip_stats.hit_rate(ip, now, WINDOW_SEC) > IP_THRESHOLD
 
 # ───────────── Stage 3: GeoIP ─────────────
-def stage_geo(ip) -> bool:
-    c = _country(ip)
-    return c in BLOCKED_COUNTRIES if c else False
+def stage_geo(country: Optional[str]) -> bool:
+    return country in BLOCKED_COUNTRIES if country else False
 
 # ───────────── Stage 4: TLS FP ─────────────
-def stage_tls(h, score):
+def stage_tls(p: ParsedRequest, score, hits=None):
+    h = p.headers
     fp = (h.get("x-ja4") or h.get("cloudfront-viewer-ja4-fingerprint") or
           h.get("x-ja3") or h.get("cloudfront-viewer-ja3-fingerprint"))
     if not fp:
         return False, score
     if fp in SUSPECT_FP:
-        return True, score + SCORES["tls_fp_blacklist"]
-    ua = h.get("user-agent","").lower()
-    if "mozilla" in ua and fp.startswith("cd08e3"):
-        score += SCORES["ua_tls_mismatch"]
+        return True, score + _pts("tls_fp_blacklist", hits)
+    if "mozilla" in p.ua and fp.startswith("cd08e3"):
+        score += _pts("ua_tls_mismatch", hits)
     return False, score
 
 # ───────────── Stage 5: GraphQL ─────────────
-def _gql_depth_score(node, depth=1):
-    d, s = depth, 0
-    sel = getattr(node,"selection_set",None)
-    if not sel: return d, s
-    for child in sel.selections:
-        cd, cs = _gql_depth_score(child, depth+1)
-        d = max(d, cd)
-        s += GRAPHQL_FIELD_WEIGHT_OVR.get(child.name.value, GRAPHQL_FIELD_WEIGHT_DEF) + cs
-    return d, s
+# 같은 쿼리는 파싱 없이 캐시된 판정 사용 (공격 쿼리는 대개 같은 문서를 반복 전송)
+_gql_cache = _LruCache("graphql", GRAPHQL_CACHE_SIZE)
+
+# 문자열 / 주석 / 괄호 아닌 문자를 지우면 { } [ ] 만 남음 (닫히지 않은 " 는 남지만 깊이에 영향 없음)
+_GQL_NON_BRACKET = re.compile(r'''"""(?:\\"""|[^"]|"(?!""))*"""|"(?:[^"\\\n\r]|\\.)*"|#[^\n\r]*|[^{}\[\]"#]+''')
+_GQL_STEP = {"{": 1, "[": 1, "}": -1, "]": -1, '"': 0}
+
+def _gql_prescan(query: str) -> bool:
+    """파싱 전 어휘 검사: 선택 집합 / 리스트 괄호 중첩이 GRAPHQL_PRESCAN_DEPTH 를 넘으면 True."""
+    if query.count("{") + query.count("[") <= GRAPHQL_PRESCAN_DEPTH:
+        return False
+    brackets = _GQL_NON_BRACKET.sub("", query)
+    # 괄호가 모두 주석 / 문자열 안에 있으면 brackets 가 비어 있음 → 깊이 0
+    return max(accumulate(map(_GQL_STEP.__getitem__, brackets)), default=0) > GRAPHQL_PRESCAN_DEPTH
+
+def _gql_over_limit(doc) -> bool:
+    """
+    문서 AST 를 명시적 스택으로 순회해 깊이 / 복잡도 한도 초과 여부 판정. 넘는 순간 중단.
+    연산 노드가 깊이 1, 필드는 한 단계씩 깊어짐. fragment 는 펼쳐서 같은 깊이로 셈
+    (정의되지 않았거나 순환하는 fragment 는 잘못된 문서로 보고 차단)
+    """
+    frags = {d.name.value: d for d in doc.definitions if d.kind == "fragment_definition"}
+    comp, budget = 0, GRAPHQL_NODE_LIMIT
+    for op in doc.definitions:
+        if op.kind != "operation_definition":
+            continue
+        stack = [(op.selection_set, 1, ())]
+        while stack:
+            sel, depth, spread = stack.pop()
+            for child in sel.selections:
+                budget -= 1
+                if budget < 0:
+                    return True
+                kind = child.kind
+                if kind == "field":
+                    if depth >= GRAPHQL_DEPTH_LIMIT:
+                        return True
+                    comp += GRAPHQL_FIELD_WEIGHT_OVR.get(child.name.value, GRAPHQL_FIELD_WEIGHT_DEF)
+                    if comp > GRAPHQL_COMPLEXITY_LIMIT:
+                        return True
+                    if child.selection_set:
+                        stack.append((child.selection_set, depth + 1, spread))
+                elif kind == "inline_fragment":
+                    stack.append((child.selection_set, depth, spread))
+                else:                                   # fragment_spread
+                    name = child.name.value
+                    if name in spread or name not in frags:
+                        return True
+                    stack.append((frags[name].selection_set, depth, spread + (name,)))
+    return False
 
-def stage_graphql(query:str) -> bool:
-    if not query: return False
-    if len(query) > MAX_BODY_BYTES:
+def _gql_verdict(query: str) -> bool:
+    if "__schema" in query or "__type" in query:
+        return True
+    if _gql_prescan(query):
         return True
     try:
         from graphql import parse
-        ast = parse(query)
-    except Exception:
+        doc = parse(query, no_location=True)
+    except Exception:                                   # 문법 오류 / 파서 재귀 한도 포함
         return True
-    depth, comp = _gql_depth_score(ast)
-    if "__schema" in query or "__type" in query:
+    return _gql_over_limit(doc)
+
+def stage_graphql(query:str) -> bool:
+    if not query: return False
+    if len(query) > MAX_BODY_BYTES:
         return True
-    return depth > GRAPHQL_DEPTH_LIMIT or comp > GRAPHQL_COMPLEXITY_LIMIT
+    key = hashlib.blake2b(query.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    hit = _gql_cache.get(key)
+    if hit is not None:
+        return hit
+    hit = _gql_verdict(query)
+    _gql_cache.put(key, hit)
+    return hit
 
 # ───────────── Stage 6: 추가 점수 ─────────────
-def score_extra(h, score, country, same_site, method, body_len):
-    if method in ("post","put","patch") and body_len>0 and "content-type" not in h:
-        score += SCORES["no_content_type"]
-    if same_site:
+def score_extra(p: ParsedRequest, score, country, hits=None):
+    h = p.headers
+    if p.method_lower in ("post","put","patch") and p.body_len>0 and "content-type" not in h:
+        score += _pts("no_content_type", hits)
+    if p.same_site:
         if "cookie" in h:
-            score += SCORES["has_cookie_same_site"]
+            score += _pts("has_cookie_same_site", hits)
         else:
-            score += SCORES["no_cookie_same_site"]
+            score += _pts("no_cookie_same_site", hits)
         if "referer" not in h:
-            score += SCORES["no_referer_same_site"]
+            score += _pts("no_referer_same_site", hits)
     if country and "accept-language" in h:
         al = h["accept-language"].lower()
         if (country=="KR" and "ko" not in al) or (country=="JP" and "ja" not in al) or (country=="US" and "en" not in al):
-            score += SCORES["lang_geo_mismatch"]
+            score += _pts("lang_geo_mismatch", hits)
     if len(h) < MIN_HEADER_COUNT:
-        score += SCORES["too_few_headers"]
+        score += _pts("too_few_headers", hits)
     return score
 
-# ───────────── detect_anomaly ─────────────
-def rule_detect(data: dict) -> bool:
-    now       = float(data.get("timestamp", time.time()))
-    ip        = data.get("ip","")
-    h_raw     = data.get("headers") or {}
-    h         = _headers_lower(h_raw)
-    path      = data.get("path","/")
-    method    = data.get("method","GET").lower()
-    gql_query = data.get("graphql")
-    same_site = bool(data.get("same_site", False))
-    body_len  = int(data.get("body_length", h.get("content-length",0) or 0))
-
-    # 0) 경량 즉시 차단
-    if stage_light(h, method, path, body_len):
-        return True
+def _extra_clamped(p: ParsedRequest, score, cn, hits=None):
+    """score_extra + 음수 가중치 한계 → (점수, score_extra 원점수, 음수 가중치 합)"""
+    raw = score_extra(p, score, cn, hits)
+    neg = min(0, raw - score)
+    return (score - MAX_NEGATIVE_BONUS if neg < -MAX_NEGATIVE_BONUS else raw), raw, neg
+
+# ───────────── 상태 없는 점수 캐시 ─────────────
+def _stateless_score(p: ParsedRequest, cn) -> int:
+    """1) 브라우저 프로파일 + 4) TLS 점수 + 6) 추가 점수. TLS 차단 여부는 stage_tls 단계가 먼저 판정."""
+    score = stage_tls(p, score_browser(p, 0))[1]
+    return _extra_clamped(p, score, cn)[0]
+
+def _stateless_cached(p: ParsedRequest, cn):
+    """
+    _stateless_score 를 요청 지문으로 캐시. 지문은 세 단계가 읽는 값만 모음:
+    헤더 이름 전체(존재 여부 / 개수), UA, TLS 지문, Accept-Language, 메서드, 국가, same_site, 본문 유무.
+    키는 지문 튜플 그대로 (hash() 값만 키로 쓰면 충돌 시 다른 요청의 점수를 돌려줌). 값은 최종 점수(int)
+    """
+    h = p.headers
+    g = h.get
+    key = (p.method_lower, cn, p.same_site, p.body_len > 0, p.ua, g("x-ja4"),
+           g("cloudfront-viewer-ja4-fingerprint"), g("x-ja3"),
+           g("cloudfront-viewer-ja3-fingerprint"), g("accept-language"), *h)
+    try:
+        ent = _score_cache.get(key)
+    except TypeError:                                   # 헤더 값이 문자열이 아님 → 캐시 없이
+        return _stateless_score(p, cn)
+    if ent is None:
+        ent = _stateless_score(p, cn)
+        _score_cache.put(key, ent)
+    return ent
+
+def cache_stats() -> dict:
+    """판정 캐시별 크기 / 항목 수 / 적중률 (이 프로세스 기준)."""
+    return {"score": _score_cache.stats(), "graphql": _gql_cache.stats()}
+
+# ───────────── 단계 파이프라인 ─────────────
+class _Ctx:
+    """요청 하나를 처리하는 동안 단계끼리 주고받는 값. score 는 점수 단계들이 더해 가는 누적 점수."""
+    __slots__ = ("p", "now", "tr", "hits", "cn", "score")
+
+    def __init__(self, p: ParsedRequest, now: float, tr):
+        self.p, self.now, self.tr = p, now, tr
+        self.hits = tr.hits if tr is not None else None
+        self.cn, self.score = _UNSET, 0
+
+    def country(self) -> Optional[str]:
+        # 국가는 요청당 1회만 조회 (geo / 추가 점수 중 먼저 쓰는 단계에서)
+        if self.cn is _UNSET:
+            self.cn = geoip.country(self.p.ip)
+        return self.cn
+
+_UNSET = object()
+
+def _run_light(c: _Ctx) -> bool:
+    return stage_light(c.p)
+
+def _run_browser(c: _Ctx) -> bool:
+    c.score = score_browser(c.p, c.score, c.hits)
+    if c.tr is not None:
+        c.tr.score = c.score
+    return False
 
-    # 1) 브라우저 프로파일 점수
-    score = score_browser(h, 0)
+def _run_ip(c: _Ctx) -> bool:
+    return stage_ip(c.p.ip, c.now)
 
-    # 2) IP 빈도
-    if stage_ip(ip, now):
-        return True
+def _run_geo(c: _Ctx) -> bool:
+    return stage_geo(c.country())
 
-    # 3) GeoIP
-    if stage_geo(ip):
-        return True
-    cn = _country(ip)
+def _run_tls(c: _Ctx) -> bool:
+    # 점수는 더하기만 하므로 브라우저 점수보다 먼저 실행돼도 합계가 같음
+    block, c.score = stage_tls(c.p, c.score, c.hits)
+    if c.tr is not None:
+        c.tr.score = c.score
+    return block
 
-    # 4) TLS FP
-    tls_block, score = stage_tls(h, score)
-    if tls_block:
-        return True
+def _run_graphql(c: _Ctx) -> bool:
+    return bool(c.p.graphql) and stage_graphql(c.p.graphql)
 
-    # 5) GraphQL
-    if gql_query and stage_graphql(gql_query):
-        return True
+def _run_extra(c: _Ctx) -> bool:
+    c.score, raw, neg = _extra_clamped(c.p, c.score, c.country(), c.hits)
+    if c.tr is not None:
+        c.tr.score, c.tr.neg_bonus, c.tr.clamp = c.score, neg, c.score - raw
+    return False
+
+def _run_score_cache(c: _Ctx) -> bool:
+    # 브라우저 + TLS 점수 + 추가 점수를 지문 캐시에서 한꺼번에 (stage_tls 의 점수는 여기서 다시 더하지 않음)
+    c.score = _stateless_cached(c.p, c.country())
+    return False
+
+def _run_final(c: _Ctx) -> bool:
+    return c.score >= FINAL_SCORE_THRESHOLD
+
+class _Stage:
+    """
+    선언된 단계. terminal: 차단으로 판정을 끝낼 수 있음, pure: IP 상태 등 부수 효과 없음 (순서를 바꿔도 됨).
+    cost_ns / block_rate 는 추정 초깃값에서 시작해 표본 요청의 측정값(EWMA)으로 갱신.
+    """
+    __slots__ = ("name", "run", "terminal", "pure", "cost_ns", "block_rate")
+
+    def __init__(self, name: str, run, cost_ns: float, terminal: bool, pure: bool):
+        self.name, self.run, self.terminal, self.pure = name, run, terminal, pure
+        self.cost_ns, self.block_rate = float(cost_ns), 0.01
+
+    def cost_per_block(self) -> float:
+        return self.cost_ns / max(self.block_rate, RULE_ORDER_MIN_RATE)
+
+# 선언 순서 = 판정 기록(trace)에서 실행하는 순서. stage_light 가 통과시킨 요청만 IP 카운터에 들어가도록
+# light → ip 는 맨 앞에 고정, 점수 단계는 즉시 차단 판정이 모두 끝난 뒤에 실행, final_score 는 항상 마지막
+_LIGHT   = _Stage("stage_light",   _run_light,    2_000, terminal=True,  pure=True)
+_BROWSER = _Stage("score_browser", _run_browser,  6_000, terminal=False, pure=True)
+_IP      = _Stage("stage_ip",      _run_ip,       5_000, terminal=True,  pure=False)
+_GEO     = _Stage("stage_geo",     _run_geo,      1_000, terminal=True,  pure=True)
+_TLS     = _Stage("stage_tls",     _run_tls,        500, terminal=True,  pure=True)
+_GRAPHQL = _Stage("stage_graphql", _run_graphql, 20_000, terminal=True,  pure=True)
+_EXTRA   = _Stage("score_extra",   _run_extra,    1_500, terminal=False, pure=True)
+_SCORE   = _Stage("score_cache",   _run_score_cache, 1_000, terminal=False, pure=True)
+_FINAL   = _Stage("final_score",   _run_final,        0, terminal=True,  pure=True)
+STAGES   = (_LIGHT, _BROWSER, _IP, _GEO, _TLS, _GRAPHQL, _EXTRA, _FINAL)
+
+class _StageScheduler:
+    """
+    순서를 바꿔도 되는 즉시 차단 단계(terminal + pure, light → ip 뒤)를 '차단 1 건당 비용'
+    (비용 / 차단율) 오름차순으로 정렬 → 자주 막는 싼 단계가 먼저 실행됨.
+    표본 요청(metrics.sample_stage)에서는 이 단계들을 끝까지 모두 실행해 비용 / 차단 여부를 편향 없이 측정하고
+    RULE_ORDER_EVERY 표본마다 순서를 다시 계산해 참조 교체. 차단 여부는 순서와 무관 (차단 단계 이름만 달라질 수 있음)
+    """
+    __slots__ = ("stages", "order", "plans", "samples", "reorders")
+
+    def __init__(self, stages):
+        self.stages   = tuple(stages)
+        self.samples  = 0
+        self.reorders = 0
+        self._set_order(self.stages)
+
+    def _set_order(self, order):
+        # 실행 계획: [점수 캐시 없음, 점수 캐시 사용]. light → ip → 재정렬 단계 → 점수 → final_score
+        self.order = order
+        self.plans = ((_LIGHT, _IP) + order + (_BROWSER, _EXTRA, _FINAL),
+                      (_LIGHT, _IP) + order + (_SCORE, _FINAL))
+
+    def observe(self, st: _Stage, ns: int, blocked: bool):
+        a = RULE_ORDER_DECAY
+        st.cost_ns    += a * (ns - st.cost_ns)
+        st.block_rate += a * (blocked - st.block_rate)
+
+    def sampled(self):
+        self.samples += 1
+        if RULE_ADAPTIVE_ORDER and self.samples % RULE_ORDER_EVERY == 0:
+            order = tuple(sorted(self.stages, key=_Stage.cost_per_block))
+            if order != self.order:
+                self._set_order(order)
+                self.reorders += 1
+
+    def stats(self) -> dict:
+        return {
+            "adaptive": RULE_ADAPTIVE_ORDER,
+            "order"   : [st.name for st in self.order],
+            "samples" : self.samples,
+            "reorders": self.reorders,
+            "stages"  : {st.name: {"cost_us": round(st.cost_ns / 1e3, 2),
+                                   "block_rate": round(st.block_rate, 4),
+                                   "cost_per_block_us": round(st.cost_per_block() / 1e3, 2)}
+                         for st in self.stages},
+        }
+
+_scheduler = _StageScheduler((_GEO, _TLS, _GRAPHQL))
+
+def stage_stats() -> dict:
+    """즉시 차단 단계의 현재 실행 순서와 측정 비용 / 차단율 (이 프로세스 기준)."""
+    return _scheduler.stats()
 
-    # 6) 추가 점수
-    score_before = score
-    score = score_extra(h, score, cn, same_site, method, body_len)
-    neg = min(0, score - score_before)
-    if neg < -MAX_NEGATIVE_BONUS:
-        score = score_before - MAX_NEGATIVE_BONUS
+# ───────────── detect_anomaly ─────────────
+def _observe_stage(t0: int, stage: str, weight: int, tr) -> int:
+    # t0 부터 지금까지를 stage 시간으로 기록하고, 기록에 쓴 시간을 뺀 다음 단계 시작 시각 반환
+    t1 = time.perf_counter_ns()
+    if weight:
+        metrics.STAGE_SECONDS.observe((t1 - t0) * 1e-9, stage, n=weight)
+    if tr is not None:
+        tr.timings_ns[stage] = t1 - t0
+    return time.perf_counter_ns()
+
+def _blocked(stage: str, tr) -> bool:
+    metrics.RULE_BLOCKS.inc(stage)
+    if tr is not None:
+        tr.blocked, tr.stage = True, stage
+    return True
+
+def rule_detect(data) -> bool:
+    # data: ParsedRequest 또는 요청 본문 dict
+    # RULE_TRACE_SAMPLE 이 켜져 있으면 N 건 중 1 건은 판정 기록을 남기고 훅으로 전달
+    p = as_parsed(data)
+    if ruletrace.TRACE_SAMPLE and ruletrace.sample():
+        tr = rule_detect_traced(p, ruletrace.PROFILE)
+        ruletrace.emit(tr, p.raw)
+        return tr.blocked
+    return _rule_detect(p, None)
+
+def rule_detect_traced(data, profile: str = "") -> "ruletrace.RuleTrace":
+    """rule_detect 와 같은 판정(상태 갱신 포함)을 하고 판정 기록을 반환."""
+    p = as_parsed(data)
+    tr = ruletrace.RuleTrace()
+    tr.threshold = FINAL_SCORE_THRESHOLD
+    if profile:
+        with ruletrace.profiled(profile, tr):
+            _rule_detect(p, tr)
+    else:
+        _rule_detect(p, tr)
+    return tr
+
+def _rule_detect(p: ParsedRequest, tr) -> bool:
+    c = _Ctx(p, p.timestamp if p.timestamp is not None else clock(), tr)
+
+    # 단계별 소요 시간: 표본 요청은 metrics 히스토그램(가중치 weight), 판정 기록 중이면 tr 에
+    weight = metrics.METRICS_STAGE_SAMPLE if metrics.sample_stage() else 0
+    if tr is not None:
+        plan = STAGES                               # 판정 기록은 선언 순서 그대로 (근거 비교가 쉬움)
+    else:
+        plan = _scheduler.plans[_score_cache.size > 0]
+        if weight:
+            return _rule_detect_sampled(c, plan, weight)
+
+    timed = bool(weight) or tr is not None
+    obs   = _observe_stage
+    t     = time.perf_counter_ns() if timed else 0
+    for st in plan:
+        hit = st.run(c)
+        if timed:
+            t = obs(t, st.name, weight, tr)
+        if hit:
+            return _blocked(st.name, tr)
+    return False
 
-    return score >= FINAL_SCORE_THRESHOLD
+def _rule_detect_sampled(c: _Ctx, plan, weight: int) -> bool:
+    # 표본 요청: 재정렬 대상 단계는 앞 단계가 차단해도 모두 실행해 비용 / 차단 여부를 스케줄러에 기록
+    # (부수 효과가 없으므로 판정과 IP 상태는 표본이 아닌 요청과 같음)
+    movable = _scheduler.stages
+    first   = None
+    t = time.perf_counter_ns()
+    for st in plan:
+        is_movable = st in movable
+        if first is not None and not is_movable:
+            break
+        hit = st.run(c)
+        t1 = time.perf_counter_ns()
+        metrics.STAGE_SECONDS.observe((t1 - t) * 1e-9, st.name, n=weight)
+        if is_movable:
+            _scheduler.observe(st, t1 - t, hit)
+        if hit and first is None:
+            first = st
+        t = time.perf_counter_ns()
+    _scheduler.sampled()
+    return _blocked(first.name, None) if first is not None else False
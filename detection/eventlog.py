@@ -0,0 +1,197 @@
+# eventlog.py
+"""
+구조화(JSON 한 줄) 이벤트 로그 - 요청 경로에서 I/O 를 하지 않는 비동기 기록기
+──────────────────────────────────────────────
+  - log(event, **fields) 는 레벨 확인 → 샘플링 → 초당 제한 → 큐 적재만 하고 바로 반환
+  - 백그라운드 스레드가 큐를 묶음 단위로 꺼내 JSON 직렬화 후 한 번에 write
+  - 큐가 가득 차거나 샘플링 / 초당 제한에 걸린 이벤트는 버리고 개수만 세어
+    LOG_SUMMARY_SEC 마다 "log_suppressed" 이벤트 하나로 요약
+  - 비용이 큰 디버그 덤프는 enabled(DEBUG) 로 감싸서 꺼져 있으면 만들지도 않음
+
+설정 (환경변수)
+  LOG_LEVEL         DEBUG | INFO | WARNING | ERROR               (기본 INFO)
+  LOG_SAMPLE        이벤트별 샘플링 비율  예) "detect_rule=0.1,detect_ml=0.5"
+  LOG_RATE          이벤트별 초당 최대 건수 예) "error=20"  (지정 없으면 LOG_DEFAULT_RATE)
+  LOG_FILE          출력 파일 (기본 stdout)
+"""
+
+from __future__ import annotations
+import atexit, json, os, queue, random, sys, threading, time
+from typing import Dict, Optional
+
+# ───────────── 설정 상수 ─────────────
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+_LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+_NAMES  = {v: k.lower() for k, v in _LEVELS.items()}
+
+LOG_LEVEL        = _LEVELS.get(os.getenv("LOG_LEVEL", "INFO").upper(), INFO)
+LOG_QUEUE_MAX    = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_BATCH_MAX    = 512                                           # 한 번에 write 하는 최대 줄 수
+LOG_DEFAULT_RATE = float(os.getenv("LOG_DEFAULT_RATE", "200"))   # 이벤트 종류별 초당 최대 건수
+LOG_SUMMARY_SEC  = float(os.getenv("LOG_SUMMARY_SEC", "10"))
+LOG_FILE         = os.getenv("LOG_FILE", "")
+
+
+def _parse_map(spec: str) -> Dict[str, float]:
+    out = {}
+    for part in spec.split(","):
+        name, _, val = part.partition("=")
+        if name.strip() and val.strip():
+            out[name.strip()] = float(val)
+    return out
+
+LOG_SAMPLE = _parse_map(os.getenv("LOG_SAMPLE", ""))
+LOG_RATE   = _parse_map(os.getenv("LOG_RATE", ""))
+
+
+# ───────────── 이벤트별 초당 제한 (토큰 버킷) ─────────────
+class _Bucket:
+    __slots__ = ("rate", "tokens", "ts")
+
+    def __init__(self, rate: float):
+        self.rate, self.tokens, self.ts = rate, rate, time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+# ───────────── 기록기 ─────────────
+class EventLog:
+    def __init__(self, level: int = LOG_LEVEL, queue_max: int = LOG_QUEUE_MAX,
+                 sample: Optional[Dict[str, float]] = None,
+                 rate: Optional[Dict[str, float]] = None,
+                 stream=None):
+        self.level   = level
+        self.sample  = dict(LOG_SAMPLE if sample is None else sample)
+        self.rate    = dict(LOG_RATE if rate is None else rate)
+        self._stream = stream
+        self._q: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._buckets: Dict[str, _Bucket] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # 버린 이벤트 수 (요약 후 초기화) / 누적 통계
+        self._suppressed: Dict[str, int] = {}
+        self.written = 0
+        self.dropped = {"sampled": 0, "rate_limited": 0, "queue_full": 0}
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def log(self, event: str, level: int = INFO, **fields):
+        if level < self.level:
+            return
+        p = self.sample.get(event)
+        if p is not None and p < 1.0 and random.random() >= p:
+            self._suppress(event, "sampled")
+            return
+        b = self._buckets.get(event)
+        if b is None:
+            b = self._buckets.setdefault(event, _Bucket(self.rate.get(event, LOG_DEFAULT_RATE)))
+        if not b.take():
+            self._suppress(event, "rate_limited")
+            return
+        rec = {"ts": time.time(), "level": _NAMES.get(level, level), "event": event}
+        rec.update(fields)
+        if self._pid != os.getpid():          # 첫 호출 또는 fork/spawn 된 자식 프로세스
+            self._start()
+        try:
+            self._q.put_nowait(rec)
+        except queue.Full:
+            self._suppress(event, "queue_full")
+
+    def debug(self, event: str, **fields):
+        self.log(event, DEBUG, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(event, INFO, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(event, WARNING, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(event, ERROR, **fields)
+
+    def _suppress(self, event: str, reason: str):
+        self.dropped[reason] += 1
+        self._suppressed[event] = self._suppressed.get(event, 0) + 1
+
+    # ─── 백그라운드 기록 스레드 ───
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:         # fork 된 자식: 부모 큐의 잠금 / 내용은 물려받지 않음
+                self._q = queue.Queue(maxsize=self._q.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._writer, name="eventlog", daemon=True)
+            self._thread.start()
+
+    def _writer(self):
+        out = self._stream
+        if out is None:
+            out = open(LOG_FILE, "a", buffering=1 << 16) if LOG_FILE else sys.stdout
+        next_summary = time.monotonic() + LOG_SUMMARY_SEC
+        while True:
+            try:
+                items = [self._q.get(timeout=1.0)]
+            except queue.Empty:
+                items = []
+            while items and len(items) < LOG_BATCH_MAX:
+                try:
+                    items.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            n = len(items)                        # 큐에서 꺼낸 개수 (task_done 대상)
+            if time.monotonic() >= next_summary:
+                next_summary = time.monotonic() + LOG_SUMMARY_SEC
+                if self._suppressed:
+                    counts, self._suppressed = self._suppressed, {}
+                    items.append({"ts": time.time(), "level": "warning",
+                                  "event": "log_suppressed", "counts": counts})
+            if not items:
+                continue
+            try:
+                out.write("".join(json.dumps(it, ensure_ascii=False, default=str) + "\n" for it in items))
+                out.flush()
+                self.written += len(items)
+            except Exception:
+                pass
+            for _ in range(n):
+                self._q.task_done()
+
+    def flush(self, timeout: float = 2.0):
+        """큐에 쌓인 이벤트를 기록할 때까지 대기 (종료 시 호출)."""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._q.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> dict:
+        return {
+            "level"    : _NAMES.get(self.level, self.level),
+            "queued"   : self._q.qsize(),
+            "written"  : self.written,
+            "dropped"  : dict(self.dropped),
+        }
+
+
+# ───────────── 프로세스 공용 기록기 ─────────────
+_log = EventLog()
+atexit.register(_log.flush)
+
+enabled = _log.enabled
+log     = _log.log
+debug   = _log.debug
+info    = _log.info
+warning = _log.warning
+error   = _log.error
+flush   = _log.flush
+stats   = _log.stats
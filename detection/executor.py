@@ -0,0 +1,194 @@
+# executor.py
+"""
+탐지 연산(룰 / 특징 추출 / ML 추론)을 이벤트 루프 밖에서 실행하는 실행기
+──────────────────────────────────────────────
+DETECT_EXECUTOR
+  inline   이벤트 루프에서 바로 실행 (기존 동작)
+  thread   스레드 풀. 상태 저장소는 잠금으로 보호되고, sklearn/numpy 구간은 GIL 을 놓음
+  process  프로세스 풀. 자식마다 룰 / 모델을 미리 적재해 코어를 여러 개 사용
+           (IP 카운터를 자식끼리 공유하려면 STATE_BACKEND=shm 또는 redis)
+
+실행 중 + 대기 작업 수는 DETECT_QUEUE_MAX 로 제한.
+자리가 DETECT_QUEUE_WAIT_MS 안에 나지 않으면 Overloaded → 호출 측에서 503 응답.
+"""
+
+from __future__ import annotations
+import asyncio, multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+
+import eventlog
+import metrics
+import retrain
+import state_backend
+from detection import rule_detect, rule_detect_traced
+from ml_detection import _NF, ml_detect_batch, ml_features, ml_predict_rows, start_watcher
+from parsed_request import ParsedRequest
+
+# ───────────── 설정 상수 ─────────────
+DETECT_EXECUTOR       = os.getenv("DETECT_EXECUTOR", "thread")         # inline | thread | process
+DETECT_WORKERS        = int(os.getenv("DETECT_WORKERS", "0"))          # 0 → 모드별 기본값
+DETECT_QUEUE_MAX      = int(os.getenv("DETECT_QUEUE_MAX", "0"))        # 0 → 워커 수 × 8
+DETECT_QUEUE_WAIT_MS  = int(os.getenv("DETECT_QUEUE_WAIT_MS", "50"))
+DETECT_MP_START       = os.getenv("DETECT_MP_START", "spawn")          # 이벤트 루프 스레드가 있으므로 fork 대신 spawn
+DETECT_WARMUP_SEC     = float(os.getenv("DETECT_WARMUP_SEC", "120"))   # 자식 프로세스가 모두 준비될 때까지 기다리는 상한
+
+
+class Overloaded(Exception):
+    """실행 대기열이 가득 차 작업을 받을 수 없음."""
+
+
+# ───────────── 워커에서 실행되는 함수 (프로세스 모드에서는 pickle 되어 전달) ─────────────
+def screen(req: ParsedRequest) -> Tuple[str, Optional[np.ndarray]]:
+    """룰 판정 후 통과하면 ML 특징 행까지 계산. ("rule", None) 또는 ("ml", row|None)."""
+    if rule_detect(req):
+        return "rule", None
+    return "ml", ml_features(req)
+
+
+def detect_records(records: list) -> list:
+    """/detect/batch 본문: 레코드별 룰 판정 후 통과한 레코드를 한 번에 ML 판정."""
+    results: list = [None] * len(records)
+    ml_idx, ml_records = [], []
+
+    # 1단계: 룰 기반 탐지 (레코드별로 한 번 파싱해 룰 / ML 이 함께 사용)
+    for i, data in enumerate(records):
+        try:
+            req = ParsedRequest(data)
+            if rule_detect(req):
+                results[i] = {"anomaly": True, "method": "rule"}
+            else:
+                ml_idx.append(i)
+                ml_records.append(req)
+        except Exception as e:
+            eventlog.error("error", detail=str(e))
+            results[i] = {"anomaly": "error", "detail": str(e)}
+
+    # 2단계: ML 기반 탐지 (룰을 통과한 레코드를 한 번에)
+    for i, hit in zip(ml_idx, ml_detect_batch(ml_records)):
+        results[i] = ({"anomaly": True, "method": "ml"} if hit else
+                      {"anomaly": False, "method": "normal"})
+    return results
+
+
+def trace_record(data: dict, profile: str = "") -> dict:
+    """룰 판정 기록 (차단 단계, SCORES 키별 기여, clamp, 단계별 ns) 을 dict 로."""
+    return rule_detect_traced(data, profile).as_dict()
+
+
+def _call_with_metrics(fn: Callable[..., Any], *args) -> Tuple[Any, Optional[dict]]:
+    # 자식 프로세스의 단계별 메트릭을 결과와 함께 부모로 (METRICS_PUSH_SEC 마다 한 번)
+    return fn(*args), metrics.export()
+
+
+def _init_worker(ready=None):
+    # 모듈 import 시점에 룰 / 모델이 적재됨. 첫 요청 지연을 없애려고 상태 백엔드와 추론 경로를 미리 한 번 실행
+    state_backend.get_backend()
+    ml_predict_rows([np.zeros(_NF)])
+    start_watcher()                     # 자식도 models/CURRENT 를 감시해 새 번들로 교체
+    retrain.start()                     # 자식의 정상 트래픽 표본도 재학습에 쓰이도록 스풀에 기록
+    if ready is not None:
+        # 모든 자식이 초기화를 마칠 때까지 작업을 받지 않음 → 준비된 자식 하나가 예열 작업을 모두 가져가지 못함
+        try:
+            ready.wait(DETECT_WARMUP_SEC)
+        except threading.BrokenBarrierError:
+            eventlog.warning("executor", detail="worker warm-up barrier timed out")
+
+
+def _noop():
+    pass
+
+
+# ───────────── 실행기 ─────────────
+class DetectExecutor:
+    def __init__(self, mode: str = DETECT_EXECUTOR, workers: int = DETECT_WORKERS,
+                 queue_max: int = DETECT_QUEUE_MAX, wait_ms: int = DETECT_QUEUE_WAIT_MS):
+        if mode not in ("inline", "thread", "process"):
+            raise ValueError(f"unknown DETECT_EXECUTOR: {mode}")
+        cpus = os.cpu_count() or 1
+        self.mode      = mode
+        self.workers   = workers or (cpus if mode == "process" else min(32, cpus + 4))
+        self.queue_max = queue_max or self.workers * 8
+        self.wait      = max(0, wait_ms) / 1e3
+        self._pool     = None
+        self._slots    = asyncio.Semaphore(self.queue_max)
+        self.inflight  = 0
+        self.peak      = 0
+        self.completed = 0
+        self.rejected  = 0
+        self.restarts  = 0
+
+    def start(self):
+        if self.mode == "inline" or self._pool is not None:
+            return
+        if self.mode == "thread":
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="detect")
+            return
+        if state_backend.STATE_BACKEND == "memory":
+            eventlog.warning("executor", detail="process 모드에서 STATE_BACKEND=memory 이면 IP 카운터가 자식 프로세스별로 나뉨")
+        ctx = multiprocessing.get_context(DETECT_MP_START)
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(ctx.Barrier(self.workers),),
+        )
+        # 자식 프로세스를 지금 띄워 모델 적재(_init_worker)를 첫 요청 전에 끝냄.
+        # 자식은 초기화 후 장벽에서 서로를 기다리므로 쉬는 자식이 없어 빈 작업 workers 개가 자식 workers 개를 띄우고,
+        # 빈 작업이 모두 끝났다면 모든 자식이 초기화를 마친 것
+        for f in [self._pool.submit(_noop) for _ in range(self.workers)]:
+            f.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        if self.mode == "inline":
+            return fn(*args)
+        # 대기열 자리 확보 (가득 차면 잠시 기다린 뒤 거절)
+        if self._slots.locked():
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.wait)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(f"detect queue full ({self.queue_max})") from None
+        else:
+            await self._slots.acquire()
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        try:
+            if self._pool is None:
+                self.start()
+            loop = asyncio.get_running_loop()
+            try:
+                if self.mode == "thread":
+                    return await loop.run_in_executor(self._pool, fn, *args)
+                result, snap = await loop.run_in_executor(self._pool, _call_with_metrics, fn, *args)
+                metrics.merge(snap)
+                return result
+            except BrokenProcessPool:
+                # 자식이 죽으면 풀을 새로 만들고 이번 작업은 실패 처리
+                self.restarts += 1
+                self.shutdown()
+                raise
+        finally:
+            self.inflight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "mode"     : self.mode,
+            "workers"  : self.workers,
+            "queue_max": self.queue_max,
+            "inflight" : self.inflight,
+            "peak"     : self.peak,
+            "completed": self.completed,
+            "rejected" : self.rejected,
+            "restarts" : self.restarts,
+        }
@@ -0,0 +1,184 @@
+# features.py
+"""
+ML 특징 정의 (학습과 서빙이 함께 쓰는 단일 정의)
+──────────────────────────────────────────────
+  - FEATURES: 특징 순서. 모델 / 번들 / 특징 행이 모두 이 순서를 따름
+  - 문자열 특징 (요청 하나 단위)
+      path_stats      path_depth / path_token_count / path_token_numeric_ratio / uri_entropy
+      auth_validity   Authorization 헤더 형식 (0 없음, 1 정상, -1 형식 오류)
+      accept_main     Accept 의 첫 번째 MIME 타입 (accept_type 인코딩 전 값)
+      referer_domain  Referer 의 도메인 (referer_domain 인코딩 전 값)
+    ml_detection 은 요청마다, train_pipeline 은 서로 다른 값마다 한 번씩 같은 함수를 호출
+  - 시간 윈도우 특징 (req_count / interval / req_count_in_last_10s / unique_paths_in_last_60s)
+      서빙: behavior_store.BehaviorStore.observe 가 요청마다 증분 계산
+      학습: window_features 가 (ip, timestamp) 정렬 후 searchsorted / 누적합으로 한 번에 계산.
+            창 경계 (now - W, now], IP 당 이벤트 상한, 창 안 직전 요청과의 간격까지 observe 와 같음
+"""
+
+from __future__ import annotations
+import math
+from collections import Counter
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from behavior_store import LONG_WINDOW, MAX_EVENTS_PER_IP, SHORT_WINDOW
+
+FEATURES = [
+    "path_depth",
+    "path_token_count",
+    "path_token_numeric_ratio",
+    "uri_entropy",
+    "auth_validity",
+    "referer_domain",
+    "method",
+    "accept_type",
+    "cookie_count",
+    "req_count",
+    "interval",
+    "req_count_in_last_10s",
+    "unique_paths_in_last_60s"
+]
+
+# 학습 데이터에서 상위 REFERER_TOP 도메인만 어휘로 쓰고 나머지는 OTHER
+REFERER_TOP   = 20
+REFERER_OTHER = "__OTHER__"
+ACCEPT_OTHER  = "*/*"           # 처음 보는 Accept 타입을 대신할 값
+
+
+# ───────────── 문자열 특징 ─────────────
+def entropy(s: str) -> float:
+    if not s:
+        return 0.0
+    # 한 번의 순회로 문자 히스토그램 생성
+    n = len(s)
+    return -sum(c / n * math.log2(c / n) for c in Counter(s).values())
+
+
+def path_stats(path: str, tokens: Optional[List[str]] = None) -> Tuple[int, int, float, float]:
+    """(path_depth, path_token_count, path_token_numeric_ratio, uri_entropy). tokens: 미리 나눈 빈 값 없는 세그먼트"""
+    if tokens is None:
+        tokens = [t for t in path.split("/") if t]
+    return (
+        path.count("/"),
+        len(tokens),
+        sum(t.isnumeric() for t in tokens) / len(tokens) if tokens else 0.0,
+        entropy(path),
+    )
+
+
+def auth_validity(auth: str) -> int:
+    auth = str(auth)
+    if not auth or auth.lower() == 'nan':
+        return 0  # 헤더 없음
+
+    parts = auth.split()
+    if len(parts) != 2:
+        return -1 # 형식 오류
+
+    scheme, token = parts
+    if scheme.lower() == 'bearer':
+        # JWT는 보통 2개의 점을 가짐
+        return 1 if token.count('.') == 2 else -1
+    elif scheme.lower() == 'basic':
+        return 1 # Basic은 형식만 맞으면 정상으로 간주
+
+    return -1 # 알려지지 않은 스킴
+
+
+def accept_main(accept: str) -> str:
+    # 첫 번째 MIME 타입만 사용
+    return accept.split(',')[0].strip()
+
+
+def referer_domain(referer: str) -> Optional[str]:
+    """도메인. 파싱할 수 없으면 None (OTHER 로 인코딩)."""
+    try:
+        return urlparse(referer).netloc
+    except Exception:
+        return None
+
+
+# ───────────── 시간 윈도우 특징 (일괄) ─────────────
+def window_features(ip: np.ndarray, ts: np.ndarray, path: np.ndarray,
+                    cap: int = MAX_EVENTS_PER_IP):
+    """
+    요청 n 건의 시간 윈도우 특징을 한 번에 계산. 입력 순서 그대로 4 개 배열을 반환
+    (req_count, interval, req_count_in_last_10s, unique_paths_in_last_60s).
+    ip / path: 정수 코드, ts: 초 단위 float64. 같은 IP 의 같은 timestamp 는 입력 순서대로 관측한 것으로 봄.
+
+      - 창 시작 s_i: 같은 IP 에서 ts > ts_i - W 인 첫 행 (IP 당 cap 건 상한 적용)
+        IP 코드 + "ts 의 전체 순위" 를 묶은 정수 키 하나로 searchsorted → 부동소수 비교가 observe 와 같음
+      - unique_paths: 행 j 는 같은 (IP, 경로)의 다음 등장 전까지, 그리고 창 시작이 j 를 넘기 전까지
+        고유 경로 하나로 세어짐 → 구간 [j, min(next_j - 1, e_j)] 에 +1 을 차분 배열로 더하고 누적합
+    """
+    n = len(ts)
+    count = np.min_scalar_type(cap)                    # 개수 특징은 cap 이하
+    if n == 0:
+        z = np.zeros(0, dtype=count)
+        return z, np.zeros(0), z, z
+    # 행이 수천만 개여도 돌 수 있게 임시 배열은 다 쓰는 즉시 해제
+    order = np.lexsort((ts, ip))                       # 안정 정렬: 같은 키는 입력 순서
+    t = ts[order]
+    g = ip[order]
+    new = np.empty(n, dtype=bool)
+    new[0] = True
+    np.not_equal(g[1:], g[:-1], out=new[1:])
+    del g
+    gid = np.cumsum(new, dtype=np.int64)
+    gid -= 1
+    del new
+
+    # 키 = IP 순번 * (n + 1) + "ts 이하인 값의 개수". 같은 IP 안에서 ts_j > lo ⇔ 키_j > 키(lo)
+    sorted_t = np.sort(t)
+    key = gid * (n + 1)
+    key += np.searchsorted(sorted_t, t, side="right")
+
+    def start(window):
+        q = gid * (n + 1)
+        q += np.searchsorted(sorted_t, t - window, side="right")
+        return np.searchsorted(key, q, side="right")
+
+    s60_time = start(LONG_WINDOW)
+    s10 = start(SHORT_WINDOW)
+    del key, sorted_t
+
+    idx = np.arange(n)
+    floor = idx - (cap - 1)
+    s60 = np.maximum(s60_time, floor)
+    np.maximum(s10, floor, out=s10)
+    del floor
+    req_count = (idx - s60 + 1).astype(count)
+    req_10s = (idx - s10 + 1).astype(count)
+    del s10
+    # 창 안에 남은 직전 요청과의 간격 (상한으로 밀려나기 전 기준, observe 와 같음)
+    interval = np.zeros(n)
+    prev = np.flatnonzero(s60_time < idx)
+    interval[prev] = t[prev] - t[prev - 1]
+    del prev, s60_time, t
+
+    # 같은 (IP, 경로)의 다음 등장 위치 (없으면 n)
+    p = path[order]
+    by_path = np.lexsort((p, gid))                     # gid 안에서 경로별, 경로 안에서는 행 순서
+    same = gid[by_path[1:]] == gid[by_path[:-1]]
+    del gid
+    same &= p[by_path[1:]] == p[by_path[:-1]]
+    del p
+    end = np.full(n, n)
+    end[by_path[:-1][same]] = by_path[1:][same]
+    del by_path, same
+    # 구간 끝 = min(next_j - 1, e_j). e_j: 창 시작이 j 이하인 마지막 행 (s60 은 전체에서 단조 증가)
+    end -= 1
+    np.minimum(end, np.searchsorted(s60, idx, side="right") - 1, out=end)
+    del s60
+    end += 1
+    unique = (idx + 1 - np.cumsum(np.bincount(end, minlength=n + 1)[:n])).astype(count)
+    del end, idx
+
+    out = []
+    for v in (req_count, interval, req_10s, unique):
+        r = np.empty_like(v)
+        r[order] = v
+        out.append(r)
+    return tuple(out)
@@ -0,0 +1,173 @@
+# geoip.py
+"""
+GeoIP 국가 조회 (요청당 1회 + LRU 캐시)
+──────────────────────────────────────────────
+  GEOIP_MODE=reader  geoip2 Reader 로 조회 (기본)
+  GEOIP_MODE=index   GeoLite2-Country 를 정렬된 정수 범위 배열(.npy)로 평탄화한 인덱스를
+                     np.load(mmap_mode="r") 로 열어 이진 탐색. 같은 파일을 여는 워커들은
+                     OS 페이지 캐시를 읽기 전용으로 공유한다.
+  어느 모드든 결과는 IP 키 LRU(GEO_CACHE_SIZE)에 캐시되어 반복 IP 는 dict 조회 비용만 든다.
+
+인덱스 생성: python geoip.py build [mmdb 경로] [출력 디렉토리]
+"""
+
+from __future__ import annotations
+import ipaddress, json, os, sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+# ───────────── 설정 상수 ─────────────
+GEOIP_DB_PATH    = os.getenv("GEOIP_DB_PATH", "data/GeoLite2-Country.mmdb")
+GEOIP_INDEX_DIR  = os.getenv("GEOIP_INDEX_DIR", "data/geoip_index")
+GEOIP_MODE       = os.getenv("GEOIP_MODE", "reader")       # reader | index
+GEO_CACHE_SIZE   = int(os.getenv("GEO_CACHE_SIZE", "262144"))
+
+# ───────────── 내부 상태 ─────────────
+_reader = None          # geoip2 Reader, 열기 실패 시 False
+_index  = None          # _RangeIndex,  열기 실패 시 False
+
+
+# ───────────── 범위 인덱스 ─────────────
+class _RangeIndex:
+    """정렬된 [start, end] 정수 범위 + 국가 코드 번호 배열 (v4: uint32, v6: 상위/하위 uint64)."""
+
+    def __init__(self, d: Path):
+        import numpy as np
+        self.np = np
+        load = lambda name: np.load(d / f"{name}.npy", mmap_mode="r")
+        self.codes = [None] + json.loads((d / "codes.json").read_text())
+        self.v4_start, self.v4_end, self.v4_cc = load("v4_start"), load("v4_end"), load("v4_cc")
+        self.v6_shi, self.v6_slo = load("v6_start_hi"), load("v6_start_lo")
+        self.v6_ehi, self.v6_elo = load("v6_end_hi"), load("v6_end_lo")
+        self.v6_cc = load("v6_cc")
+
+    def lookup(self, ip: str) -> Optional[str]:
+        addr = ipaddress.ip_address(ip)
+        if addr.version == 6 and addr.ipv4_mapped is not None:
+            addr = addr.ipv4_mapped
+        n = int(addr)
+        np = self.np
+        if addr.version == 4:
+            i = int(np.searchsorted(self.v4_start, n, side="right")) - 1
+            if i < 0 or n > int(self.v4_end[i]):
+                return None
+            return self.codes[int(self.v4_cc[i])]
+        hi, lo = n >> 64, n & 0xFFFF_FFFF_FFFF_FFFF
+        # 상위 64비트가 같은 구간 안에서 하위 64비트로 한 번 더 탐색
+        l = int(np.searchsorted(self.v6_shi, hi, side="left"))
+        r = int(np.searchsorted(self.v6_shi, hi, side="right"))
+        i = l + int(np.searchsorted(self.v6_slo[l:r], lo, side="right")) - 1 if r > l else l - 1
+        if i < 0:
+            return None
+        end = (int(self.v6_ehi[i]) << 64) | int(self.v6_elo[i])
+        if n > end:
+            return None
+        return self.codes[int(self.v6_cc[i])]
+
+
+def build_index(db_path: str = GEOIP_DB_PATH, out_dir: str = GEOIP_INDEX_DIR) -> int:
+    """mmdb 트리를 순회해 국가별 정수 범위 배열로 저장. 저장한 범위 개수 반환."""
+    import maxminddb, numpy as np
+    codes: dict[str, int] = {}
+    v4: list[tuple[int, int, int]] = []
+    v6: list[tuple[int, int, int]] = []
+    with maxminddb.open_database(db_path, maxminddb.MODE_MMAP) as reader:
+        for net, rec in reader:
+            cc = ((rec or {}).get("country") or {}).get("iso_code")
+            if not cc:
+                continue
+            code = codes.setdefault(cc, len(codes) + 1)
+            rng = (int(net.network_address), int(net.broadcast_address), code)
+            (v4 if net.version == 4 else v6).append(rng)
+
+    def merge(rows):
+        rows.sort()
+        out: list[list[int]] = []
+        for s, e, c in rows:
+            if out and out[-1][2] == c and out[-1][1] + 1 == s:
+                out[-1][1] = e
+            else:
+                out.append([s, e, c])
+        return out
+
+    v4, v6 = merge(v4), merge(v6)
+    d = Path(out_dir)
+    d.mkdir(parents=True, exist_ok=True)
+    mask = 0xFFFF_FFFF_FFFF_FFFF
+    arrays = {
+        "v4_start":    np.array([r[0] for r in v4], dtype=np.uint32),
+        "v4_end":      np.array([r[1] for r in v4], dtype=np.uint32),
+        "v4_cc":       np.array([r[2] for r in v4], dtype=np.uint16),
+        "v6_start_hi": np.array([r[0] >> 64 for r in v6], dtype=np.uint64),
+        "v6_start_lo": np.array([r[0] & mask for r in v6], dtype=np.uint64),
+        "v6_end_hi":   np.array([r[1] >> 64 for r in v6], dtype=np.uint64),
+        "v6_end_lo":   np.array([r[1] & mask for r in v6], dtype=np.uint64),
+        "v6_cc":       np.array([r[2] for r in v6], dtype=np.uint16),
+    }
+    for name, arr in arrays.items():
+        np.save(d / f"{name}.npy", arr)
+    (d / "codes.json").write_text(json.dumps(sorted(codes, key=codes.get)))
+    return len(v4) + len(v6)
+
+
+# ───────────── 조회 백엔드 ─────────────
+def _load_reader():
+    global _reader
+    if _reader is None:
+        try:
+            import geoip2.database
+            _reader = geoip2.database.Reader(GEOIP_DB_PATH)
+        except Exception:
+            _reader = False
+    return _reader
+
+def _load_index():
+    global _index
+    if _index is None:
+        try:
+            _index = _RangeIndex(Path(GEOIP_INDEX_DIR))
+        except Exception:
+            _index = False
+    return _index
+
+@lru_cache(maxsize=GEO_CACHE_SIZE)
+def _lookup(ip: str) -> Optional[str]:
+    try:
+        if GEOIP_MODE == "index":
+            idx = _load_index()
+            if idx:
+                return idx.lookup(ip)
+        reader = _load_reader()
+        if not reader:
+            return None
+        return reader.country(ip).country.iso_code
+    except Exception:
+        return None
+
+
+# ───────────── 공개 API ─────────────
+def country(ip: str) -> Optional[str]:
+    """IP → ISO 국가 코드 (없거나 조회 실패 시 None)."""
+    if not ip:
+        return None
+    return _lookup(ip)
+
+def cache_info():
+    return _lookup.cache_info()
+
+def reload():
+    """DB/인덱스를 다시 열고 캐시를 비운다 (DB 파일 교체 후 호출)."""
+    global _reader, _index
+    if _reader:
+        _reader.close()
+    _reader = _index = None
+    _lookup.cache_clear()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        n = build_index(*sys.argv[2:4])
+        print(f"저장 완료: {n} ranges")
+    else:
+        print("usage: python geoip.py build [mmdb 경로] [출력 디렉토리]")
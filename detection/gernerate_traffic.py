@@ -73,53 +73,60 @@ attack_paths = {
 }
 
 
-with open("traffic_log.csv", "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["ip", "timestamp", "method", "path", "ua", "referer", "authorization", "accept_type", "cookie_count"])
-
-    # --- 현실적인 정상 트래픽 생성 ---
-    public_paths = [p for p in normal_paths if "mypage" not in p and "cart" not in p and "user" not in p and "checkout" not in p]
-    member_paths = [p for p in normal_paths if "mypage" in p or "cart" in p or "user" in p or "checkout" in p]
-    valid_auth_tokens = [auth for auth in normal_authorizations if auth != ""]
-
-    for i in range(800):
-        is_member = random.random() < 0.6 # 60%는 회원 트래픽
-        ip = f"192.168.0.{random.randint(1, 100)}"
-        auth = ""
-        path = "/"
-
-        if is_member:
-            path = random.choice(member_paths)
-            auth = random.choice(valid_auth_tokens)
-        else:
-            path = random.choice(public_paths)
+# 회원 / 비회원 경로, 유효한 인증 토큰 (loadgen.py 도 같은 풀을 사용)
+public_paths = [p for p in normal_paths if "mypage" not in p and "cart" not in p and "user" not in p and "checkout" not in p]
+member_paths = [p for p in normal_paths if "mypage" in p or "cart" in p or "user" in p or "checkout" in p]
+valid_auth_tokens = [auth for auth in normal_authorizations if auth != ""]
+
+
+def generate_csv(path="traffic_log.csv"):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ip", "timestamp", "method", "path", "ua", "referer", "authorization", "accept_type", "cookie_count"])
+
+        # --- 현실적인 정상 트래픽 생성 ---
+        for i in range(800):
+            is_member = random.random() < 0.6 # 60%는 회원 트래픽
+            ip = f"192.168.0.{random.randint(1, 100)}"
+            auth = ""
+            path = "/"
+
+            if is_member:
+                path = random.choice(member_paths)
+                auth = random.choice(valid_auth_tokens)
+            else:
+                path = random.choice(public_paths)
         
-        writer.writerow([
-            ip,
-            time.time() - random.uniform(1, 3600), # 최근 1시간 내 랜덤 시간
-            random.choice(normal_method_type),
-            path,
-            random.choice(normal_ua_list),
-            random.choice(normal_referers),
-            auth,
-            random.choice(normal_accept_type),
-            random.randint(1, 5)
-        ])
-        time.sleep(random.uniform(0.1, 0.5))
-
-    # --- 비정상 트래픽 생성 ---
-    for i in range(200):
-        attack_type = random.choice(list(attack_paths.keys()))
+            writer.writerow([
+                ip,
+                time.time() - random.uniform(1, 3600), # 최근 1시간 내 랜덤 시간
+                random.choice(normal_method_type),
+                path,
+                random.choice(normal_ua_list),
+                random.choice(normal_referers),
+                auth,
+                random.choice(normal_accept_type),
+                random.randint(1, 5)
+            ])
+            time.sleep(random.uniform(0.1, 0.5))
+
+        # --- 비정상 트래픽 생성 ---
+        for i in range(200):
+            attack_type = random.choice(list(attack_paths.keys()))
         
-        writer.writerow([
-            random.choice(abnormal_ips),
-            time.time(),
-            random.choice(abnormal_methods),
-            random.choice(attack_paths[attack_type]),
-            random.choice(abnormal_uas),
-            random.choice(abnormal_referers),
-            random.choice(abnormal_authorizations),
-            random.choice(abnormal_accepts),
-            random.randint(0, 1)
-        ])
-        time.sleep(random.uniform(0.01, 0.1))
+            writer.writerow([
+                random.choice(abnormal_ips),
+                time.time(),
+                random.choice(abnormal_methods),
+                random.choice(attack_paths[attack_type]),
+                random.choice(abnormal_uas),
+                random.choice(abnormal_referers),
+                random.choice(abnormal_authorizations),
+                random.choice(abnormal_accepts),
+                random.randint(0, 1)
+            ])
+            time.sleep(random.uniform(0.01, 0.1))
+
+
+if __name__ == "__main__":
+    generate_csv()
@@ -0,0 +1,212 @@
+# iforest_native.py
+"""
+IsolationForest 파이프라인(StandardScaler → IsolationForest)을 NumPy 배열로 펼친 추론기
+──────────────────────────────────────────────
+  - 모든 트리의 노드를 하나의 연속 배열(feature / threshold / children / 잎 경로 길이)로 합침.
+    잎은 자기 자신을 자식으로 가리키게 해서 최대 깊이만큼 한꺼번에 내려가면 모든 행·트리가 잎에 도착
+  - sklearn 과 결과가 비트 단위로 같도록 계산 순서를 맞춤
+      스케일링 float64 → float32 변환 → x <= threshold (NaN 은 missing_go_to_left)
+      트리별 (경로 길이 + 평균 경로 보정 - 1) 을 트리 순서대로 누적 → 2 ** (-depth / 분모)
+  - 한 행(요청 하나)과 여러 행(마이크로 배치)을 같은 코드로 처리.
+    sklearn predict 의 입력 검사 / 트리별 파이썬 루프 / 병렬 준비 비용이 없음
+
+사용법
+  python iforest_native.py [model.pkl] [out.npz]     # 배열로 내보내고 traffic_log.csv 로 일치 확인
+"""
+
+from __future__ import annotations
+import os, sys
+import numpy as np
+
+_LEAF = -1          # sklearn TREE_LEAF
+
+
+class NativeIForest:
+    """펼친 IsolationForest. score_samples / decision_function / predict 는 sklearn 과 동일."""
+    _ARRAYS = ("mean", "scale", "feature", "threshold", "children", "missing_left",
+               "leaf_value", "roots", "max_depth", "denominator", "offset")
+    __slots__ = _ARRAYS + ("n_features", "_feat2", "_thr2", "_child2", "_miss2", "_root2")
+
+    def __init__(self, mean, scale, feature, threshold, children, missing_left,
+                 leaf_value, roots, max_depth, denominator, offset):
+        self.mean         = np.ascontiguousarray(mean, dtype=np.float64)
+        self.scale        = np.ascontiguousarray(scale, dtype=np.float64)
+        self.feature      = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold    = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.children     = np.ascontiguousarray(children, dtype=np.intp)     # (노드, 2): 왼쪽, 오른쪽
+        self.missing_left = np.ascontiguousarray(missing_left, dtype=bool)
+        self.leaf_value   = np.ascontiguousarray(leaf_value, dtype=np.float64)
+        self.roots        = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth    = int(max_depth)
+        self.denominator  = float(denominator)
+        self.offset       = float(offset)
+        self.n_features   = len(self.mean)
+        # 탐색용 배열: 노드 i 를 키 2i 로 다루면 "자식 = child2[키 + 오른쪽?]" 한 번의 gather 로 끝남
+        # (feature / threshold 는 키 2i, 2i+1 모두에 같은 값)
+        self._feat2  = np.repeat(self.feature, 2)
+        self._thr2   = np.repeat(self.threshold, 2)
+        self._miss2  = np.repeat(self.missing_left, 2)
+        self._child2 = self.children.ravel() * 2
+        self._root2  = self.roots * 2
+
+    # ───────────── 추론 ─────────────
+    def _leaves(self, Xf: np.ndarray) -> np.ndarray:
+        """Xf(float32, 행 × 특징) → 행 × 트리 잎 노드 번호."""
+        n = Xf.shape[0]
+        flat = Xf.ravel()
+        key = np.tile(self._root2, (n, 1))
+        row_off = (np.arange(n) * self.n_features)[:, None] if n > 1 else None
+        has_nan = bool(np.isnan(flat).any())
+        for _ in range(self.max_depth):
+            f = np.take(self._feat2, key)
+            if row_off is not None:
+                f += row_off
+            x = np.take(flat, f)
+            go_right = x > np.take(self._thr2, key)           # NaN 은 False → 아래에서 보정
+            if has_nan:
+                go_right = np.where(np.isnan(x), ~np.take(self._miss2, key), go_right)
+            key = np.take(self._child2, key + go_right)
+        return key >> 1
+
+    def score_samples(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        Xf = ((X - self.mean) / self.scale).astype(np.float32)
+        # 트리 순서대로 더해야 sklearn 의 누적(depths += ...)과 마지막 비트까지 같음
+        depths = np.cumsum(self.leaf_value[self._leaves(Xf)], axis=1)[:, -1]
+        if self.denominator == 0:
+            return -np.ones_like(depths)
+        return -(2 ** (-(depths / self.denominator)))
+
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X) -> np.ndarray:
+        pred = np.ones(len(np.atleast_2d(X)), dtype=int)
+        pred[self.decision_function(X) < 0] = -1
+        return pred
+
+    # ───────────── 저장 / 적재 ─────────────
+    def save(self, path: str):
+        np.savez(path, **{k: getattr(self, k) for k in self._ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "NativeIForest":
+        with np.load(path) as z:
+            return cls(**{k: z[k] for k in z.files})
+
+
+# ───────────── 내보내기 ─────────────
+def _average_path_length(n):
+    from sklearn.ensemble._iforest import _average_path_length as apl
+    return apl(n)
+
+
+def export(model) -> NativeIForest:
+    """학습된 IsolationForest 또는 [StandardScaler →] IsolationForest 파이프라인을 펼침."""
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import StandardScaler
+
+    steps = [s for _, s in model.steps] if hasattr(model, "steps") else [model]
+    forest = steps[-1]
+    if not isinstance(forest, IsolationForest):
+        raise ValueError(f"last step is not IsolationForest: {type(forest).__name__}")
+    nf = forest.n_features_in_
+    mean, scale = np.zeros(nf), np.ones(nf)
+    for s in steps[:-1]:
+        if not isinstance(s, StandardScaler):
+            raise ValueError(f"unsupported pipeline step: {type(s).__name__}")
+        if len(steps) > 2:
+            raise ValueError("only one StandardScaler step is supported")
+        if s.mean_ is not None:
+            mean = s.mean_
+        if s.scale_ is not None:
+            scale = s.scale_
+
+    subsample = forest._max_features != nf
+    feature, threshold, children, missing, leaf_value, roots = [], [], [], [], [], []
+    base, max_depth = 0, 0
+    for i, (est, feats) in enumerate(zip(forest.estimators_, forest.estimators_features_)):
+        t = est.tree_
+        left, right = t.children_left.astype(np.intp), t.children_right.astype(np.intp)
+        is_leaf = left == _LEAF
+        local = np.arange(t.node_count)
+
+        f = t.feature.astype(np.intp)
+        if subsample:
+            f = np.where(is_leaf, 0, np.asarray(feats)[np.where(is_leaf, 0, f)])
+        feature.append(np.where(is_leaf, 0, f))
+        threshold.append(t.threshold)
+        children.append(np.stack([np.where(is_leaf, local, left),
+                                  np.where(is_leaf, local, right)], axis=1) + base)
+        nodes = t.__getstate__()["nodes"]
+        if "missing_go_to_left" in nodes.dtype.names:
+            missing.append(nodes["missing_go_to_left"].astype(bool))
+        else:
+            missing.append(np.zeros(t.node_count, dtype=bool))
+
+        if hasattr(forest, "_decision_path_lengths"):
+            dpl = forest._decision_path_lengths[i]
+            apl = forest._average_path_length_per_tree[i]
+        else:                                   # 오래된 sklearn: 직접 계산
+            dpl = t.compute_node_depths()
+            apl = _average_path_length(t.n_node_samples)
+        leaf_value.append(dpl + apl - 1.0)      # sklearn 과 같은 순서로 더함
+
+        roots.append(base)
+        base += t.node_count
+        max_depth = max(max_depth, t.max_depth)
+
+    denominator = len(forest.estimators_) * _average_path_length([forest._max_samples])[0]
+    return NativeIForest(
+        mean, scale,
+        np.concatenate(feature), np.concatenate(threshold), np.concatenate(children),
+        np.concatenate(missing), np.concatenate(leaf_value), np.array(roots),
+        max_depth, denominator, forest.offset_,
+    )
+
+
+# ───────────── 일치 확인 ─────────────
+def check(model, native: NativeIForest, X: np.ndarray) -> int:
+    """sklearn 과 decision_function 이 다른 행 수 (0 이어야 함)."""
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        ref = model.decision_function(X)
+        ref_pred = model.predict(X)
+    got = native.decision_function(X)
+    return int(np.count_nonzero(ref != got) + np.count_nonzero(ref_pred != native.predict(X)))
+
+
+def main(argv=None) -> int:
+    import joblib, time
+    argv = sys.argv[1:] if argv is None else argv
+    base = os.path.dirname(os.path.abspath(__file__))
+    src = argv[0] if argv else os.path.join(base, "model.pkl")
+    dst = argv[1] if len(argv) > 1 else os.path.join(base, "model_if.npz")
+
+    model = joblib.load(src)
+    native = export(model)
+    native.save(dst)
+    print(f"{src} → {dst}: 노드 {len(native.threshold)}, 트리 {len(native.roots)}, 최대 깊이 {native.max_depth}")
+
+    from bench_replay import DEFAULT_INPUT, load_requests
+    import ml_detection
+    X = np.vstack([ml_detection._feature_row(d) for d in load_requests(DEFAULT_INPUT)])
+    rnd = np.random.default_rng(0)
+    X = np.vstack([X, X * rnd.normal(1, 0.5, X.shape), rnd.normal(0, 1e3, (1000, X.shape[1]))])
+    bad = check(model, NativeIForest.load(dst), X)
+    print(f"일치 확인: {len(X)} 행 중 불일치 {bad}")
+
+    row = X[:1]
+    for name, fn in (("sklearn", model.predict), ("native", native.predict)):
+        t0 = time.perf_counter()
+        for _ in range(200):
+            fn(row)
+        print(f"{name:<8} 1행 predict {(time.perf_counter() - t0) / 200 * 1e6:8.1f} µs")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+# loadgen.py
+"""
+/detect 부하 생성기 (asyncio, keep-alive 연결, 외부 의존성 없음)
+──────────────────────────────────────────────
+  - 요청 풀: gernerate_traffic.py 의 정상 / 비정상 풀 (UA, 리퍼러, 인증 토큰, attack_paths)
+  - 혼합 비율: --mix "normal=0.8,sql_injection=0.05,flood=0.1"
+      normal            정상 사용자 요청
+      <attack_paths 키>  sql_injection / xss / path_traversal / long_uri / deep_path
+      flood             정상처럼 보이는 요청을 소수 IP 에서 몰아서 (IP 빈도 룰 대상)
+  - 부하 방식
+      --concurrency C   닫힌 루프: 연결 C 개가 응답을 받자마자 다음 요청
+      --rate R          열린 루프: 초당 R 건을 예정 시각에 발사. 지연은 예정 시각부터 재므로
+                        서버가 밀려도 지연이 과소 측정되지 않음 (coordinated omission 방지)
+      --ramp "200:10,800:20,1600:20"   rate:초 단계 목록 (--ramp-mode step | linear)
+  - 보고: 달성 RPS, 지연 분포(p50/p90/p99/p999) 와 히스토그램, 판정 수, 초별 RPS / p99
+
+사용법
+  python loadgen.py --url http://127.0.0.1:5000/detect --rate 500 --duration 30
+  python loadgen.py --concurrency 64 --duration 20 --mix "normal=0.7,flood=0.3"
+  python loadgen.py --ramp "100:10,400:10,1600:10" --ramp-mode linear --json result.json
+"""
+
+import argparse, asyncio, json, random, sys, time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import gernerate_traffic as pools
+
+# ───────────── 설정 상수 ─────────────
+DEFAULT_URL        = "http://127.0.0.1:5000/detect"
+PAYLOAD_POOL_SIZE  = 4096          # 미리 직렬화해 두는 요청 본문 수 (종류별)
+MAX_BACKLOG        = 10_000        # 열린 루프에서 연결을 기다리는 요청 상한 (넘으면 late 로 버림)
+HIST_EDGES_MS      = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+FLOOD_IPS          = [f"203.0.113.{i}" for i in range(1, 6)]
+
+
+# ───────────── 요청 본문 ─────────────
+def _normal_payload(rnd: random.Random) -> dict:
+    if rnd.random() < 0.6:                          # 60%는 회원 트래픽 (generate 스크립트와 동일)
+        path, auth = rnd.choice(pools.member_paths), rnd.choice(pools.valid_auth_tokens)
+    else:
+        path, auth = rnd.choice(pools.public_paths), ""
+    return {
+        "ip"     : f"192.168.0.{rnd.randint(1, 100)}",
+        "method" : rnd.choice(pools.normal_method_type),
+        "path"   : path,
+        "headers": {
+            "User-Agent"   : rnd.choice(pools.normal_ua_list),
+            "Referer"      : rnd.choice(pools.normal_referers),
+            "Authorization": auth,
+            "Accept"       : rnd.choice(pools.normal_accept_type),
+        },
+        "cookies": {f"c{i}": "1" for i in range(rnd.randint(1, 5))},
+    }
+
+
+def _attack_payload(rnd: random.Random, kind: str) -> dict:
+    return {
+        "ip"     : rnd.choice(pools.abnormal_ips),
+        "method" : rnd.choice(pools.abnormal_methods),
+        "path"   : rnd.choice(pools.attack_paths[kind]),
+        "headers": {
+            "User-Agent"   : rnd.choice(pools.abnormal_uas),
+            "Referer"      : rnd.choice(pools.abnormal_referers),
+            "Authorization": rnd.choice(pools.abnormal_authorizations),
+            "Accept"       : rnd.choice(pools.abnormal_accepts),
+        },
+        "cookies": {f"c{i}": "1" for i in range(rnd.randint(0, 1))},
+    }
+
+
+def _flood_payload(rnd: random.Random) -> dict:
+    d = _normal_payload(rnd)
+    d["ip"] = rnd.choice(FLOOD_IPS)
+    return d
+
+
+def build_pools(mix: Dict[str, float], seed: int) -> Dict[str, List[bytes]]:
+    """종류별로 미리 직렬화한 요청 본문 목록."""
+    rnd = random.Random(seed)
+    out = {}
+    for kind in mix:
+        if kind == "normal":
+            make = _normal_payload
+        elif kind == "flood":
+            make = _flood_payload
+        elif kind in pools.attack_paths:
+            make = lambda r, k=kind: _attack_payload(r, k)
+        else:
+            raise ValueError(f"unknown mix kind: {kind}")
+        out[kind] = [json.dumps(make(rnd)).encode() for _ in range(PAYLOAD_POOL_SIZE)]
+    return out
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, float]:
+    if not spec:
+        attacks = list(pools.attack_paths)
+        mix = {"normal": 0.8}
+        mix.update({k: 0.2 / len(attacks) for k in attacks})
+        return mix
+    mix = {}
+    for part in spec.split(","):
+        k, _, v = part.partition("=")
+        mix[k.strip()] = float(v)
+    total = sum(mix.values())
+    return {k: v / total for k, v in mix.items() if v > 0}
+
+
+def parse_ramp(spec: str) -> List[Tuple[float, float]]:
+    """ "200:10,800:20" → [(200, 10), (800, 20)] (rate, 초)"""
+    steps = []
+    for part in spec.split(","):
+        r, _, d = part.partition(":")
+        steps.append((float(r), float(d)))
+    return steps
+
+
+# ───────────── HTTP/1.1 keep-alive 연결 ─────────────
+class _Conn:
+    def __init__(self, host: str, port: int, path: str):
+        self.host, self.port, self.path = host, port, path
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._head = (f"POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                      "Content-Type: application/json\r\nConnection: keep-alive\r\n").encode()
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def post(self, body: bytes) -> Tuple[int, bytes]:
+        if self.writer is None:
+            await self._open()
+        try:
+            self.writer.write(self._head + b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            return await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()                            # 서버가 keep-alive 를 끊었으면 한 번 다시 연결
+            await self._open()
+            self.writer.write(self._head + b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            return await self._read_response()
+
+    async def _read_response(self) -> Tuple[int, bytes]:
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split(b" ", 2)[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"transfer-encoding" and b"chunked" in value.lower():
+                chunked = True
+            elif name == b"connection" and b"close" in value.lower():
+                close = True
+        if chunked:
+            parts = []
+            while True:
+                n = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if n == 0:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                parts.append(await self.reader.readexactly(n + 2))
+            body = b"".join(p[:-2] for p in parts)
+        else:
+            body = await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status, body
+
+
+# ───────────── 결과 집계 ─────────────
+class Stats:
+    def __init__(self):
+        self.lat_ms: List[float] = []
+        self.per_sec: Dict[int, List[float]] = {}
+        self.verdicts: Counter = Counter()
+        self.status: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.late = 0
+
+    def record(self, t_rel: float, lat_ms: float, kind: str, status: int, body: bytes):
+        self.lat_ms.append(lat_ms)
+        self.per_sec.setdefault(int(t_rel), []).append(lat_ms)
+        self.status[status] += 1
+        verdict = "http_%d" % status
+        if status == 200:
+            try:
+                r = json.loads(body)
+                verdict = r.get("method", "?") if r.get("anomaly") != "error" else "error"
+            except ValueError:
+                verdict = "bad_json"
+        self.verdicts[(kind, verdict)] += 1
+
+    def report(self, elapsed: float) -> dict:
+        lat = np.asarray(self.lat_ms) if self.lat_ms else np.zeros(1)
+        hist = np.histogram(lat, bins=(0,) + HIST_EDGES_MS + (float("inf"),))[0]
+        edges = ("≤%gms" % e for e in HIST_EDGES_MS)
+        return {
+            "requests"    : len(self.lat_ms),
+            "seconds"     : round(elapsed, 2),
+            "rps"         : round(len(self.lat_ms) / elapsed, 1) if elapsed else 0.0,
+            "latency_ms"  : {f"p{p:g}": round(float(np.percentile(lat, p)), 2) for p in (50, 90, 99, 99.9)},
+            "histogram_ms": dict(zip(list(edges) + [">%gms" % HIST_EDGES_MS[-1]], hist.tolist())),
+            "status"      : dict(self.status),
+            "verdicts"    : {f"{k}/{v}": c for (k, v), c in sorted(self.verdicts.items())},
+            "errors"      : dict(self.errors),
+            "late"        : self.late,
+            "timeline"    : [{"t": t, "rps": len(v), "p99_ms": round(float(np.percentile(v, 99)), 2)}
+                             for t, v in sorted(self.per_sec.items())],
+        }
+
+
+# ───────────── 부하 실행 ─────────────
+class LoadGen:
+    def __init__(self, url: str, mix: Dict[str, float], seed: int = 0):
+        u = urlsplit(url)
+        self.host, self.port, self.path = u.hostname or "127.0.0.1", u.port or 80, u.path or "/detect"
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.bodies = build_pools(mix, seed)
+        self.rnd = random.Random(seed + 1)
+        self.stats = Stats()
+
+    def _pick(self) -> Tuple[str, bytes]:
+        kind = self.rnd.choices(self.kinds, self.weights)[0]
+        return kind, self.rnd.choice(self.bodies[kind])
+
+    async def _send(self, conn: _Conn, t0: float, sched: float, kind: str, body: bytes):
+        try:
+            status, resp = await conn.post(body)
+        except Exception as e:
+            conn.close()
+            self.stats.errors[type(e).__name__] += 1
+            return
+        now = time.perf_counter()
+        self.stats.record(sched - t0, (now - sched) * 1e3, kind, status, resp)
+
+    async def closed_loop(self, concurrency: int, duration: float):
+        t0 = time.perf_counter()
+        end = t0 + duration
+
+        async def worker():
+            conn = _Conn(self.host, self.port, self.path)
+            while time.perf_counter() < end:
+                kind, body = self._pick()
+                await self._send(conn, t0, time.perf_counter(), kind, body)
+            conn.close()
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - t0
+
+    async def open_loop(self, steps: List[Tuple[float, float]], connections: int, linear: bool):
+        """steps: [(rate, 초)]. linear 면 직전 rate 에서 다음 rate 로 선형 증가."""
+        queue: asyncio.Queue = asyncio.Queue()
+        t0 = time.perf_counter()
+
+        async def worker():
+            conn = _Conn(self.host, self.port, self.path)
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                sched, kind, body = item
+                await self._send(conn, t0, sched, kind, body)
+            conn.close()
+
+        workers = [asyncio.create_task(worker()) for _ in range(connections)]
+        # 예정 시각 계산: 구간 안에서 순간 rate 를 적분해 다음 발사 시각을 정함
+        t, prev_rate = 0.0, 0.0
+        for rate, dur in steps:
+            start, stop = t, t + dur
+            slope = (rate - prev_rate) / dur if linear else 0.0
+            while t < stop:
+                r = prev_rate + slope * (t - start) if linear else rate
+                # r·dt + slope·dt²/2 = 1 을 만족하는 dt (slope 0 이면 1/r)
+                disc = r * r + 2 * slope
+                if disc <= 0 or (slope == 0 and r <= 0):
+                    break                           # 구간 안에 더 보낼 요청이 없음
+                dt = 1.0 / r if slope == 0 else (disc ** 0.5 - r) / slope
+                sched = t0 + t
+                delay = sched - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if queue.qsize() >= MAX_BACKLOG:
+                    self.stats.late += 1            # 연결이 모자라 밀린 요청은 버리고 집계만
+                else:
+                    kind, body = self._pick()
+                    queue.put_nowait((sched, kind, body))
+                t += dt
+            t, prev_rate = max(t, stop), rate
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers)
+        return time.perf_counter() - t0
+
+
+def _print(rep: dict):
+    print(f"requests {rep['requests']}  {rep['seconds']} s  → {rep['rps']} req/s   late {rep['late']}")
+    print("latency ms", rep["latency_ms"])
+    print("histogram ", rep["histogram_ms"])
+    print("status    ", rep["status"], " errors", rep["errors"])
+    print("verdicts  ")
+    for k, c in rep["verdicts"].items():
+        print(f"  {k:<32}{c:>8}")
+    print("timeline (초, rps, p99 ms)")
+    for row in rep["timeline"]:
+        print(f"  {row['t']:>4}  {row['rps']:>7}  {row['p99_ms']:>9}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="/detect 부하 생성기")
+    ap.add_argument("--url", default=DEFAULT_URL)
+    ap.add_argument("--mix", help='예) "normal=0.8,xss=0.1,flood=0.1" (기본: normal 0.8 + 공격 유형 균등)')
+    ap.add_argument("--concurrency", type=int, help="닫힌 루프 동시 연결 수")
+    ap.add_argument("--rate", type=float, help="열린 루프 초당 요청 수 (--duration 동안 일정)")
+    ap.add_argument("--ramp", help='열린 루프 단계 "rate:초,rate:초,..."')
+    ap.add_argument("--ramp-mode", choices=("step", "linear"), default="step")
+    ap.add_argument("--connections", type=int, default=64, help="열린 루프 keep-alive 연결 수")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="결과를 JSON 파일로 저장")
+    args = ap.parse_args(argv)
+
+    gen = LoadGen(args.url, parse_mix(args.mix), args.seed)
+    if args.ramp or args.rate:
+        steps = parse_ramp(args.ramp) if args.ramp else [(args.rate, args.duration)]
+        elapsed = asyncio.run(gen.open_loop(steps, args.connections, args.ramp_mode == "linear"))
+    else:
+        elapsed = asyncio.run(gen.closed_loop(args.concurrency or 32, args.duration))
+
+    rep = gen.stats.report(elapsed)
+    _print(rep)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
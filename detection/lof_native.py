@@ -0,0 +1,277 @@
+# lof_native.py
+"""
+LocalOutlierFactor(novelty=True) 추론기 (학습 점의 k-거리 / lrd 를 미리 계산해 두고 kNN 만 수행)
+──────────────────────────────────────────────
+  - TreeLOF       : 학습 점 전체 + KD-tree. sklearn 과 같은 식으로 계산하므로 판정이 같음
+                    (파이프라인에 들어 있는 트리를 그대로 쓰면 kNN 결과도 동일)
+                    질의 비용 O(log N) → 학습 데이터가 커져도 거의 일정
+  - PrototypeLOF  : 학습 점을 k-means 대표점 P 개로 압축 (대표점마다 소속 점 수 / 평균 k-거리 / 평균 lrd).
+                    소속 점 수만큼 같은 위치에 점이 있는 것으로 보고 가까운 대표점부터 k 개를 채움.
+                    질의 비용 O(P) 로 학습 데이터 크기와 무관. 근사이므로 offset 은 학습 표본에서 다시 맞춤
+  - fit()         : sklearn 없이 스케일된 학습 행렬에서 바로 기준 집합 생성 (큰 캡처 재학습용)
+
+사용법
+  python lof_native.py [lof_model.pkl] [--prototypes 1024] [--scale 5000,50000,200000]
+    → traffic_log.csv 로 정확도(판정 일치율 / 점수 오차)와 1행·배치 지연 보고,
+      --scale 이면 합성 학습 데이터 크기별 지연 비교
+"""
+
+from __future__ import annotations
+import argparse, os, sys, time
+from typing import Tuple
+
+import numpy as np
+
+LRD_EPS = 1e-10     # sklearn 과 같은 값 (중복 점이 k 개보다 많을 때 0 나눗셈 방지)
+
+
+class _LOFBase:
+    """스케일링 + decision_function / predict (score_samples 는 하위 클래스)."""
+    __slots__ = ("mean", "scale", "k", "offset")
+
+    def _scaled(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return (X - self.mean) / self.scale
+
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X) -> np.ndarray:
+        pred = np.ones(len(np.atleast_2d(X)), dtype=int)
+        pred[self.decision_function(X) < 0] = -1
+        return pred
+
+
+class TreeLOF(_LOFBase):
+    """학습 점 전체에 대한 정확한 kNN (KD-tree)."""
+    __slots__ = ("fit_X", "kdist", "lrd", "_tree")
+
+    def __init__(self, mean, scale, k, fit_X, kdist, lrd, offset, tree=None):
+        self.mean, self.scale = np.asarray(mean, np.float64), np.asarray(scale, np.float64)
+        self.k, self.offset = int(k), float(offset)
+        self.fit_X = np.ascontiguousarray(fit_X, dtype=np.float64)
+        self.kdist = np.ascontiguousarray(kdist, dtype=np.float64)   # 학습 점별 k 번째 이웃 거리
+        self.lrd   = np.ascontiguousarray(lrd, dtype=np.float64)     # 학습 점별 local reachability density
+        self._tree = tree
+
+    @property
+    def tree(self):
+        if self._tree is None:                  # 배열만 적재한 경우 첫 질의 때 한 번 생성
+            from sklearn.neighbors import KDTree
+            self._tree = KDTree(self.fit_X)
+        return self._tree
+
+    def score_samples(self, X) -> np.ndarray:
+        dist, ind = self.tree.query(self._scaled(X), k=self.k)
+        # sklearn LocalOutlierFactor.score_samples 와 같은 식 / 같은 연산 순서
+        reach = np.maximum(dist, self.kdist[ind])
+        lrd_x = 1.0 / (np.mean(reach, axis=1) + LRD_EPS)
+        return -np.mean(self.lrd[ind] / lrd_x[:, np.newaxis], axis=1)
+
+    def arrays(self) -> dict:
+        return {"mean": self.mean, "scale": self.scale, "k": self.k, "fit_X": self.fit_X,
+                "kdist": self.kdist, "lrd": self.lrd, "offset": self.offset}
+
+
+class PrototypeLOF(_LOFBase):
+    """k-means 대표점으로 압축한 기준 집합에 대한 근사 LOF."""
+    __slots__ = ("protos", "count", "kdist", "lrd", "_sq")
+
+    def __init__(self, mean, scale, k, protos, count, kdist, lrd, offset):
+        self.mean, self.scale = np.asarray(mean, np.float64), np.asarray(scale, np.float64)
+        self.k, self.offset = int(k), float(offset)
+        self.protos = np.ascontiguousarray(protos, dtype=np.float64)
+        self.count  = np.ascontiguousarray(count, dtype=np.float64)  # 대표점에 속한 학습 점 수
+        self.kdist  = np.ascontiguousarray(kdist, dtype=np.float64)
+        self.lrd    = np.ascontiguousarray(lrd, dtype=np.float64)
+        self._sq    = np.einsum("ij,ij->i", self.protos, self.protos)
+
+    def score_samples(self, X) -> np.ndarray:
+        Xs = self._scaled(X)
+        # 전수 거리 (P 가 작으므로 행렬곱 한 번)
+        d2 = np.einsum("ij,ij->i", Xs, Xs)[:, None] - 2.0 * Xs @ self.protos.T + self._sq
+        m = min(self.k, len(self.protos))        # 대표점마다 점이 1 개 이상이므로 k 개면 충분
+        near = np.argpartition(d2, m - 1, axis=1)[:, :m]
+        order = np.take_along_axis(d2, near, axis=1).argsort(axis=1)
+        near = np.take_along_axis(near, order, axis=1)
+        dist = np.sqrt(np.maximum(np.take_along_axis(d2, near, axis=1), 0.0))
+
+        # 가까운 대표점부터 소속 점 수만큼 채워 k 개의 이웃을 만든 가중치
+        c = self.count[near]
+        before = np.cumsum(c, axis=1) - c
+        w = np.clip(self.k - before, 0.0, c)
+        wsum = w.sum(axis=1)
+
+        reach = np.maximum(dist, self.kdist[near])
+        lrd_x = 1.0 / ((w * reach).sum(axis=1) / wsum + LRD_EPS)
+        return -((w * self.lrd[near]).sum(axis=1) / wsum) / lrd_x
+
+    def arrays(self) -> dict:
+        return {"mean": self.mean, "scale": self.scale, "k": self.k, "protos": self.protos,
+                "count": self.count, "kdist": self.kdist, "lrd": self.lrd, "offset": self.offset}
+
+
+# ───────────── 기준 집합 계산 ─────────────
+def _knn_excluding_self(tree, Xs: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """학습 점마다 자기 자신을 뺀 k 이웃 (sklearn kneighbors(X=None) 과 같은 규칙)."""
+    dist, ind = tree.query(Xs, k=k + 1)
+    self_hit = ind == np.arange(len(Xs))[:, None]
+    self_hit[~self_hit.any(axis=1), -1] = True  # 중복 점 때문에 자신이 안 나왔으면 마지막을 버림
+    keep = ~self_hit
+    return dist[keep].reshape(len(Xs), k), ind[keep].reshape(len(Xs), k)
+
+
+def _reference(dist: np.ndarray, ind: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """학습 kNN → (k-거리, lrd, negative_outlier_factor)."""
+    kdist = dist[:, -1]
+    lrd = 1.0 / (np.mean(np.maximum(dist, kdist[ind]), axis=1) + LRD_EPS)
+    nof = -np.mean(lrd[ind] / lrd[:, np.newaxis], axis=1)
+    return kdist, lrd, nof
+
+
+def _offset(nof: np.ndarray, contamination) -> float:
+    if contamination == "auto":
+        return -1.5
+    return float(np.percentile(nof, 100.0 * contamination))
+
+
+def fit(Xs: np.ndarray, n_neighbors: int = 20, contamination=0.1,
+        mean=None, scale=None) -> TreeLOF:
+    """스케일된 학습 행렬에서 바로 TreeLOF 생성 (sklearn LOF fit 과 같은 값)."""
+    from sklearn.neighbors import KDTree
+    Xs = np.ascontiguousarray(Xs, dtype=np.float64)
+    k = min(n_neighbors, len(Xs) - 1)
+    tree = KDTree(Xs)
+    kdist, lrd, nof = _reference(*_knn_excluding_self(tree, Xs, k))
+    nf = Xs.shape[1]
+    return TreeLOF(np.zeros(nf) if mean is None else mean, np.ones(nf) if scale is None else scale,
+                   k, Xs, kdist, lrd, _offset(nof, contamination), tree)
+
+
+def export(model) -> TreeLOF:
+    """학습된 [StandardScaler →] LocalOutlierFactor(novelty=True) 파이프라인을 TreeLOF 로."""
+    from sklearn.neighbors import LocalOutlierFactor
+    from sklearn.preprocessing import StandardScaler
+
+    steps = [s for _, s in model.steps] if hasattr(model, "steps") else [model]
+    lof = steps[-1]
+    if not isinstance(lof, LocalOutlierFactor) or not lof.novelty:
+        raise ValueError(f"last step is not LocalOutlierFactor(novelty=True): {type(lof).__name__}")
+    if lof.effective_metric_ != "euclidean":
+        raise ValueError(f"unsupported metric: {lof.effective_metric_}")
+    if len(steps) > 2 or any(not isinstance(s, StandardScaler) for s in steps[:-1]):
+        raise ValueError("only a single StandardScaler step is supported")
+    nf = lof.n_features_in_
+    mean, scale = np.zeros(nf), np.ones(nf)
+    if len(steps) == 2:
+        mean = steps[0].mean_ if steps[0].mean_ is not None else mean
+        scale = steps[0].scale_ if steps[0].scale_ is not None else scale
+
+    k = lof.n_neighbors_
+    kdist = lof._distances_fit_X_[:, k - 1]
+    tree = lof._tree if lof._fit_method in ("kd_tree", "ball_tree") else None
+    return TreeLOF(mean, scale, k, lof._fit_X, kdist, lof._lrd, lof.offset_, tree)
+
+
+def compress(ref: TreeLOF, n_prototypes: int = 1024, contamination=0.1,
+             sample: int = 20000, seed: int = 0) -> PrototypeLOF:
+    """TreeLOF 기준 집합을 k-means 대표점으로 압축. offset 은 학습 표본의 근사 점수로 다시 맞춤."""
+    from sklearn.cluster import MiniBatchKMeans
+    X = ref.fit_X
+    p = min(n_prototypes, len(X))
+    km = MiniBatchKMeans(n_clusters=p, random_state=seed, n_init=3,
+                         batch_size=max(1024, 4 * p)).fit(X)
+    label = km.labels_
+    count = np.bincount(label, minlength=p).astype(np.float64)
+    used = count > 0
+    kdist = np.bincount(label, weights=ref.kdist, minlength=p)[used] / count[used]
+    lrd = np.bincount(label, weights=ref.lrd, minlength=p)[used] / count[used]
+    proto = PrototypeLOF(ref.mean, ref.scale, ref.k, km.cluster_centers_[used],
+                         count[used], kdist, lrd, 0.0)
+
+    # 원래 판정 비율(contamination)이 유지되도록 학습 표본의 근사 점수로 offset 재계산
+    rnd = np.random.default_rng(seed)
+    idx = rnd.choice(len(X), size=min(sample, len(X)), replace=False)
+    raw = proto.score_samples(X[idx] * ref.scale + ref.mean)
+    proto.offset = _offset(raw, contamination) if contamination != "auto" else ref.offset
+    return proto
+
+
+# ───────────── 정확도 / 지연 보고 ─────────────
+def accuracy(exact, approx, X: np.ndarray) -> dict:
+    """exact 대비 approx 의 판정 일치율 / 점수 오차."""
+    se, sa = exact.score_samples(X), approx.score_samples(X)
+    pe, pa = exact.predict(X), approx.predict(X)
+    return {
+        "rows"           : len(X),
+        "agreement"      : round(float(np.mean(pe == pa)), 4),
+        "false_positive" : int(np.sum((pa == -1) & (pe == 1))),   # approx 만 이상치
+        "false_negative" : int(np.sum((pa == 1) & (pe == -1))),   # approx 가 놓친 이상치
+        "score_mae"      : float(np.mean(np.abs(se - sa))),
+        "score_max_err"  : float(np.max(np.abs(se - sa))),
+    }
+
+
+def latency_us(model, X: np.ndarray, batch: int = 1, repeat: int = 200) -> float:
+    rows = X[:batch]
+    model.predict(rows)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        model.predict(rows)
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def _synthetic(n: int, nf: int, seed: int = 0) -> np.ndarray:
+    """가우시안 혼합 합성 학습 데이터 (스케일된 공간)."""
+    rnd = np.random.default_rng(seed)
+    centers = rnd.normal(0, 3, (32, nf))
+    return centers[rnd.integers(0, 32, n)] + rnd.normal(0, 1, (n, nf))
+
+
+def main(argv=None) -> int:
+    import joblib, warnings
+    warnings.filterwarnings("ignore")
+    base = os.path.dirname(os.path.abspath(__file__))
+    ap = argparse.ArgumentParser(description="LOF 추론기 정확도 / 지연 보고")
+    ap.add_argument("model", nargs="?", default=os.path.join(base, "lof_model.pkl"))
+    ap.add_argument("--prototypes", type=int, default=1024)
+    ap.add_argument("--scale", help="합성 학습 데이터 크기 목록 (예: 5000,50000,200000)")
+    args = ap.parse_args(argv)
+
+    model = joblib.load(args.model)
+    lof = model.steps[-1][1] if hasattr(model, "steps") else model
+    tree = export(model)
+    proto = compress(tree, args.prototypes, lof.contamination)
+
+    from bench_replay import DEFAULT_INPUT, load_requests
+    import ml_detection
+    X = np.vstack([ml_detection._feature_row(d) for d in load_requests(DEFAULT_INPUT)])
+    rnd = np.random.default_rng(0)
+    X = np.vstack([X, X * rnd.normal(1, 0.3, X.shape)])
+
+    print(f"기준 점 {len(tree.fit_X)}, k={tree.k}, 대표점 {len(proto.protos)}, 평가 행 {len(X)}")
+    same = int(np.count_nonzero(model.decision_function(X) != tree.decision_function(X)))
+    print(f"tree      sklearn 대비 decision_function 불일치 {same}")
+    print(f"prototype {accuracy(model, proto, X)}")
+    for name, m in (("sklearn", model), ("tree", tree), ("prototype", proto)):
+        print(f"{name:<10} 1행 {latency_us(m, X):9.1f} µs   256행 {latency_us(m, X, 256, 20):10.1f} µs")
+
+    if args.scale:
+        print(f"{'N':>9}{'fit s':>8}{'tree 1행 µs':>13}{'proto 1행 µs':>14}{'agreement':>11}")
+        for n in (int(s) for s in args.scale.split(",")):
+            train = _synthetic(n, X.shape[1])
+            t0 = time.perf_counter()
+            ref = fit(train, tree.k, lof.contamination)
+            fit_s = time.perf_counter() - t0
+            pr = compress(ref, args.prototypes, lof.contamination)
+            probe = np.vstack([_synthetic(2000, X.shape[1], seed=1), rnd.normal(0, 8, (200, X.shape[1]))])
+            acc = accuracy(ref, pr, probe)
+            print(f"{n:>9}{fit_s:>8.1f}{latency_us(ref, probe):>13.1f}{latency_us(pr, probe):>14.1f}"
+                  f"{acc['agreement']:>11}")
+    return 0 if same == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
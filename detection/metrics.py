@@ -0,0 +1,225 @@
+# metrics.py
+"""
+Prometheus 텍스트 형식 메트릭 (외부 의존성 없음)
+──────────────────────────────────────────────
+  - Counter / Histogram 은 스레드별 샤드에 기록 → 기록 경로에 잠금 없음, 수집 시 합산
+  - Gauge 는 수집 시점에 콜백으로 값을 읽음 (상태 저장소 크기, 실행기 대기열 등)
+  - process 실행 모드: 자식 프로세스가 누적 스냅샷을 결과에 실어 보내면(export / merge)
+    부모가 자식별 최신 스냅샷을 더해서 노출
+"""
+
+from __future__ import annotations
+import bisect, itertools, os, threading, time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# ───────────── 설정 상수 ─────────────
+# 지연 시간 버킷 (초): 10µs ~ 2.5s
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3,
+                   5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5)
+METRICS_PUSH_SEC = float(os.getenv("METRICS_PUSH_SEC", "1"))   # 자식 → 부모 스냅샷 전송 간격
+# rule_detect 단계별 시간은 N 건 중 1 건만 재고 가중치 N 으로 기록 (1 이면 전수)
+METRICS_STAGE_SAMPLE = max(1, int(os.getenv("METRICS_STAGE_SAMPLE", "16")))
+
+_registry: List["_Metric"] = []
+_gauge_fns: List[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]] = []
+_remote: Dict[int, dict] = {}          # 자식 pid → 최신 누적 스냅샷
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_num(v: float) -> str:
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+        _registry.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.d
+        except AttributeError:
+            d = self._local.d = {}
+            with self._shards_lock:          # 스레드당 한 번만
+                self._shards.append(d)
+            return d
+
+    def _merged(self) -> dict:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, n: float = 1.0):
+        d = self._shard()
+        d[labels] = d.get(labels, 0.0) + n
+
+    def _merged(self) -> dict:
+        out: dict = {}
+        for d in list(self._shards):
+            for k, v in d.copy().items():
+                out[k] = out.get(k, 0.0) + v
+        return out
+
+    def _add(self, out: dict, snap: dict):
+        for k, v in snap.items():
+            out[k] = out.get(k, 0.0) + v
+
+    def _lines(self, merged: dict) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_num(v)}"
+                for k, v in sorted(merged.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._nb = len(self.buckets) + 1
+
+    def observe(self, value: float, *labels: str, n: int = 1):
+        """n: 표본 가중치 (N 건 중 1 건만 잴 때 N)."""
+        d = self._shard()
+        h = d.get(labels)
+        if h is None:
+            h = d[labels] = [0] * self._nb + [0.0]   # 버킷별 개수(+Inf 포함) + 합계
+        h[bisect.bisect_left(self.buckets, value)] += n
+        h[-1] += value * n
+
+    def _merged(self) -> dict:
+        out: dict = {}
+        for d in list(self._shards):
+            self._add(out, d.copy())
+        return out
+
+    def _add(self, out: dict, snap: dict):
+        for k, h in snap.items():
+            acc = out.get(k)
+            if acc is None:
+                out[k] = list(h)
+            else:
+                for i, v in enumerate(h):
+                    acc[i] += v
+
+    def _lines(self, merged: dict) -> List[str]:
+        lines = []
+        for k, h in sorted(merged.items()):
+            cum = 0
+            for le, c in zip(self.buckets, h):
+                cum += c
+                le_label = 'le="%s"' % le
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, le_label)} {cum}")
+            cum += h[self._nb - 1]
+            inf_label = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, inf_label)} {cum}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, k)} {_fmt_num(h[-1])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, k)} {cum}")
+        return lines
+
+
+def gauge_fn(fn: Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]):
+    """수집 시 호출되는 게이지 콜백 등록. fn() → (이름, 설명, 레이블 dict, 값) 목록."""
+    _gauge_fns.append(fn)
+    return fn
+
+
+_stage_tick = itertools.count()
+
+def sample_stage() -> bool:
+    """이번 rule_detect 호출의 단계별 시간을 잴지 (METRICS_STAGE_SAMPLE 건마다 한 번)."""
+    return next(_stage_tick) % METRICS_STAGE_SAMPLE == 0
+
+
+# ───────────── 자식 프로세스 스냅샷 ─────────────
+_last_push = 0.0
+
+def export(force: bool = False) -> Optional[dict]:
+    """이 프로세스의 누적 값 스냅샷. METRICS_PUSH_SEC 안에 다시 부르면 None."""
+    global _last_push
+    now = time.monotonic()
+    if not force and now - _last_push < METRICS_PUSH_SEC:
+        return None
+    _last_push = now
+    return {"pid": os.getpid(), "metrics": {m.name: m._merged() for m in _registry}}
+
+
+def merge(snap: Optional[dict]):
+    """자식 프로세스 스냅샷 반영 (같은 pid 는 최신 값으로 교체)."""
+    if snap:
+        _remote[snap["pid"]] = snap["metrics"]
+
+
+# ───────────── 노출 ─────────────
+def render() -> str:
+    out: List[str] = []
+    for m in _registry:
+        merged = m._merged()
+        for snap in list(_remote.values()):
+            m._add(merged, snap.get(m.name, {}))
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        out.extend(m._lines(merged))
+
+    seen = set()
+    for fn in _gauge_fns:
+        try:
+            samples = list(fn())
+        except Exception:
+            continue
+        for name, help, labels, value in samples:
+            if name not in seen:
+                seen.add(name)
+                out.append(f"# HELP {name} {help}")
+                out.append(f"# TYPE {name} gauge")
+            names = tuple(labels)
+            out.append(f"{name}{_fmt_labels(names, tuple(labels[n] for n in names))} {_fmt_num(value)}")
+    return "\n".join(out) + "\n"
+
+
+def flatten(prefix: str, help: str, d: dict) -> List[Tuple[str, str, Dict[str, str], float]]:
+    """stats() 류의 중첩 dict 에서 숫자 값만 골라 게이지 샘플로 변환 (키 경로 → 메트릭 이름)."""
+    out = []
+    for k, v in d.items():
+        name = f"{prefix}_{k}"
+        if isinstance(v, dict):
+            out.extend(flatten(name, help, v))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out.append((name, help, {}, float(v)))
+    return out
+
+
+# ───────────── 공용 메트릭 ─────────────
+STAGE_SECONDS = Histogram("waf_rule_stage_duration_seconds",
+                          "rule_detect 단계별 소요 시간", ("stage",))
+RULE_BLOCKS   = Counter("waf_rule_blocks_total",
+                        "rule_detect 를 차단으로 끝낸 단계", ("stage",))
+RULE_CACHE    = Counter("waf_rule_cache_total",
+                        "rule_detect 판정 캐시 조회 결과 (hit / miss)", ("cache", "result"))
+ML_SECONDS    = Histogram("waf_ml_duration_seconds",
+                          "ML 특징 추출 / 추론 소요 시간", ("op",))
+ML_ROWS       = Counter("waf_ml_rows_total", "ML 추론한 행 수", ("op",))
+VERDICTS      = Counter("waf_verdicts_total", "판정 결과 (rule / ml / normal / error)", ("method",))
+REQUEST_SECONDS = Histogram("waf_request_duration_seconds",
+                            "탐지 엔드포인트 전체 처리 시간", ("endpoint",))
+LOOP_LAG      = Histogram("waf_event_loop_lag_seconds",
+                          "이벤트 루프 지연 (예정 깨어남 시각 대비 늦은 정도)")
@@ -0,0 +1,99 @@
+# microbatch.py
+"""
+동시 /detect 호출의 ML 추론을 모아 한 번에 처리하는 asyncio 마이크로 배처
+──────────────────────────────────────────────
+  - 대기 항목이 max_size 개가 되거나 max_wait_us 가 지나면(먼저 오는 쪽) flush
+  - flush 시 fn(items) 를 한 번 호출하고, 결과를 각 호출자의 future 로 전달
+  - 배치 크기 분포(batch_sizes)를 stats() 로 노출
+  - runner 를 주면 fn 을 이벤트 루프 대신 runner(fn, items) 로 실행 (executor.DetectExecutor.run)
+"""
+
+from __future__ import annotations
+import asyncio, os
+from typing import Any, Awaitable, Callable, List, Optional
+
+# ───────────── 설정 상수 ─────────────
+ML_BATCH_MAX_SIZE    = int(os.getenv("ML_BATCH_MAX_SIZE", "64"))
+ML_BATCH_MAX_WAIT_US = int(os.getenv("ML_BATCH_MAX_WAIT_US", "500"))
+
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], List[Any]],
+                 max_size: int = ML_BATCH_MAX_SIZE,
+                 max_wait_us: int = ML_BATCH_MAX_WAIT_US,
+                 runner: Optional[Callable[..., Awaitable[Any]]] = None):
+        self.fn          = fn          # list → 같은 순서의 결과 list
+        self.runner      = runner
+        self.max_size    = max(1, max_size)
+        self.max_wait    = max(0, max_wait_us) / 1e6
+        self._pending: list[tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # runner 로 실행 중인 배치 태스크 (이벤트 루프는 약한 참조만 가지므로 끝날 때까지 여기서 참조 유지)
+        self._tasks: set[asyncio.Task] = set()
+        # 배치 크기 분포: batch_sizes[n] = 크기 n 인 배치 수
+        self.batch_sizes = [0] * (self.max_size + 1)
+        self.batches = 0
+        self.items   = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        n = len(batch)
+        self.batch_sizes[n] += 1
+        self.batches += 1
+        self.items   += n
+        if self.runner is not None:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        try:
+            results = self.fn([item for item, _ in batch])
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self._resolve(batch, results)
+
+    async def _run(self, batch):
+        try:
+            results = await self.runner(self.fn, [item for item, _ in batch])
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self._resolve(batch, results)
+
+    @staticmethod
+    def _fail(batch, e):
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_exception(e)
+
+    @staticmethod
+    def _resolve(batch, results):
+        for (_, fut), r in zip(batch, results):
+            if not fut.done():
+                fut.set_result(r)
+
+    def stats(self) -> dict:
+        return {
+            "max_size"   : self.max_size,
+            "max_wait_us": int(self.max_wait * 1e6),
+            "batches"    : self.batches,
+            "items"      : self.items,
+            "mean_size"  : self.items / self.batches if self.batches else 0.0,
+            "sizes"      : {n: c for n, c in enumerate(self.batch_sizes) if c},
+        }
@@ -1,169 +1,227 @@
-import os, joblib, pandas as pd
-import math, time
+import os, joblib, numpy as np
+import hashlib, threading, time, warnings
 from collections import deque
-from urllib.parse import urlparse
+from typing import Optional
 
-# IP별 상태 저장을 위한 딕셔너리
-ip_states = {}
+import eventlog
+import features
+import iforest_native
+import lof_native
+import metrics
+import model_bundle
+import retrain
+import state_backend
+from parsed_request import as_parsed
+from sklearn import __version__ as sklearn_version
+
+# IP별 행동 상태 (시간 윈도우 특징 증분 유지). 룰 엔진과 같은 STATE_BACKEND 를 공유
+ip_states = state_backend.get_backend()
+
+# 시간 윈도우 특징에 쓰는 현재 시각. 재생 벤치마크(bench_replay.py)가 결정적 시계로 교체
+clock = time.time
+
+#────────────────── 특징 목록 정의 ──────────────────#
+# 학습(train_pipeline.py)과 같은 정의를 features.py 에서 가져옴
+_FEATURES = features.FEATURES
+
+_NF = len(_FEATURES)
+
+# 파이프라인은 DataFrame 으로 학습됐지만 추론은 ndarray 로 하므로 이름 경고는 무시
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
 #────────────────── 모델 로드 ──────────────────#
 BASE_DIR = os.path.dirname(__file__)
+# 번들(models/CURRENT)이 있으면 번들 하나만 적재하고 검증. 없을 때만 개별 pkl 파일 사용
+BUNDLE_ROOT     = os.getenv("ML_BUNDLE_ROOT", model_bundle.DEFAULT_ROOT)
 MODEL_PATH      = os.path.join(BASE_DIR, "model.pkl")
 LOF_MODEL_PATH  = os.path.join(BASE_DIR, "lof_model.pkl")
 ENC_METHOD_PATH = os.path.join(BASE_DIR, "enc_method.pkl")
 ENC_ACCEPT_PATH = os.path.join(BASE_DIR, "enc_accept.pkl")
 ENC_REF_PATH    = os.path.join(BASE_DIR, "enc_referer.pkl")
+# IsolationForest 를 NumPy 배열로 펼친 추론기 사용 (sklearn 과 같은 결과, 0 이면 sklearn predict)
+ML_NATIVE_IF    = os.getenv("ML_NATIVE_IF", "1") != "0"
+# LOF 추론 방식: tree (학습 점 + KD-tree, sklearn 과 같은 판정) | prototype (대표점 근사, 학습 크기와 무관한 지연) | sklearn
+ML_LOF_MODE     = os.getenv("ML_LOF_MODE", "tree")
+ML_LOF_PROTOTYPES = int(os.getenv("ML_LOF_PROTOTYPES", "1024"))
 
-_model = None
-_lof_model = None
-_model_none = True
-
-try:
-    # 이제 두 모델 모두 스케일러가 포함된 파이프라인입니다.
-    _model = joblib.load(MODEL_PATH)
-    _lof_model = joblib.load(LOF_MODEL_PATH)
-    _model_none = False
-except FileNotFoundError as e:
-    print(f"[MODEL LOAD ERROR] {e}")
-    _model_none = True
-    
-enc_method  = joblib.load(ENC_METHOD_PATH)
-enc_accept  = joblib.load(ENC_ACCEPT_PATH)
-enc_referer = joblib.load(ENC_REF_PATH)
-
+# 핫 리로드: 파일 감시 주기(초, 0 이면 끔) / 사전 검증 기준
+ML_RELOAD_POLL_SEC      = float(os.getenv("ML_RELOAD_POLL_SEC", "5"))
+ML_CANARY_SIZE          = int(os.getenv("ML_CANARY_SIZE", "512"))            # 최근 실트래픽 특징 행 보관 수
+ML_CANARY_MAX_RATE      = float(os.getenv("ML_CANARY_MAX_RATE", "0.5"))      # 새 모델 이상치 비율 상한
+ML_CANARY_MIN_AGREEMENT = float(os.getenv("ML_CANARY_MIN_AGREEMENT", "0.7")) # 최근 행에서 현재 모델과 판정 일치율 하한
 
-#────────────────── 특징 목록 정의 ──────────────────#
-_FEATURES = [
-    "path_depth",
-    "path_token_count",
-    "path_token_numeric_ratio",
-    "uri_entropy",
-    "auth_validity",
-    "referer_domain",
-    "method",
-    "accept_type",
-    "cookie_count",
-    "req_count",
-    "interval",
-    "req_count_in_last_10s",
-    "unique_paths_in_last_60s"
-]
-
-#────────────────── 엔트로피 계산 ──────────────────#
-def _calc_entropy(s: str) -> float:
-    if not s:
-        return 0.0
-    prob = [s.count(c) / len(s) for c in set(s)]
-    return -sum(p * math.log2(p) for p in prob)
-
-# ─── 인코딩 헬퍼 ───────────────────
-def _encode_method(v: str) -> int:
+def _load_legacy():
     try:
-        return enc_method.transform([v])[0]
-    except ValueError:
-        return -999
+        # 이제 두 모델 모두 스케일러가 포함된 파이프라인입니다.
+        model = joblib.load(MODEL_PATH)
+        lof_model = joblib.load(LOF_MODEL_PATH)
+    except FileNotFoundError as e:
+        eventlog.error("model_load_error", detail=str(e))
+        model = lof_model = None
+    encoders = [joblib.load(p) for p in (ENC_METHOD_PATH, ENC_ACCEPT_PATH, ENC_REF_PATH)]
+    return model, lof_model, encoders
 
-def _encode_accept(v: str) -> int:
-    try:
-        # 학습 시와 동일하게, 첫 번째 MIME 타입만 사용
-        main_type = v.split(',')[0].strip()
-        return enc_accept.transform([main_type])[0]
-    except (ValueError, IndexError):
-        # 처음 보는 타입이 들어오면, 가장 가능성이 높은 '기타'(*/*) 값으로 처리
+def _native_if(model):
+    if ML_NATIVE_IF:
         try:
-            return enc_accept.transform(["*/*"])[0]
-        except ValueError:
-            return -1 # 만약 학습 데이터에 */* 조차 없다면 -1 반환
+            return iforest_native.export(model)
+        except Exception as e:
+            eventlog.warning("iforest_native_export_error", detail=str(e))
+    return model
 
-def _encode_referer(v: str) -> int:
-    try:
-        domain = urlparse(v).netloc
-        val = domain if domain in enc_referer.classes_ else "__OTHER__"
-        return enc_referer.transform([val])[0]
-    except:
-        return enc_referer.transform(["__OTHER__"])[0]
-
-def _feature_vector(data: dict) -> pd.DataFrame:
-    def get_auth_validity(auth: str) -> int:
-        auth = str(auth)
-        if not auth or auth.lower() == 'nan':
-            return 0  # 헤더 없음
-        
-        parts = auth.split()
-        if len(parts) != 2:
-            return -1 # 형식 오류
-
-        scheme, token = parts
-        if scheme.lower() == 'bearer':
-            return 1 if token.count('.') == 2 else -1
-        elif scheme.lower() == 'basic':
-            return 1
-        
-        return -1
+def _native_lof(lof_model):
+    if ML_LOF_MODE in ("tree", "prototype"):
+        try:
+            pred = lof_native.export(lof_model)
+            if ML_LOF_MODE == "prototype":
+                pred = lof_native.compress(pred, ML_LOF_PROTOTYPES, lof_model.steps[-1][1].contamination)
+            return pred
+        except Exception as e:
+            eventlog.warning("lof_native_export_error", detail=str(e))
+    return lof_model
 
-    # ─── 상태 관리 ───
-    ip = data.get("ip", "127.0.0.1")
-    current_time = time.time()
-    if ip not in ip_states:
-        ip_states[ip] = {'requests': deque()}
-    
-    state = ip_states[ip]['requests']
-    while state and state[0][0] < current_time - 60:
-        state.popleft()
-
-    # ─── 데이터 추출 ───
-    headers = data.get("headers", {})
-    path = data.get("path", "/")
-    method = data.get("method", "GET")
-    accept_header = headers.get("Accept", "")
-    referer_header = headers.get("Referer", "")
-    authorization_header = headers.get("Authorization", "")
+#────────────────── 모델 묶음 (원자적 교체 단위) ──────────────────#
+def _codes(enc) -> dict:
+    # LabelEncoder.transform([v]) 대신 classes_ 로부터 미리 만든 dict 로 조회
+    return {str(c): i for i, c in enumerate(enc.classes_)}
+
+def _version_tag(version: str) -> float:
+    # 특징 행 끝에 붙이는 버전 표식 (float64 로 정확히 표현되는 48비트 정수)
+    return float(int(hashlib.sha1(version.encode()).hexdigest()[:12], 16))
+
+class _Models:
+    """한 번에 교체되는 모델 / 인코더 묶음. 요청은 시작할 때 잡은 묶음으로 끝까지 처리."""
+    __slots__ = ("version", "tag", "schema_hash", "meta", "if_model", "lof_pred",
+                 "method_code", "accept_code", "referer_code", "accept_default", "referer_other",
+                 "canary", "loaded_at")
+
+    def __init__(self, version, schema_hash, model, lof_model, enc_method, enc_accept, enc_referer,
+                 meta=None, canary=None):
+        self.version     = version
+        self.tag         = _version_tag(version)
+        self.schema_hash = schema_hash
+        self.meta        = meta or {}
+        self.if_model    = _native_if(model)        # 펼친 추론기 또는 원래 파이프라인
+        self.lof_pred    = _native_lof(lof_model)   # TreeLOF / PrototypeLOF 또는 원래 파이프라인
+        self.method_code  = _codes(enc_method)
+        self.accept_code  = _codes(enc_accept)
+        self.referer_code = _codes(enc_referer)
+        self.accept_default = self.accept_code.get("*/*", -1)   # 학습 데이터에 */* 조차 없다면 -1
+        self.referer_other  = self.referer_code.get("__OTHER__", -1)
+        self.canary    = canary
+        self.loaded_at = time.time()
+
+    def predict(self, X: np.ndarray) -> list:
+        # 두 모델 모두 스케일링 후 예측 (행 전체를 한 번에). 한 모델이라도 이상치(-1)면 True
+        pred_if = self.if_model.predict(X)
+        pred_lof = self.lof_pred.predict(X)
+        return [bool(a == -1 or b == -1) for a, b in zip(pred_if, pred_lof)]
+
+def _from_bundle(b) -> _Models:
+    if b.meta.get("sklearn") != sklearn_version:
+        eventlog.warning("model_bundle_sklearn_mismatch", version=b.version,
+                         trained=b.meta.get("sklearn"), running=sklearn_version)
+    return _Models(b.version, b.schema_hash, b.model, b.lof_model,
+                   b.enc_method, b.enc_accept, b.enc_referer, b.meta, b.canary)
+
+def _load_initial() -> Optional[_Models]:
+    if model_bundle.exists(BUNDLE_ROOT):
+        try:
+            return _from_bundle(model_bundle.load(BUNDLE_ROOT, expect_features=_FEATURES))
+        except model_bundle.BundleError as e:
+            # 인코더 / 모델이 섞일 수 있으므로 개별 pkl 로 대체하지 않고 ML 탐지를 끔
+            eventlog.error("model_bundle_error", detail=str(e))
+            return None
+    model, lof_model, encs = _load_legacy()
+    if model is None or lof_model is None:
+        return None
+    return _Models("legacy", model_bundle.schema_hash(_FEATURES, *encs), model, lof_model, *encs)
+
+_active: Optional[_Models] = _load_initial()     # 현재 모델 (None 이면 ML 탐지 끔)
+_previous: Optional[_Models] = None              # 직전 모델 (교체 직전에 특징을 뽑은 행 판정용)
+
+# ─── 인코딩 헬퍼 (m: 요청을 처리하는 모델 묶음의 인코더 조회표) ───
+def _encode_method(v: str, m: _Models) -> int:
+    return m.method_code.get(v, -999)
+
+def _encode_accept(v: str, m: _Models) -> int:
+    # 학습 시와 동일하게, 첫 번째 MIME 타입만 사용
+    # 처음 보는 타입이 들어오면, 가장 가능성이 높은 '기타'(*/*) 값으로 처리
+    return m.accept_code.get(features.accept_main(v), m.accept_default)
+
+def _encode_referer(v: str, m: _Models) -> int:
+    domain = features.referer_domain(v)
+    if domain is None:
+        return m.referer_other
+    return m.referer_code.get(domain, m.referer_other)
+
+def _fill_row(out: np.ndarray, data, window=None, m: Optional[_Models] = None) -> None:
+    """
+    요청 하나(ParsedRequest 또는 요청 본문 dict)의 특징을 _FEATURES 순서대로 out(float64 1차원 뷰)에 기록.
+    window: 미리 구한 ip_states.observe() 결과 (배치에서 한 번에 조회한 경우)
+    m: 인코딩에 쓸 모델 묶음 (None 이면 현재 모델)
+    """
+    m = m or _active
+    # ─── 데이터 추출 (헤더 이름은 파싱 때 소문자로 정규화됨) ───
+    p = as_parsed(data)
+    headers = p.headers
+    accept_header = headers.get("accept", "")
+    referer_header = headers.get("referer", "")
+    authorization_header = headers.get("authorization", "")
     
-    # ─── 시간 윈도우 특징 계산 ───
-    state.append((current_time, path))
-    req_count_in_last_10s = sum(1 for ts, _ in state if ts > current_time - 10)
-    paths_in_last_60s = {p for ts, p in state if ts > current_time - 60}
-    unique_paths_in_last_60s = len(paths_in_last_60s)
-
-    # ─── 특징 벡터 생성 ───
-    tokens = [t for t in path.strip("/").split("/") if t]
-
-    vec = pd.DataFrame([{
-        "path_depth"                : path.count("/"),
-        "path_token_count"          : len(tokens),
-        "path_token_numeric_ratio"  : sum(t.isnumeric() for t in tokens) / len(tokens) if tokens else 0.0,
-        "uri_entropy"               : _calc_entropy(path),
-        "auth_validity"             : get_auth_validity(authorization_header),
-        "referer_domain"            : _encode_referer(referer_header),
-        "method"                    : _encode_method(method),
-        "accept_type"               : _encode_accept(accept_header),
-        "cookie_count"              : len(data.get("cookies", {})),
-        "req_count"                 : len(state),
-        "interval"                  : current_time - state[-2][0] if len(state) > 1 else 0,
-        "req_count_in_last_10s"     : req_count_in_last_10s,
-        "unique_paths_in_last_60s": unique_paths_in_last_60s
-    }])
-
-    return vec.loc[:, _FEATURES]
+    # ─── 시간 윈도우 특징 (IP별 상태 갱신) ───
+    if window is None:
+        window = ip_states.observe(p.ip or "127.0.0.1", p.path, clock())
+    req_count, interval, req_count_in_last_10s, unique_paths_in_last_60s = window
+
+    # ─── 특징 벡터 생성 (_FEATURES 순서) ───
+    out[:] = (
+        *features.path_stats(p.path, p.path_tokens),  # path_depth, path_token_count, path_token_numeric_ratio, uri_entropy
+        features.auth_validity(authorization_header),                           # auth_validity
+        _encode_referer(referer_header, m),                                     # referer_domain
+        _encode_method(p.method, m),                                            # method
+        _encode_accept(accept_header, m),                                       # accept_type
+        p.cookie_count,                                                         # cookie_count
+        req_count,                                                              # req_count
+        interval,                                                               # interval
+        req_count_in_last_10s,                                                  # req_count_in_last_10s
+        unique_paths_in_last_60s,                                               # unique_paths_in_last_60s
+    )
+
+def _feature_row(data, m: Optional[_Models] = None) -> np.ndarray:
+    row = np.empty(_NF, dtype=np.float64)
+    _fill_row(row, data, m=m)
+    return row
+
+def _feature_vector(data) -> np.ndarray:
+    return _feature_row(data).reshape(1, _NF)
 
 
 #────────────────── 추론 API ───────────────────#
-def ml_detect(data: dict) -> bool:
-    if _model_none:
+# 최근 판정한 실트래픽 특징 행 (핫 리로드 사전 검증용)
+_recent: deque = deque(maxlen=ML_CANARY_SIZE)
+
+def _predict_matrix(X: np.ndarray, m: Optional[_Models] = None) -> list:
+    return (m or _active).predict(X)
+
+def ml_detect(data) -> bool:
+    m = _active
+    if m is None:
         return False
+    t0 = time.perf_counter()
     try:
-        vec = _feature_vector(data)
+        vec = _feature_row(data, m).reshape(1, _NF)
         
-        # 디버깅을 위해 피처 벡터 출력
-        print("\n[DEBUG] Feature Vector:")
-        print(vec.to_string())
+        # 디버깅을 위해 피처 벡터 출력 (DEBUG 레벨이 아니면 dict 도 만들지 않음)
+        if eventlog.enabled(eventlog.DEBUG):
+            eventlog.debug("ml_features", features=dict(zip(_FEATURES, vec[0].tolist())))
 
         # 두 파이프라인 모델이 알아서 스케일링 후 예측
-        pred_if = _model.predict(vec)[0]
-        pred_lof = _lof_model.predict(vec)[0]
+        pred_if = m.if_model.predict(vec)[0]
+        pred_lof = m.lof_pred.predict(vec)[0]
 
         # 디버그 출력
-        print(f"[ML DETECT DEBUG] IF: {pred_if}, LOF: {pred_lof}")
+        eventlog.debug("ml_predict", IF=int(pred_if), LOF=int(pred_lof))
 
         # 한 모델이라도 이상치(-1)로 판단하면 True 반환
         if pred_if == -1 or pred_lof == -1:
@@ -172,5 +230,236 @@ def ml_detect(data: dict) -> bool:
         return False
 
     except Exception as e:
-        print(f"[ML DETECT ERROR] {e}")
+        eventlog.error("ml_error", detail=str(e))
         return False
+    finally:
+        metrics.ML_SECONDS.observe(time.perf_counter() - t0, "detect")
+        metrics.ML_ROWS.inc("detect")
+
+def ml_features(data):
+    """
+    IP 상태를 갱신하고 특징 행을 반환 (data: ParsedRequest 또는 요청 본문 dict). 모델이 없거나 실패하면 None.
+    행 끝에는 인코딩에 쓴 모델 버전 표식이 붙어 있어, 추론 전에 모델이 교체돼도 같은 모델로 판정.
+    """
+    m = _active
+    if m is None:
+        return None
+    t0 = time.perf_counter()
+    try:
+        row = np.empty(_NF + 1, dtype=np.float64)
+        _fill_row(row[:_NF], data, m=m)
+        row[_NF] = m.tag
+        return row
+    except Exception as e:
+        eventlog.error("ml_error", detail=str(e))
+        return None
+    finally:
+        metrics.ML_SECONDS.observe(time.perf_counter() - t0, "features")
+
+def _offer_normal(X: np.ndarray, hits, m: _Models):
+    # 재학습 표본에는 현재 모델도 정상으로 본 행만 넣음 (이상 행까지 넣으면 느린 공격이 재학습을 거쳐 정상으로 흡수됨)
+    keep = ~np.asarray(hits, dtype=bool)
+    if keep.any():
+        retrain.offer(X[keep], m.schema_hash)
+
+def _predict_tagged(X: np.ndarray) -> list:
+    # 표식이 붙은 행은 표식과 같은 모델로 (교체 직후 직전 모델로 인코딩된 행), 나머지는 현재 모델로
+    m, prev = _active, _previous
+    if X.shape[1] == _NF:
+        out = m.predict(X)
+        _recent.extend(X)
+        _offer_normal(X, out, m)
+        return out
+    tags, X = X[:, _NF], X[:, :_NF]
+    if prev is None or not (tags == prev.tag).any():
+        mine = tags == m.tag
+        _recent.extend(X[mine])
+        out = m.predict(X)
+        _offer_normal(X[mine], np.asarray(out, dtype=bool)[mine], m)
+        return out
+    out = [False] * len(X)
+    for model, sel in ((prev, tags == prev.tag), (m, tags != prev.tag)):
+        idx = np.flatnonzero(sel)
+        if len(idx):
+            for i, hit in zip(idx, model.predict(X[idx])):
+                out[i] = hit
+    return out
+
+def ml_predict_rows(rows: list) -> list:
+    """특징 행 목록을 한 번에 판정. 실패하면 전부 False."""
+    if not rows:
+        return []
+    if _active is None:
+        return [False] * len(rows)
+    t0 = time.perf_counter()
+    try:
+        return _predict_tagged(np.vstack(rows))
+    except Exception as e:
+        eventlog.error("ml_error", detail=str(e))
+        return [False] * len(rows)
+    finally:
+        metrics.ML_SECONDS.observe(time.perf_counter() - t0, "predict")
+        metrics.ML_ROWS.inc("predict", n=len(rows))
+
+def ml_detect_batch(records: list) -> list:
+    """여러 요청(ParsedRequest 또는 dict)을 한 번에 판정. 입력 순서대로 bool 목록 반환."""
+    result = [False] * len(records)
+    m = _active
+    if m is None or not records:
+        return result
+    t0 = time.perf_counter()
+    try:
+        return _detect_batch(records, result, m)
+    finally:
+        metrics.ML_SECONDS.observe(time.perf_counter() - t0, "batch")
+        metrics.ML_ROWS.inc("batch", n=len(records))
+
+def _detect_batch(records: list, result: list, m: _Models) -> list:
+    # 상태는 요청 순서대로 한 번에 갱신 (원격 백엔드면 왕복 1회)
+    now = clock()
+    keys = []
+    for i, d in enumerate(records):
+        try:
+            p = as_parsed(d)
+            keys.append((i, p, p.ip or "127.0.0.1"))
+        except Exception as e:
+            eventlog.error("ml_error", detail=str(e))
+    windows = ip_states.observe_many([(ip, p.path, now) for _, p, ip in keys])
+
+    # 특징은 미리 할당한 행렬에 바로 기록
+    X = np.empty((len(keys), _NF), dtype=np.float64)
+    idx = []
+    for (i, p, _), w in zip(keys, windows):
+        try:
+            _fill_row(X[len(idx)], p, w, m)
+            idx.append(i)
+        except Exception as e:
+            eventlog.error("ml_error", detail=str(e))
+    if not idx:
+        return result
+    try:
+        hits = m.predict(X[:len(idx)])
+        for i, hit in zip(idx, hits):
+            result[i] = hit
+        _offer_normal(X[:len(idx)], hits, m)
+    except Exception as e:
+        eventlog.error("ml_error", detail=str(e))
+    return result
+
+
+#────────────────── 핫 리로드 ───────────────────#
+# 새 번들을 백그라운드(관리 엔드포인트 스레드 또는 감시 스레드)에서 적재 → 사전 검증 → 참조 교체.
+# 처리 중인 요청은 시작할 때 잡은 _Models 로 끝나고, 교체 후 들어온 요청부터 새 모델 사용
+_reload_lock = threading.Lock()
+_reload_stats = {"reloads": 0, "rejected": 0, "errors": 0}
+_last_report: dict = {}
+_rejected_versions: set = set()      # 사전 검증에서 떨어진 버전 (감시 스레드가 다시 시도하지 않음)
+
+def _canary(new: _Models, old: Optional[_Models], min_agreement: float = ML_CANARY_MIN_AGREEMENT) -> dict:
+    """새 모델 사전 검증: 번들 표본 + (스키마가 같으면) 최근 실트래픽 행으로 판정해 기준과 비교."""
+    parts = []
+    if new.canary is not None and len(new.canary):
+        parts.append(np.asarray(new.canary, dtype=np.float64))
+    recent = None
+    if old is not None and old.schema_hash == new.schema_hash and _recent:
+        recent = np.vstack(list(_recent))
+        parts.append(recent)
+    X = np.vstack(parts) if parts else np.zeros((1, _NF))
+
+    t0 = time.perf_counter()
+    pred = np.asarray(new.predict(X))
+    rep = {"rows": len(X), "anomaly_rate": round(float(pred.mean()), 4),
+           "us_per_row": round((time.perf_counter() - t0) / len(X) * 1e6, 1), "ok": True}
+    if parts and rep["anomaly_rate"] > ML_CANARY_MAX_RATE:
+        rep["ok"] = False
+        rep["reason"] = f"anomaly rate {rep['anomaly_rate']} > {ML_CANARY_MAX_RATE}"
+    if recent is not None:
+        agree = float(np.mean(pred[-len(recent):] == np.asarray(old.predict(recent))))
+        rep["agreement"] = round(agree, 4)
+        if rep["ok"] and agree < min_agreement:
+            rep["ok"] = False
+            rep["reason"] = f"agreement {rep['agreement']} < {min_agreement}"
+    return rep
+
+def reload_models(version: Optional[str] = None, force: bool = False,
+                  min_agreement: Optional[float] = None) -> dict:
+    """
+    번들(version, 없으면 CURRENT)을 적재해 사전 검증 후 교체. force 면 같은 버전 / 검증 실패도 교체.
+    version 을 지정해 교체하면 CURRENT 도 그 버전으로 바꿔 다른 워커 프로세스가 따라오게 함.
+    min_agreement: 최근 행에서 현재 모델과의 판정 일치율 하한.
+    None 이면 서비스 중 재학습 번들은 retrain.RETRAIN_MIN_AGREEMENT, 나머지는 ML_CANARY_MIN_AGREEMENT
+    (감시 스레드로 따라오는 다른 워커 프로세스도 같은 기준을 씀)
+    """
+    global _active, _previous, _last_report
+    with _reload_lock:
+        target = version or model_bundle.current(BUNDLE_ROOT)
+        old = _active
+        rep = {"version": target, "previous": old.version if old else None, "reloaded": False}
+        if not target:
+            rep["reason"] = f"no bundle under {BUNDLE_ROOT}"
+        elif old is not None and old.version == target and not force:
+            rep["reason"] = "already active"
+        else:
+            try:
+                new = _from_bundle(model_bundle.load(BUNDLE_ROOT, target, expect_features=_FEATURES))
+                if min_agreement is None:
+                    min_agreement = (retrain.RETRAIN_MIN_AGREEMENT if new.meta.get("source") == retrain.SOURCE
+                                     else ML_CANARY_MIN_AGREEMENT)
+                rep["canary"] = _canary(new, old, min_agreement)
+                if rep["canary"]["ok"] or force:
+                    _previous, _active = old, new     # 참조 교체 (원자적)
+                    _rejected_versions.discard(target)
+                    if version and model_bundle.current(BUNDLE_ROOT) != target:
+                        model_bundle.set_current(target, BUNDLE_ROOT)
+                    rep["reloaded"] = True
+                    _reload_stats["reloads"] += 1
+                else:
+                    rep["reason"] = rep["canary"]["reason"]
+                    _rejected_versions.add(target)
+                    _reload_stats["rejected"] += 1
+            except Exception as e:
+                rep["reason"] = str(e)
+                _rejected_versions.add(target)
+                _reload_stats["errors"] += 1
+        _last_report = rep
+    if rep["reloaded"]:
+        eventlog.info("model_reloaded", **rep)
+    elif rep.get("reason") != "already active":
+        eventlog.warning("model_reload_rejected", **rep)
+    return rep
+
+def _watch(interval: float):
+    # CURRENT 가 바뀌면 (train_model.py 가 새 번들 저장, 다른 프로세스의 관리 요청) 다시 적재
+    while True:
+        time.sleep(interval)
+        try:
+            target = model_bundle.current(BUNDLE_ROOT)
+            m = _active
+            if target and (m is None or target != m.version) and target not in _rejected_versions:
+                reload_models()
+        except Exception as e:
+            eventlog.error("model_watch_error", detail=str(e))
+
+_watcher: Optional[threading.Thread] = None
+
+def start_watcher(interval: float = ML_RELOAD_POLL_SEC):
+    """번들 CURRENT 감시 스레드 시작 (프로세스당 한 번, interval 0 이면 시작 안 함)."""
+    global _watcher
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return
+    _watcher = threading.Thread(target=_watch, args=(interval,), name="model-watch", daemon=True)
+    _watcher.start()
+
+def model_stats() -> dict:
+    m, prev = _active, _previous
+    return {
+        "version"     : m.version if m else None,
+        "schema_hash" : m.schema_hash if m else None,
+        "loaded_at"   : m.loaded_at if m else None,
+        "previous"    : prev.version if prev else None,
+        "current_file": model_bundle.current(BUNDLE_ROOT),
+        "canary_rows" : len(_recent),
+        **_reload_stats,
+        "last_reload" : _last_report,
+        "retrain"     : retrain.stats(),
+    }
@@ -0,0 +1,192 @@
+# model_bundle.py
+"""
+학습 결과 번들 (파이프라인 2 개 + 인코더 3 개 + 특징 목록 + 스키마 해시 + 학습 메타데이터)
+──────────────────────────────────────────────
+  models/
+    CURRENT                  현재 버전 이름 (한 줄). 새 번들 저장 후 원자적으로 교체
+    <version>/
+      manifest.json          format / version / features / schema_hash / 학습 메타데이터
+      bundle.joblib          {"model", "lof_model", "enc_method", "enc_accept", "enc_referer", "version"}
+                             압축 없이 저장 → joblib.load(mmap_mode="r") 로 큰 배열(트리 노드,
+                             LOF 학습 점 / lrd)을 복사 없이 매핑. 여러 워커 프로세스가 페이지 캐시 공유
+      canary.npy             (선택) 학습 특징 행 표본. 핫 리로드 시 새 모델 사전 검증에 사용
+  - schema_hash: 특징 목록 + 인코더 classes_ 의 해시. 적재 시 다시 계산해 manifest 와 비교하고,
+    manifest 와 bundle.joblib 의 version 이 같은지도 확인 → 인코더 / 모델이 섞이지 않음
+  - 검증 실패는 BundleError
+  - models/ 는 저장소에 넣지 않음 (.gitignore). 원본은 저장소의 *.pkl 하나뿐이고, 배포 시
+    `python model_bundle.py build` (Dockerfile) 로 번들을 만듦. 이후 버전은 학습 / 재학습이 추가
+
+사용법
+  python model_bundle.py build      # 기존 model.pkl / lof_model.pkl / enc_*.pkl 을 번들로 묶음
+  python model_bundle.py show       # 현재 번들 manifest 출력 + 적재 시간
+"""
+
+from __future__ import annotations
+import hashlib, json, os, sys, time
+from typing import List, Optional
+
+import joblib
+import numpy as np
+
+FORMAT       = 1
+BASE_DIR     = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ROOT = os.path.join(BASE_DIR, "models")
+MANIFEST     = "manifest.json"
+PAYLOAD      = "bundle.joblib"
+CURRENT      = "CURRENT"
+CANARY       = "canary.npy"
+ENCODERS     = ("enc_method", "enc_accept", "enc_referer")
+
+
+class BundleError(Exception):
+    """번들이 없거나 형식 / 스키마가 맞지 않음."""
+
+
+class ModelBundle:
+    __slots__ = ("path", "version", "model", "lof_model", "enc_method", "enc_accept",
+                 "enc_referer", "features", "schema_hash", "meta", "canary")
+
+    def __init__(self, path, version, payload, manifest):
+        self.path        = path
+        self.version     = version
+        self.model       = payload["model"]
+        self.lof_model   = payload["lof_model"]
+        self.enc_method  = payload["enc_method"]
+        self.enc_accept  = payload["enc_accept"]
+        self.enc_referer = payload["enc_referer"]
+        self.features: List[str] = list(manifest["features"])
+        self.schema_hash = manifest["schema_hash"]
+        self.meta: dict  = manifest.get("meta", {})
+        self.canary: Optional[np.ndarray] = None    # 학습 특징 행 표본 (없으면 None)
+
+
+def schema_hash(features, enc_method, enc_accept, enc_referer) -> str:
+    """특징 순서와 인코더 어휘가 같으면 같은 값."""
+    doc = {
+        "features": list(features),
+        "enc_method": [str(c) for c in enc_method.classes_],
+        "enc_accept": [str(c) for c in enc_accept.classes_],
+        "enc_referer": [str(c) for c in enc_referer.classes_],
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# ───────────── 저장 ─────────────
+def save(model, lof_model, enc_method, enc_accept, enc_referer, features,
+         meta: Optional[dict] = None, root: str = DEFAULT_ROOT, activate: bool = True,
+         canary: Optional[np.ndarray] = None) -> str:
+    """새 버전 디렉터리에 번들을 쓰고 (activate 면) CURRENT 를 교체. 버전 이름 반환."""
+    import sklearn
+    h = schema_hash(features, enc_method, enc_accept, enc_referer)
+    version = time.strftime("%Y%m%dT%H%M%S") + "-" + h[:8]
+    path = os.path.join(root, version)
+    os.makedirs(path, exist_ok=False)
+
+    joblib.dump({"model": model, "lof_model": lof_model, "enc_method": enc_method,
+                 "enc_accept": enc_accept, "enc_referer": enc_referer, "version": version},
+                os.path.join(path, PAYLOAD))
+    if canary is not None:
+        np.save(os.path.join(path, CANARY), np.asarray(canary, dtype=np.float64))
+    manifest = {
+        "format"     : FORMAT,
+        "version"    : version,
+        "features"   : list(features),
+        "schema_hash": h,
+        "meta"       : dict(meta or {}, sklearn=sklearn.__version__, numpy=np.__version__,
+                            created=time.strftime("%Y-%m-%dT%H:%M:%S%z")),
+    }
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    if activate:
+        set_current(version, root)
+    return version
+
+
+def set_current(version: str, root: str = DEFAULT_ROOT):
+    if not os.path.isfile(os.path.join(root, version, MANIFEST)):
+        raise BundleError(f"no bundle {version} under {root}")
+    tmp = os.path.join(root, CURRENT + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(root, CURRENT))
+
+
+# ───────────── 적재 / 검증 ─────────────
+def current(root: str = DEFAULT_ROOT) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def exists(root: str = DEFAULT_ROOT) -> bool:
+    return current(root) is not None
+
+
+def load(root: str = DEFAULT_ROOT, version: Optional[str] = None,
+         expect_features: Optional[List[str]] = None, mmap: bool = True) -> ModelBundle:
+    """번들 적재 + 검증. version 이 None 이면 CURRENT."""
+    version = version or current(root)
+    if not version:
+        raise BundleError(f"no {CURRENT} in {root}")
+    path = os.path.join(root, version)
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        payload = joblib.load(os.path.join(path, PAYLOAD), mmap_mode="r" if mmap else None)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"{path}: {e}") from e
+
+    if manifest.get("format") != FORMAT:
+        raise BundleError(f"{path}: format {manifest.get('format')} != {FORMAT}")
+    if payload.get("version") != manifest.get("version") or manifest.get("version") != version:
+        raise BundleError(f"{path}: manifest / payload version mismatch")
+    features = manifest["features"]
+    if expect_features is not None and list(expect_features) != list(features):
+        raise BundleError(f"{path}: features {features} != expected {list(expect_features)}")
+    h = schema_hash(features, *(payload[k] for k in ENCODERS))
+    if h != manifest["schema_hash"]:
+        raise BundleError(f"{path}: schema hash {h} != manifest {manifest['schema_hash']}")
+    for name in ("model", "lof_model"):
+        n = getattr(payload[name], "n_features_in_", len(features))
+        if n != len(features):
+            raise BundleError(f"{path}: {name} expects {n} features, bundle has {len(features)}")
+    bundle = ModelBundle(path, version, payload, manifest)
+    canary = os.path.join(path, CANARY)
+    if os.path.exists(canary):
+        bundle.canary = np.load(canary, mmap_mode="r" if mmap else None)
+        if bundle.canary.ndim != 2 or bundle.canary.shape[1] != len(features):
+            raise BundleError(f"{path}: canary shape {bundle.canary.shape} does not match features")
+    return bundle
+
+
+# ───────────── CLI ─────────────
+def _build_from_legacy(root: str) -> str:
+    """기존 개별 pkl 파일을 하나의 번들로 묶음 (특징 목록은 ml_detection 과 같은 순서)."""
+    import warnings
+    warnings.filterwarnings("ignore")
+    from ml_detection import _FEATURES
+    pk = {n: joblib.load(os.path.join(BASE_DIR, n + ".pkl"))
+          for n in ("model", "lof_model") + ENCODERS}
+    return save(pk["model"], pk["lof_model"], pk["enc_method"], pk["enc_accept"], pk["enc_referer"],
+                _FEATURES, {"source": "model.pkl, lof_model.pkl, enc_*.pkl"}, root)
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = argv[0] if argv else "show"
+    root = argv[1] if len(argv) > 1 else DEFAULT_ROOT
+    if cmd == "build":
+        print("저장:", os.path.join(root, _build_from_legacy(root)))
+    t0 = time.perf_counter()
+    b = load(root)
+    dt = time.perf_counter() - t0
+    print(json.dumps({"version": b.version, "schema_hash": b.schema_hash,
+                      "features": len(b.features), "meta": b.meta}, indent=2, ensure_ascii=False))
+    print(f"적재 {dt * 1e3:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
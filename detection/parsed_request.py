@@ -0,0 +1,62 @@
+# parsed_request.py
+"""
+요청 본문 → ParsedRequest (요청당 한 번 파싱, 룰 / ML 탐지가 함께 사용)
+──────────────────────────────────────────────
+  - 헤더 이름은 소문자로 정규화 → 룰과 ML 이 같은 키로 조회 (대소문자 차이로 헤더를 놓치지 않음)
+  - 소문자 UA / 브라우저 종류 / 경로 세그먼트·토큰 / 쿼리 문자열 / 본문 길이를 한 번만 계산
+  - app.py 가 /detect 본문마다 만들어 실행기에 넘김 (process 모드에서는 그대로 pickle)
+  - dict 를 받는 기존 진입점(rule_detect, ml_features, _fill_row …)은 as_parsed 로 변환해서 씀
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+# 브라우저 종류 판별용 UA 토큰 (앞에 있을수록 우선. detection.score_browser 의 프로파일 키)
+BROWSER_KEY_TOKENS = {
+    "chrome":  ("chrome", "crios"),
+    "edge":    ("edg",),
+    "safari":  ("safari",),
+    "firefox": ("firefox",),
+}
+
+
+def browser_family(ua: str) -> Optional[str]:
+    """소문자 UA → BROWSER_KEY_TOKENS 에서 처음 일치하는 브라우저 (없으면 None)."""
+    for key, toks in BROWSER_KEY_TOKENS.items():
+        for t in toks:
+            if t in ua:
+                return key
+    return None
+
+
+class ParsedRequest:
+    """/detect 요청 하나. raw 는 원본 dict (판정 기록 훅 등 원본이 필요한 곳용)."""
+    __slots__ = ("raw", "ip", "timestamp", "method", "method_lower", "path", "path_segments",
+                 "path_tokens", "query", "headers", "ua", "browser", "body_len", "graphql",
+                 "same_site", "cookie_count")
+
+    def __init__(self, data: dict):
+        h = {k.lower(): v for k, v in (data.get("headers") or {}).items()}
+        path = data.get("path", "/")
+        method = data.get("method", "GET")
+        segs = path.split("/")
+        self.raw           = data
+        self.ip            = data.get("ip", "")
+        self.timestamp     = float(data["timestamp"]) if "timestamp" in data else None
+        self.method        = method                        # 원래 표기 (ML 인코더 어휘)
+        self.method_lower  = method.lower()
+        self.path          = path
+        self.path_segments = segs                          # path.split("/") (REST 라우터)
+        self.path_tokens   = [t for t in segs if t]        # 빈 세그먼트 제외 (ML 경로 특징)
+        self.query         = path.partition("?")[2]
+        self.headers       = h
+        self.ua            = (h.get("user-agent") or "").lower()
+        self.browser       = browser_family(self.ua)
+        self.body_len      = int(data.get("body_length", h.get("content-length", 0) or 0))
+        self.graphql       = data.get("graphql")
+        self.same_site     = bool(data.get("same_site", False))
+        self.cookie_count  = len(data.get("cookies") or ())
+
+
+def as_parsed(data) -> ParsedRequest:
+    return data if isinstance(data, ParsedRequest) else ParsedRequest(data)
@@ -0,0 +1,121 @@
+# ratelimit.py
+"""
+IP 빈도 제한용 슬라이딩 윈도우 카운터 (array 컬럼 기반)
+──────────────────────────────────────────────
+  - IP 문자열 → 정수 슬롯. 슬롯별 값은 array 컬럼(윈도우 번호/현재·이전 카운트/마지막 시각)에 저장
+    → IP 하나당 dict 하나를 두던 방식보다 훨씬 작은 메모리
+  - 두 버킷 보간: 추정치 = 현재 윈도우 카운트 + 이전 윈도우 카운트 × (윈도우 남은 비율)
+    → 고정 윈도우 경계에서 몰아서 보내는 버스트도 잡힘
+  - 만료: 마지막 요청 후 idle_ttl 이 지난 슬롯을 커서 방식으로 조금씩 정리 (나이 기준)
+    상한에 도달했는데 그 정리로 빈 슬롯이 생기지 않으면 표본 중 가장 오래 쉰 슬롯을 축출
+    (새 IP 등록 비용은 상한 도달 여부와 관계없이 O(SWEEP_STEP + EVICT_SAMPLE))
+"""
+
+from __future__ import annotations
+import random, threading
+from array import array
+from typing import Dict, List, Optional
+
+SWEEP_STEP    = 2      # 새 IP 등록마다 검사할 슬롯 수
+EVICT_SAMPLE  = 16     # 상한 도달 시 축출 후보 표본 수
+
+
+class SlidingWindowLimiter:
+    def __init__(self, window: float, capacity: int, idle_ttl: Optional[float] = None):
+        self.window   = float(window)
+        self.capacity = int(capacity)
+        self.idle_ttl = float(idle_ttl) if idle_ttl is not None else 2 * self.window
+        self._slot: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []    # 슬롯 → IP (축출 시 역참조)
+        self._win  = array("q")                 # 현재 윈도우 번호
+        self._cur  = array("I")                 # 현재 윈도우 카운트
+        self._prev = array("I")                 # 이전 윈도우 카운트
+        self._last = array("d")                 # 마지막 요청 시각
+        self._free: List[int] = []
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self.expired = 0                        # 나이 만료로 정리된 수
+        self.evicted = 0                        # 상한 때문에 축출된 수
+
+    def __len__(self) -> int:
+        return len(self._slot)
+
+    # ─── 슬롯 관리 ───
+    def _release(self, s: int):
+        del self._slot[self._keys[s]]
+        self._keys[s] = None
+        self._free.append(s)
+
+    def _sweep(self, now: float, budget: int) -> int:
+        n = len(self._keys)
+        if not n:
+            return 0
+        freed = 0
+        keys, last, ttl = self._keys, self._last, self.idle_ttl
+        for _ in range(min(budget, n)):
+            s = self._cursor
+            self._cursor = s + 1 if s + 1 < n else 0
+            if keys[s] is not None and now - last[s] > ttl:
+                self._release(s)
+                freed += 1
+        self.expired += freed
+        return freed
+
+    def _evict_one(self):
+        keys, last = self._keys, self._last
+        n = len(keys)
+        cands = [s for s in (random.randrange(n) for _ in range(EVICT_SAMPLE)) if keys[s] is not None]
+        if not cands:
+            cands = [s for s in range(n) if keys[s] is not None][:1]
+        self._release(min(cands, key=last.__getitem__))
+        self.evicted += 1
+
+    def _alloc(self, key: str, now: float) -> int:
+        # 정리는 항상 SWEEP_STEP 슬롯만 (전체 순회는 잠금 안에서 O(capacity) → 새 IP 폭주 시 모든 스레드가 멈춤)
+        self._sweep(now, SWEEP_STEP)
+        if len(self._slot) >= self.capacity:
+            self._evict_one()
+        if self._free:
+            s = self._free.pop()
+            self._keys[s] = key
+        else:
+            s = len(self._keys)
+            self._keys.append(key)
+            self._win.append(0); self._cur.append(0); self._prev.append(0); self._last.append(0.0)
+        self._slot[key] = s
+        self._win[s] = int(now // self.window)
+        self._cur[s] = self._prev[s] = 0
+        return s
+
+    # ─── 공개 API ───
+    def hit(self, key: str, now: float) -> float:
+        """요청 1건을 기록하고 최근 window 초 동안의 추정 요청 수를 반환."""
+        W = self.window
+        w = int(now // W)
+        cur_a, prev_a = self._cur, self._prev
+        with self._lock:
+            s = self._slot.get(key)
+            if s is None:
+                s = self._alloc(key, now)
+            else:
+                d = w - self._win[s]
+                if d > 0:
+                    prev_a[s] = cur_a[s] if d == 1 else 0
+                    cur_a[s] = 0
+                    self._win[s] = w
+            cur = cur_a[s] + 1
+            cur_a[s] = cur
+            self._last[s] = now
+            prev = prev_a[s]
+        if not prev:
+            return float(cur)
+        return cur + prev * (1.0 - (now - w * W) / W)
+
+    def stats(self) -> dict:
+        return {
+            "tracked" : len(self._slot),
+            "slots"   : len(self._keys),
+            "capacity": self.capacity,
+            "expired" : self.expired,
+            "evicted" : self.evicted,
+        }
@@ -0,0 +1,154 @@
+# resp_standin.py
+"""
+state_backend.RedisBackend 검증용 로컬 RESP 대역 서버 (실제 Redis 없이 실행)
+  RedisBackend 가 쓰는 명령만 구현: PING SELECT GET SET GETSET INCR EXPIRE DEL FLUSHALL
+                                    ZADD ZREMRANGEBYSCORE ZREMRANGEBYRANK ZCARD ZCOUNT
+사용법: python resp_standin.py [포트]   (기본 6379)
+"""
+
+import asyncio, sys, time
+
+_data: dict = {}        # key → bytes | dict(member → score)
+_expire: dict = {}      # key → 만료 시각
+
+
+def _alive(key):
+    t = _expire.get(key)
+    if t is not None and t <= time.monotonic():
+        _data.pop(key, None)
+        _expire.pop(key, None)
+    return key in _data
+
+
+def _score(raw: bytes):
+    s = raw.decode()
+    if s in ("-inf", "+inf", "inf"):
+        return (float(s if s != "inf" else "+inf"), False)
+    if s.startswith("("):
+        return (float(s[1:]), True)
+    return (float(s), False)
+
+
+def _in(v, lo, hi):
+    (a, ax), (b, bx) = lo, hi
+    return (v > a if ax else v >= a) and (v < b if bx else v <= b)
+
+
+def _zset(key):
+    if not _alive(key):
+        _data[key] = {}
+    return _data[key]
+
+
+def execute(args):
+    cmd = args[0].upper().decode()
+    a = args[1:]
+    if cmd == "PING":
+        return "+PONG"
+    if cmd in ("SELECT",):
+        return "+OK"
+    if cmd == "FLUSHALL":
+        _data.clear(); _expire.clear()
+        return "+OK"
+    if cmd == "GET":
+        return _data[a[0]] if _alive(a[0]) else None
+    if cmd == "SET":
+        _data[a[0]] = a[1]; _expire.pop(a[0], None)
+        return "+OK"
+    if cmd == "GETSET":
+        old = _data[a[0]] if _alive(a[0]) else None
+        _data[a[0]] = a[1]; _expire.pop(a[0], None)
+        return old
+    if cmd == "INCR":
+        v = int(_data[a[0]]) + 1 if _alive(a[0]) else 1
+        _data[a[0]] = str(v).encode()
+        return v
+    if cmd == "EXPIRE":
+        if not _alive(a[0]):
+            return 0
+        _expire[a[0]] = time.monotonic() + int(a[1])
+        return 1
+    if cmd == "DEL":
+        n = 0
+        for k in a:
+            if _alive(k):
+                del _data[k]; _expire.pop(k, None); n += 1
+        return n
+    if cmd == "ZADD":
+        z, added = _zset(a[0]), 0
+        for i in range(1, len(a), 2):
+            added += a[i + 1] not in z
+            z[a[i + 1]] = float(a[i])
+        return added
+    if cmd == "ZCARD":
+        return len(_data[a[0]]) if _alive(a[0]) else 0
+    if cmd == "ZCOUNT":
+        if not _alive(a[0]):
+            return 0
+        lo, hi = _score(a[1]), _score(a[2])
+        return sum(1 for v in _data[a[0]].values() if _in(v, lo, hi))
+    if cmd == "ZREMRANGEBYSCORE":
+        if not _alive(a[0]):
+            return 0
+        z = _data[a[0]]
+        lo, hi = _score(a[1]), _score(a[2])
+        dead = [m for m, v in z.items() if _in(v, lo, hi)]
+        for m in dead:
+            del z[m]
+        return len(dead)
+    if cmd == "ZREMRANGEBYRANK":
+        if not _alive(a[0]):
+            return 0
+        z = _data[a[0]]
+        order = sorted(z, key=lambda m: (z[m], m))
+        n = len(order)
+        start, stop = int(a[1]), int(a[2])
+        start, stop = (start + n if start < 0 else start), (stop + n if stop < 0 else stop)
+        if stop < 0:                    # Redis 처럼 빈 범위 (파이썬 음수 슬라이스로 해석하지 않음)
+            return 0
+        dead = order[max(start, 0):stop + 1]
+        for m in dead:
+            del z[m]
+        return len(dead)
+    return Exception(f"ERR unknown command '{cmd}'")
+
+
+def _encode(r) -> bytes:
+    if r is None:
+        return b"$-1\r\n"
+    if isinstance(r, Exception):
+        return b"-" + str(r).encode() + b"\r\n"
+    if isinstance(r, str):
+        return r.encode() + b"\r\n"
+    if isinstance(r, int):
+        return b":%d\r\n" % r
+    return b"$%d\r\n%s\r\n" % (len(r), r)
+
+
+async def _handle(reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            n = int(line[1:-2])
+            args = []
+            for _ in range(n):
+                ln = int((await reader.readline())[1:-2])
+                args.append((await reader.readexactly(ln + 2))[:-2])
+            writer.write(_encode(execute(args)))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port=6379, host="127.0.0.1"):
+    server = await asyncio.start_server(_handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(int(sys.argv[1]) if len(sys.argv) > 1 else 6379))
@@ -0,0 +1,114 @@
+# rest_router.py
+"""
+OpenAPI 경로 템플릿용 세그먼트 트라이(radix) 라우터
+──────────────────────────────────────────────
+  - "/" 로 나눈 세그먼트 단위로 정적 세그먼트 / {param} 세그먼트를 분리 저장
+  - match(path) 한 번의 트리 탐색으로 허용 메서드 집합 반환 (없으면 None)
+  - 여러 템플릿이 동시에 맞으면 스펙에 먼저 나온 템플릿을 선택
+    (기존 정규식 테이블의 "앞에서부터 첫 매칭" 과 동일)
+  - load() 는 새 트리를 다 만든 뒤 참조만 교체하므로 재시작 없이 재적재 가능
+"""
+
+from __future__ import annotations
+import json, re
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+_PARAM = re.compile(r'{[^/]+}')
+_META  = re.compile(r'[.^$*+?{}\[\]\\|()]')   # 정규식으로 해석되던 문자
+
+
+class _Node:
+    __slots__ = ("static", "param", "dynamic", "methods", "order", "min_order")
+
+    def __init__(self):
+        self.static: Dict[str, _Node] = {}
+        self.param: Optional[_Node] = None                     # 세그먼트 전체가 {param}
+        self.dynamic: List[Tuple[re.Pattern, _Node]] = []      # "{id}.json" 처럼 섞인 세그먼트
+        self.methods: Optional[FrozenSet[str]] = None
+        self.order = -1                                        # 스펙 내 템플릿 순서
+        self.min_order = 1 << 62                               # 하위 트리 최소 순서 (가지치기용)
+
+
+def _child(node: _Node, seg: str) -> _Node:
+    if _PARAM.fullmatch(seg):
+        if node.param is None:
+            node.param = _Node()
+        return node.param
+    if _META.search(seg):
+        src = _PARAM.sub('[^/]+', seg)
+        for rex, sub in node.dynamic:
+            if rex.pattern == src:
+                return sub
+        sub = _Node()
+        node.dynamic.append((re.compile(src), sub))
+        return sub
+    return node.static.setdefault(seg, _Node())
+
+
+def build(spec: dict) -> Tuple[_Node, int]:
+    root, n = _Node(), 0
+    for order, (p, item) in enumerate(spec["paths"].items()):
+        node = root
+        trail = [node]
+        for seg in p.split("/"):
+            node = _child(node, seg)
+            trail.append(node)
+        if node.methods is not None:
+            continue                                           # 같은 템플릿이면 앞의 것이 우선
+        node.methods = frozenset(m.lower() for m in item)
+        node.order = order
+        for t in trail:
+            t.min_order = min(t.min_order, order)
+        n += 1
+    return root, n
+
+
+class RestRouter:
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        self.size = 0
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def load(self, path="openapi.json") -> bool:
+        """스펙을 읽어 트리를 새로 만들고 교체. 실패하면 기존 트리 유지."""
+        try:
+            spec = json.loads(Path(path).read_text())
+            root, n = build(spec)
+        except (OSError, ValueError, KeyError, AttributeError):
+            return False
+        self._root, self.size = root, n                        # 참조 교체 (원자적)
+        return True
+
+    def match(self, path: str) -> Optional[FrozenSet[str]]:
+        return self.match_segments(path.split("/"))
+
+    def match_segments(self, segs: List[str]) -> Optional[FrozenSet[str]]:
+        """이미 나눈 경로 세그먼트(path.split("/"))로 match."""
+        root = self._root
+        if root is None:
+            return None
+        best: Optional[_Node] = None
+        # (노드, 세그먼트 위치) 반복 DFS. 정적 → 혼합 → {param} 순으로 보고,
+        # 이미 찾은 것보다 앞선 템플릿이 없는 가지는 건너뜀
+        stack = [(root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if best is not None and node.min_order >= best.order:
+                continue
+            if i == len(segs):
+                if node.methods is not None and (best is None or node.order < best.order):
+                    best = node
+                continue
+            seg = segs[i]
+            if node.param is not None and seg:
+                stack.append((node.param, i + 1))
+            for rex, sub in node.dynamic:
+                if rex.fullmatch(seg):
+                    stack.append((sub, i + 1))
+            sub = node.static.get(seg)
+            if sub is not None:
+                stack.append((sub, i + 1))
+        return best.methods if best is not None else None
@@ -0,0 +1,360 @@
+# retrain.py
+"""
+서비스 중 재학습 (최근 정상 트래픽 표본 → 별도 프로세스에서 파이프라인 재학습 → 번들 게시)
+──────────────────────────────────────────────
+  표본
+    - rule_detect 를 통과하고 현재 ML 모델도 정상으로 판정한 특징 행만 프로세스마다 저수지 표본(RETRAIN_RESERVOIR 행)에 넣음.
+      (이상으로 본 행은 제외 → 느리게 이어지는 공격이 재학습을 거쳐 정상으로 흡수되지 않음)
+      요청 경로 비용은 배치당 NumPy 연산 몇 번 (잠금 안에서 행 복사만)
+    - 본 행 수를 RETRAIN_HORIZON 에서 멈춰 세므로, 그 뒤로는 새 행이 일정 확률로 임의 칸을 교체
+      → 표본의 평균 나이가 약 RETRAIN_HORIZON 행인 "최근 쪽으로 치우친" 표본 (EDoS 처럼 긴 캠페인에도 따라감)
+    - 인코딩된 행이라 모델의 schema_hash 가 바뀌면(인코더 어휘가 다른 번들로 교체) 표본을 비움
+    - 프로세스 실행 모드의 자식도 표본을 가지므로, 모든 프로세스가 RETRAIN_SPOOL_SEC 마다
+      표본을 RETRAIN_SPOOL/<pid>.npz 로 원자적으로 씀
+  재학습 (app 프로세스 하나에서만, RETRAIN_INTERVAL_SEC 마다)
+    - 스풀 파일을 본 행 수 비율대로 합쳐 학습 행렬을 만들고 (RETRAIN_MIN_ROWS 미만이면 건너뜀)
+    - `python retrain.py fit` 을 새 프로세스로 실행: SCHED_IDLE(없으면 nice RETRAIN_NICE),
+      BLAS 스레드 1 개, CPU 시간 상한 RETRAIN_CPU_SEC (RLIMIT_CPU 초과 시 커널이 종료)
+      현재 번들의 인코더를 그대로 쓰는 새 번들을 CURRENT 를 바꾸지 않고 저장
+    - 부모 스레드가 ml_detection.reload_models(새 버전) → 사전 검증 통과 시에만 교체 + CURRENT 갱신
+      (일치율 하한은 RETRAIN_MIN_AGREEMENT, 기본 0: 표류한 트래픽에 맞추려는 재학습이라 이상치 비율 상한만 봄)
+      → 다른 워커 프로세스는 CURRENT 감시로 따라옴. 탈락한 버전은 그대로 두고 다음 주기에 다시 학습
+    - 재학습 번들은 최근 RETRAIN_KEEP 개만 남김 (CURRENT / 현재 / 직전 모델은 지우지 않음)
+  /detect 는 재학습을 기다리지 않음: 학습은 다른 프로세스, 교체는 기존 핫 리로드와 같은 참조 교체
+
+사용법
+  python retrain.py fit <표본.npy> <부모 버전> [번들 루트]     # 재학습 자식 프로세스 (직접 실행해도 됨)
+"""
+
+from __future__ import annotations
+import glob, json, os, shutil, subprocess, sys, threading, time
+from typing import List, Optional
+
+import numpy as np
+
+import eventlog
+import model_bundle
+
+# ───────────── 설정 상수 ─────────────
+RETRAIN_INTERVAL_SEC = float(os.getenv("RETRAIN_INTERVAL_SEC", "900"))    # 0 이면 재학습 안 함 (표본만 수집)
+RETRAIN_RESERVOIR    = int(os.getenv("RETRAIN_RESERVOIR", "20000"))       # 프로세스당 표본 행 수
+RETRAIN_HORIZON      = int(os.getenv("RETRAIN_HORIZON", "200000"))        # 표본 평균 나이 (행)
+RETRAIN_MIN_ROWS     = int(os.getenv("RETRAIN_MIN_ROWS", "5000"))         # 학습 최소 행 수
+RETRAIN_CPU_SEC      = int(os.getenv("RETRAIN_CPU_SEC", "300"))           # 자식 프로세스 CPU 시간 상한
+RETRAIN_NICE         = int(os.getenv("RETRAIN_NICE", "10"))               # SCHED_IDLE 을 못 쓸 때
+RETRAIN_SPOOL_SEC    = float(os.getenv("RETRAIN_SPOOL_SEC", "30"))
+RETRAIN_KEEP         = int(os.getenv("RETRAIN_KEEP", "5"))
+# 재학습 번들의 사전 검증 일치율 하한. 현재 모델이 표류한 트래픽을 잘못 판정하는 상황을 고치려는 것이므로
+# 기본은 일치율을 보지 않고 이상치 비율 상한(ML_CANARY_MAX_RATE)만 적용
+RETRAIN_MIN_AGREEMENT = float(os.getenv("RETRAIN_MIN_AGREEMENT", "0"))
+RETRAIN_SPOOL        = os.getenv("RETRAIN_SPOOL", os.path.join(
+    os.getenv("ML_BUNDLE_ROOT", model_bundle.DEFAULT_ROOT), ".reservoir"))
+CANARY_ROWS          = 256
+SOURCE               = "retrain"          # 재학습 번들 manifest meta.source
+
+
+# ───────────── 표본 ─────────────
+class Reservoir:
+    """고정 크기 저수지 표본. 본 행 수를 horizon 에서 멈춰 최근 행 쪽으로 치우치게 함."""
+    __slots__ = ("size", "horizon", "rows", "filled", "seen", "schema", "_rng", "_lock")
+
+    def __init__(self, size: int, n_features: int, horizon: int, seed: Optional[int] = None):
+        self.size    = size
+        self.horizon = max(horizon, size)
+        self.rows    = np.empty((size, n_features), dtype=np.float64)
+        self.filled  = 0
+        self.seen    = 0                   # 본 행 수 (horizon 에서 멈춤)
+        self.schema: Optional[str] = None
+        self._rng    = np.random.default_rng(seed)
+        self._lock   = threading.Lock()
+
+    def reset(self, schema: Optional[str] = None):
+        with self._lock:
+            self.filled = self.seen = 0
+            self.schema = schema
+
+    def offer(self, X: np.ndarray, schema: str):
+        """행 여러 개를 한 번에 (Algorithm R 을 배치로)."""
+        n = len(X)
+        if n == 0:
+            return
+        with self._lock:
+            if schema != self.schema:
+                self.filled = self.seen = 0
+                self.schema = schema
+            take = min(n, self.size - self.filled)
+            if take:                                    # 빈 칸부터 채움
+                self.rows[self.filled:self.filled + take] = X[:take]
+                self.filled += take
+                self.seen += take
+            rest = n - take
+            if rest == 1:                               # /detect 한 건: NumPy 배열 연산 없이
+                slot = int(self._rng.random() * min(self.seen + 1, self.horizon))
+                if slot < self.size:
+                    self.rows[slot] = X[take]
+                self.seen = min(self.seen + 1, self.horizon)
+            elif rest:
+                t = np.minimum(self.seen + 1 + np.arange(rest), self.horizon)
+                slot = (self._rng.random(rest) * t).astype(np.int64)
+                hit = np.flatnonzero(slot < self.size)
+                self.rows[slot[hit]] = X[take + hit]    # 같은 칸이 겹치면 나중 행이 남음
+                self.seen = min(self.seen + rest, self.horizon)
+
+    def snapshot(self):
+        with self._lock:
+            return self.rows[:self.filled].copy(), self.seen, self.schema
+
+
+_reservoir: Optional[Reservoir] = None
+
+
+def offer(X: np.ndarray, schema: str):
+    """ml_detection 이 판정한 (rule_detect 를 통과한) 특징 행을 표본에 넣음."""
+    global _reservoir
+    r = _reservoir
+    if r is None:
+        r = _reservoir = Reservoir(RETRAIN_RESERVOIR, X.shape[1], RETRAIN_HORIZON)
+    r.offer(X, schema)
+
+
+# ───────────── 스풀 (프로세스 간 표본 공유) ─────────────
+def _spool_path(pid: int) -> str:
+    return os.path.join(RETRAIN_SPOOL, f"{pid}.npz")
+
+
+def dump() -> bool:
+    """이 프로세스의 표본을 스풀에 씀 (표본이 없으면 건너뜀)."""
+    r = _reservoir
+    if r is None or not r.filled:
+        return False
+    rows, seen, schema = r.snapshot()
+    os.makedirs(RETRAIN_SPOOL, exist_ok=True)
+    tmp = os.path.join(RETRAIN_SPOOL, f".{os.getpid()}.tmp.npz")
+    np.savez(tmp, rows=rows, seen=seen, schema=schema)
+    os.replace(tmp, _spool_path(os.getpid()))
+    return True
+
+
+def collect(schema: str, max_age: float, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    스풀의 표본들을 합침. 프로세스마다 본 행 수에 비례하게 뽑아 전체 트래픽의 표본이 되게 함.
+    schema 가 다르거나 max_age 초보다 오래된 파일(끝난 워커)은 무시하고 지움.
+    """
+    rng = rng or np.random.default_rng()
+    parts, now = [], time.time()
+    for path in glob.glob(os.path.join(RETRAIN_SPOOL, "*.npz")):
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+                continue
+            with np.load(path) as z:
+                if str(z["schema"]) == schema and len(z["rows"]):
+                    parts.append((z["rows"], int(z["seen"])))
+        except (OSError, ValueError, KeyError):
+            continue
+    if not parts:
+        return np.zeros((0, 0))
+    size = max(len(rows) for rows, _ in parts)
+    total = sum(seen for _, seen in parts)
+    out = []
+    for rows, seen in parts:
+        k = min(len(rows), int(round(size * seen / total)))
+        out.append(rows[rng.choice(len(rows), size=k, replace=False)] if k < len(rows) else rows)
+    return np.vstack(out)
+
+
+# ───────────── 재학습 (자식 프로세스) ─────────────
+def fit(sample_path: str, parent: str, root: str = model_bundle.DEFAULT_ROOT) -> str:
+    """표본으로 파이프라인 두 개를 다시 학습해 부모 번들의 인코더로 새 번들 저장 (CURRENT 는 그대로)."""
+    import train_pipeline
+    X = np.load(sample_path)
+    b = model_bundle.load(root, parent, mmap=False)
+    t0 = time.perf_counter()
+    pipe_if, pipe_lof = train_pipeline.train(X, if_sample=len(X), lof_sample=len(X))
+    rng = np.random.default_rng(0)
+    canary = X[np.sort(rng.choice(len(X), size=min(CANARY_ROWS, len(X)), replace=False))]
+    return model_bundle.save(
+        pipe_if, pipe_lof, b.enc_method, b.enc_accept, b.enc_referer, b.features,
+        meta={"source": SOURCE, "parent": parent, "rows": int(len(X)),
+              "contamination": train_pipeline.CONTAMINATION, "if_random_state": train_pipeline.RANDOM_STATE,
+              "lof_n_neighbors": int(pipe_lof.steps[-1][1].n_neighbors_),
+              "fit_sec": round(time.perf_counter() - t0, 3)},
+        root=root, activate=False, canary=canary,
+    )
+
+
+def _limit_self():
+    # 재학습 자식 프로세스 시작 시: 남는 CPU 만 쓰고, CPU 시간을 넘기면 커널이 종료(SIGXCPU / SIGKILL)
+    import resource
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        os.nice(RETRAIN_NICE)
+    resource.setrlimit(resource.RLIMIT_CPU, (RETRAIN_CPU_SEC, RETRAIN_CPU_SEC + 5))
+
+
+def _spawn_fit(sample_path: str, parent: str, root: str) -> dict:
+    import resource
+    env = dict(os.environ, OMP_NUM_THREADS="1", OPENBLAS_NUM_THREADS="1", MKL_NUM_THREADS="1")
+    t0, cpu0 = time.perf_counter(), resource.getrusage(resource.RUSAGE_CHILDREN)
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "fit", sample_path, parent, root],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    out, err = proc.communicate()
+    cpu1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    rep = {"exit": proc.returncode, "wall_sec": round(time.perf_counter() - t0, 2),
+           "cpu_sec": round(cpu1.ru_utime + cpu1.ru_stime - cpu0.ru_utime - cpu0.ru_stime, 2)}
+    if proc.returncode == 0:
+        rep["version"] = out.decode().strip().splitlines()[-1]
+    else:
+        rep["error"] = (err.decode(errors="replace").strip().splitlines() or [f"exit {proc.returncode}"])[-1]
+    return rep
+
+
+# ───────────── 재학습 주기 (app 프로세스) ─────────────
+_stats = {"runs": 0, "published": 0, "rejected": 0, "skipped": 0, "failed": 0}
+_last_run: dict = {}
+_run_lock = threading.Lock()
+
+
+def _prune(root: str, keep: List[str]):
+    """재학습 번들 중 최근 RETRAIN_KEEP 개와 keep 에 있는 버전만 남김."""
+    mine = []
+    for path in glob.glob(os.path.join(root, "*", model_bundle.MANIFEST)):
+        try:
+            with open(path, encoding="utf-8") as f:
+                if json.load(f).get("meta", {}).get("source") == SOURCE:
+                    mine.append(os.path.basename(os.path.dirname(path)))
+        except (OSError, ValueError):
+            continue
+    for version in sorted(mine)[:-RETRAIN_KEEP or None]:
+        if version not in keep:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+def run_once() -> dict:
+    """표본 수집 → 자식 프로세스 학습 → 사전 검증 후 교체. 결과 보고 dict (다른 재학습이 진행 중이면 끝날 때까지 대기)."""
+    with _run_lock:
+        return _run_locked()
+
+
+def start_run() -> bool:
+    """run_once 를 백그라운드 스레드에서 시작. 이미 재학습이 진행 중이면 시작하지 않고 False."""
+    if not _run_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            _run_locked()
+        except Exception as e:
+            eventlog.error("model_retrain_error", detail=str(e))
+        finally:
+            _run_lock.release()
+
+    threading.Thread(target=run, name="retrain-now", daemon=True).start()
+    return True
+
+
+def running() -> bool:
+    return _run_lock.locked()
+
+
+def _run_locked() -> dict:
+    # _run_lock 을 잡은 상태에서 호출
+    global _last_run
+    import ml_detection
+    m = ml_detection._active
+    root = ml_detection.BUNDLE_ROOT
+    rep = {"started": time.time(), "parent": m.version if m else None, "published": False}
+    if m is None or not os.path.isfile(os.path.join(root, m.version, model_bundle.MANIFEST)):
+        rep["reason"] = "active model is not a bundle"
+    else:
+        dump()
+        X = collect(m.schema_hash, max_age=3 * max(RETRAIN_SPOOL_SEC, 1.0))
+        rep["rows"] = int(len(X))
+        if len(X) < RETRAIN_MIN_ROWS:
+            rep["reason"] = f"{len(X)} rows < RETRAIN_MIN_ROWS {RETRAIN_MIN_ROWS}"
+        else:
+            sample = os.path.join(RETRAIN_SPOOL, f".sample-{os.getpid()}.npy")
+            np.save(sample, X)
+            try:
+                rep.update(_spawn_fit(sample, m.version, root))
+            finally:
+                os.remove(sample)
+            if "version" in rep:
+                reload = ml_detection.reload_models(rep["version"])
+                rep["published"] = reload["reloaded"]
+                rep["canary"] = reload.get("canary")
+                if not reload["reloaded"]:
+                    rep["reason"] = reload.get("reason")
+                prev = ml_detection._previous
+                _prune(root, [v for v in (model_bundle.current(root), ml_detection._active.version,
+                                          prev.version if prev else None) if v])
+    _stats["runs"] += 1
+    key = ("published" if rep["published"] else "failed" if "error" in rep else
+           "rejected" if "version" in rep else "skipped")
+    _stats[key] += 1
+    _last_run = rep
+    if rep["published"]:
+        eventlog.info("model_retrained", **rep)
+    elif "error" in rep or "version" in rep:
+        eventlog.warning("model_retrain_failed", **rep)
+    return rep
+
+
+def _loop(trainer: bool):
+    last = time.monotonic()
+    while True:
+        time.sleep(RETRAIN_SPOOL_SEC)
+        try:
+            dump()
+            if trainer and RETRAIN_INTERVAL_SEC > 0 and time.monotonic() - last >= RETRAIN_INTERVAL_SEC:
+                last = time.monotonic()
+                if not running():                  # 관리 API 로 시작한 재학습이 진행 중이면 이번 주기는 건너뜀
+                    run_once()
+        except Exception as e:
+            eventlog.error("model_retrain_error", detail=str(e))
+
+
+_thread: Optional[threading.Thread] = None
+
+
+def start(trainer: bool = False):
+    """표본 스풀 스레드 시작 (프로세스당 한 번). trainer 면 재학습 주기도 이 스레드에서."""
+    global _thread
+    if _reservoir is not None:
+        _reservoir.reset()                   # 시작 전 예열 호출(_init_worker)로 들어간 행은 버림
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_loop, args=(trainer,), name="retrain", daemon=True)
+    _thread.start()
+
+
+def stats() -> dict:
+    r = _reservoir
+    return {
+        "reservoir_rows": r.filled if r else 0,
+        "reservoir_seen": r.seen if r else 0,
+        "interval_sec"  : RETRAIN_INTERVAL_SEC,
+        "running"       : running(),
+        **_stats,
+        "last_run"      : _last_run,
+    }
+
+
+# ───────────── CLI (재학습 자식 프로세스) ─────────────
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 3 or argv[0] != "fit":
+        print(__doc__)
+        return 2
+    import warnings
+    warnings.filterwarnings("ignore")
+    if os.name == "posix":
+        _limit_self()
+    root = argv[3] if len(argv) > 3 else model_bundle.DEFAULT_ROOT
+    print(fit(argv[1], argv[2], root))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# ruletrace.py
+"""
+rule_detect 판정 기록 (어느 단계가 막았는지 / 점수 기여 / 단계별 ns)
+──────────────────────────────────────────────
+  - detection.rule_detect_traced(data) → RuleTrace
+  - RULE_TRACE_SAMPLE=N (0 이면 끔) 이면 rule_detect 호출 N 건 중 1 건을 기록해
+    등록된 훅(add_hook)으로 전달. 기본 훅은 eventlog 의 "rule_trace" 이벤트
+  - RULE_PROFILE=cprofile | pyinstrument 이면 기록되는 요청은 프로파일러 아래에서 실행하고
+    상위 함수 통계를 RuleTrace.profile 에 첨부. 프로파일은 프로세스에서 한 번에 하나만
+    (다른 요청이 프로파일 중이면 프로파일 없이 실행하고 RuleTrace.profile 에 건너뛴 이유를 남김)
+  - /detect/trace?profile= 는 RULE_TRACE_REQUEST_PROFILE=1 일 때만 허용 (기본 꺼짐)
+꺼져 있을 때 rule_detect 의 추가 비용은 정수 하나 확인뿐.
+"""
+
+from __future__ import annotations
+import io, itertools, os, threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import eventlog
+
+# ───────────── 설정 상수 ─────────────
+TRACE_SAMPLE    = int(os.getenv("RULE_TRACE_SAMPLE", "0"))      # N 건 중 1 건 (0: 끔)
+PROFILE         = os.getenv("RULE_PROFILE", "")                 # "" | cprofile | pyinstrument
+PROFILE_TOP     = int(os.getenv("RULE_PROFILE_TOP", "15"))      # cProfile 통계 상위 줄 수
+REQUEST_PROFILE = os.getenv("RULE_TRACE_REQUEST_PROFILE", "0") == "1"   # /detect/trace?profile= 허용
+
+
+class RuleTrace:
+    """rule_detect 한 번의 판정 기록."""
+    __slots__ = ("blocked", "stage", "score", "threshold", "hits", "neg_bonus",
+                 "clamp", "timings_ns", "profile")
+
+    def __init__(self):
+        self.blocked   = False
+        self.stage: Optional[str] = None          # 차단한 단계 (통과면 None)
+        self.score     = 0                        # 판정 시점 누적 점수 (clamp 반영)
+        self.threshold = 0
+        self.hits: List[str] = []                 # 점수를 더한 SCORES 키 (발생 순)
+        self.neg_bonus = 0                        # score_extra 가 깎은 점수 (순감소일 때만, clamp 전)
+        self.clamp     = 0                        # MAX_NEGATIVE_BONUS 로 되돌린 점수 (0 이면 clamp 없음)
+        self.timings_ns: Dict[str, int] = {}
+        self.profile: Optional[str] = None
+
+    def contributions(self) -> Dict[str, int]:
+        from detection import SCORES
+        out: Dict[str, int] = {}
+        for k in self.hits:
+            out[k] = out.get(k, 0) + SCORES[k]
+        return out
+
+    def as_dict(self) -> dict:
+        d = {
+            "blocked"   : self.blocked,
+            "stage"     : self.stage,
+            "score"     : self.score,
+            "threshold" : self.threshold,
+            "scores"    : self.contributions(),
+            "neg_bonus" : self.neg_bonus,
+            "clamp"     : self.clamp,
+            "timings_ns": self.timings_ns,
+        }
+        if self.profile is not None:
+            d["profile"] = self.profile
+        return d
+
+
+# ───────────── 표본 추출 / 훅 ─────────────
+_tick = itertools.count()
+_hooks: List[Callable[[RuleTrace, dict], None]] = []
+
+
+def sample() -> bool:
+    return next(_tick) % TRACE_SAMPLE == 0
+
+
+def add_hook(fn: Callable[[RuleTrace, dict], None]):
+    """표본 판정 기록을 받을 콜백 등록. fn(trace, data)."""
+    _hooks.append(fn)
+    return fn
+
+
+def remove_hook(fn):
+    if fn in _hooks:
+        _hooks.remove(fn)
+
+
+def emit(trace: RuleTrace, data: dict):
+    for fn in list(_hooks):
+        try:
+            fn(trace, data)
+        except Exception as e:
+            eventlog.error("rule_trace_hook_error", detail=str(e))
+
+
+@add_hook
+def _log_trace(trace: RuleTrace, data: dict):
+    eventlog.info("rule_trace", ip=data.get("ip"), path=data.get("path"), **trace.as_dict())
+
+
+# ───────────── 프로파일러 ─────────────
+# Python 3.12+ 는 프로파일러를 프로세스에 하나만 켤 수 있음 (두 번째 enable 은 ValueError) → 한 번에 하나만
+_profile_lock = threading.Lock()
+
+@contextmanager
+def profiled(kind: str, trace: RuleTrace):
+    """
+    kind 프로파일러 아래에서 실행하고 결과 요약을 trace.profile 에 기록.
+    이미 다른 프로파일이 진행 중이면 프로파일 없이 실행하고 trace.profile 에 건너뛴 이유만 남김.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        trace.profile = "skipped: another profile is already running"
+        yield
+        return
+    try:
+        with _profiler(kind, trace):
+            yield
+    finally:
+        _profile_lock.release()
+
+@contextmanager
+def _profiler(kind: str, trace: RuleTrace):
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            kind = "cprofile"
+        else:
+            p = Profiler(interval=0.0001)
+            p.start()
+            try:
+                yield
+            finally:
+                p.stop()
+                trace.profile = p.output_text(unicode=False, color=False)
+            return
+    if kind == "cprofile":
+        import cProfile, pstats
+        p = cProfile.Profile()
+        try:
+            p.enable()
+        except ValueError as e:                 # 이 모듈 밖의 프로파일러가 이미 켜져 있음
+            trace.profile = f"skipped: {e}"
+            yield
+            return
+        try:
+            yield
+        finally:
+            p.disable()
+            buf = io.StringIO()
+            pstats.Stats(p, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            trace.profile = buf.getvalue()
+        return
+    yield
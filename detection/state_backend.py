@@ -0,0 +1,515 @@
+# state_backend.py
+"""
+IP 빈도 / 행동 상태 저장 백엔드
+──────────────────────────────────────────────
+stage_ip(룰) 와 _fill_row(ML) 가 쓰는 상태 연산을 한 인터페이스로 묶는다.
+  hit_rate(ip, now, window)  → 최근 window 초 추정 요청 수 (요청 1건 기록 포함)
+  observe(ip, path, now)     → (req_count, interval, req_count_in_last_10s, unique_paths_in_last_60s)
+
+STATE_BACKEND
+  memory  프로세스 내부 (ratelimit.SlidingWindowLimiter + behavior_store.BehaviorStore)
+  shm     같은 호스트의 uvicorn 워커끼리 공유 (multiprocessing.shared_memory + fcntl 범위 잠금)
+          ※ 60초 창 특징이 근사값이라 학습 특징(features.window_features)과 조금 다름 (SharedMemoryBackend 참고)
+  redis   여러 파드 공유. RESP 프로토콜 직접 구현, 요청당 명령을 파이프라인으로 한 번에 전송
+"""
+
+from __future__ import annotations
+import fcntl, hashlib, itertools, math, os, socket, struct, threading, time
+from typing import List, Optional, Sequence, Tuple
+
+from behavior_store import BehaviorStore, LONG_WINDOW, SHORT_WINDOW, MAX_EVENTS_PER_IP
+from ratelimit import SlidingWindowLimiter
+
+# ───────────── 설정 상수 ─────────────
+STATE_BACKEND   = os.getenv("STATE_BACKEND", "memory")          # memory | shm | redis
+RATE_WINDOW_SEC = 60
+RATE_MAX_IPS    = 500_000
+
+# shm
+SHM_NAME        = os.getenv("STATE_SHM_NAME", "waf_state")
+SHM_SLOTS       = int(os.getenv("STATE_SHM_SLOTS", "65536"))     # 2의 거듭제곱
+SHM_LOCK_PATH   = os.getenv("STATE_SHM_LOCK", "/tmp/waf_state.lock")
+SHM_PROBE       = 16                                             # 선형 탐사 범위
+SHM_IDLE_TTL    = 2 * LONG_WINDOW
+
+# redis
+REDIS_URL       = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_TIMEOUT   = float(os.getenv("REDIS_TIMEOUT", "0.2"))
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "16"))        # 프로세스당 연결 수 (thread 실행기 동시 왕복 수)
+REDIS_COOLDOWN  = float(os.getenv("REDIS_COOLDOWN_SEC", "5"))    # 오류 후 이 시간 동안은 Redis 를 건너뛰고 대체 백엔드로
+REDIS_PREFIX    = os.getenv("REDIS_PREFIX", "waf")
+
+Features = Tuple[int, float, int, int]
+
+
+class StateBackend:
+    name = "base"
+
+    def hit_rate(self, ip: str, now: float, window: float) -> float:
+        raise NotImplementedError
+
+    def observe(self, ip: str, path: str, now: float) -> Features:
+        raise NotImplementedError
+
+    # 배치 입력 (기본은 하나씩, 원격 백엔드는 한 번의 왕복으로 처리)
+    def hit_rate_many(self, items: Sequence[Tuple[str, float]], window: float) -> List[float]:
+        return [self.hit_rate(ip, now, window) for ip, now in items]
+
+    def observe_many(self, items: Sequence[Tuple[str, str, float]]) -> List[Features]:
+        return [self.observe(ip, path, now) for ip, path, now in items]
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+# ───────────── memory ─────────────
+class InProcessBackend(StateBackend):
+    name = "memory"
+
+    def __init__(self, rate_window=RATE_WINDOW_SEC, rate_capacity=RATE_MAX_IPS):
+        self.rate = SlidingWindowLimiter(rate_window, rate_capacity)
+        self.behavior = BehaviorStore()
+        # 창 길이 → 리미터. 생성 시 창(rate_window) 외의 window 로 호출되면 그 창의 리미터를 따로 둠
+        self._rates = {float(rate_window): self.rate}
+        self._rates_lock = threading.Lock()
+
+    def _limiter(self, window: float) -> SlidingWindowLimiter:
+        lim = self._rates.get(window)
+        if lim is None:
+            with self._rates_lock:
+                lim = self._rates.setdefault(float(window), SlidingWindowLimiter(window, self.rate.capacity))
+        return lim
+
+    def hit_rate(self, ip, now, window):
+        return self._limiter(window).hit(ip, now)
+
+    def observe(self, ip, path, now):
+        return self.behavior.observe(ip, path, now)
+
+    def stats(self):
+        return {"backend": self.name, "rate": self.rate.stats(), "behavior": self.behavior.stats()}
+
+
+# ───────────── shm ─────────────
+def _key64(s: str) -> int:
+    # 프로세스마다 다른 hash() 대신 고정 해시 (0 은 빈 슬롯 표시라 제외)
+    return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") or 1
+
+# 슬롯 레이아웃: key, 마지막 접근 시각, 직전 요청 시각(interval), 빈도(윈도우 번호/현재/이전),
+#   1초 버킷 10개(10초 창), 10초 버킷 6개(60초 창) + 버킷별 128비트 경로 비트맵
+_SHORT_N = SHORT_WINDOW
+_LONG_N  = LONG_WINDOW // 10
+_SLOT = struct.Struct("<Qddq2I" + f"{_SHORT_N}q{_SHORT_N}I" + f"{_LONG_N}q{_LONG_N}I{2 * _LONG_N}Q")
+_ZERO = _SLOT.unpack(bytes(_SLOT.size))
+_BITS = 128
+_S0   = 6                         # 1초 버킷 시작 인덱스
+_L0   = _S0 + 2 * _SHORT_N        # 10초 버킷 시작 인덱스
+
+
+class SharedMemoryBackend(StateBackend):
+    """
+    같은 호스트 워커 간 공유. 고정 크기 오픈 어드레싱 테이블(키 = IP 의 64비트 해시).
+    잠금은 잠금 파일에 대한 fcntl 범위 잠금 (탐사 구간 [home, home+SHM_PROBE) 만 잠금).
+    60초 창 특징은 10초 버킷 단위 근사, 고유 경로 수는 128비트 비트맵 선형 계수 추정.
+
+    백엔드 고유의 특징 표류 (memory / redis 와 학습은 정확한 창 (now - 60, now], IP 당 MAX_EVENTS_PER_IP 상한):
+      - req_count: 창 경계가 10초 버킷 단위라 최대 10초 전 요청까지 더 셈. IP 당 상한 없음
+      - req_count_in_last_10s: 1초 버킷 단위 (경계에서 최대 1초 차이)
+      - unique_paths_in_last_60s: 경로 해시 충돌로 적게, 비트맵 포화(약 128·ln128 ≈ 621)에 가까울수록 오차가 커짐
+    traffic_log.csv 재생에서 memory 와 다른 행은 특징별 1 % 미만 (차이는 req_count ±1, 10초 창 최대 3).
+    모델은 정확한 창으로 학습되므로, 학습 / 서빙 특징을 똑같이 맞춰야 하면 memory 또는 redis 를 사용
+    """
+    name = "shm"
+
+    def __init__(self, name=SHM_NAME, slots=SHM_SLOTS, lock_path=SHM_LOCK_PATH):
+        from multiprocessing import resource_tracker, shared_memory
+        self.slots = slots
+        size = slots * _SLOT.size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+        # 워커 하나가 종료될 때 세그먼트가 지워지지 않도록 추적 해제
+        try:
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        except Exception:
+            pass
+        self._buf = self._shm.buf
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        # fcntl 잠금은 프로세스 단위라 같은 프로세스의 스레드끼리는 배제하지 않음
+        self._tlock = threading.Lock()
+
+    # ─── 슬롯 접근 ───
+    def _lock(self, home: int) -> int:
+        n = min(SHM_PROBE, self.slots - home)
+        self._tlock.acquire()
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, n, home)
+        except BaseException:
+            self._tlock.release()
+            raise
+        return n
+
+    def _unlock(self, home: int, n: int):
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, n, home)
+        finally:
+            self._tlock.release()
+
+    def _find(self, key: int, now: float) -> Tuple[int, list]:
+        """키의 슬롯 위치와 현재 값 목록 (없으면 새로/재사용 슬롯을 초기화해 반환)."""
+        home = key & (self.slots - 1)
+        end = min(home + SHM_PROBE, self.slots)
+        victim, victim_ts = home, math.inf
+        for i in range(home, end):
+            off = i * _SLOT.size
+            k, last = struct.unpack_from("<Qd", self._buf, off)
+            if k == key:
+                return off, list(_SLOT.unpack_from(self._buf, off))
+            if k == 0:                           # 빈 슬롯 뒤에는 키가 있을 수 없음
+                if victim_ts != -math.inf:
+                    victim = i
+                break
+            if now - last > SHM_IDLE_TTL:        # 만료 슬롯은 재사용 후보, 뒤쪽 탐사는 계속
+                if victim_ts != -math.inf:
+                    victim, victim_ts = i, -math.inf
+            elif last < victim_ts:
+                victim, victim_ts = i, last
+        vals = list(_ZERO)
+        vals[0] = key
+        return victim * _SLOT.size, vals
+
+    def hit_rate(self, ip, now, window):
+        if not ip:
+            return 0.0
+        key = _key64(ip)
+        w = int(now // window)
+        home = key & (self.slots - 1)
+        n = self._lock(home)
+        try:
+            off, v = self._find(key, now)
+            d = w - v[3]
+            if d > 0:
+                v[5] = v[4] if d == 1 else 0
+                v[4] = 0
+                v[3] = w
+            v[4] += 1
+            v[1] = max(v[1], now)
+            _SLOT.pack_into(self._buf, off, *v)
+            cur, prev = v[4], v[5]
+        finally:
+            self._unlock(home, n)
+        if not prev:
+            return float(cur)
+        return cur + prev * (1.0 - (now - w * window) / window)
+
+    def observe(self, ip, path, now):
+        key = _key64(ip)
+        sec, blk = int(now), int(now // 10)
+        pbit = _key64(path) % _BITS
+        s0, l0 = _S0, _L0
+        home = key & (self.slots - 1)
+        n = self._lock(home)
+        try:
+            off, v = self._find(key, now)
+            last = v[2]
+            interval = now - last if last and last > now - LONG_WINDOW else 0
+
+            # 10초 창: 1초 버킷
+            si = sec % _SHORT_N
+            if v[s0 + si] != sec:
+                v[s0 + si], v[s0 + _SHORT_N + si] = sec, 0
+            v[s0 + _SHORT_N + si] += 1
+            c10 = sum(v[s0 + _SHORT_N + i] for i in range(_SHORT_N) if v[s0 + i] > sec - _SHORT_N)
+
+            # 60초 창: 10초 버킷 + 경로 비트맵
+            li = blk % _LONG_N
+            b0 = l0 + 2 * _LONG_N + 2 * li
+            if v[l0 + li] != blk:
+                v[l0 + li], v[l0 + _LONG_N + li] = blk, 0
+                v[b0] = v[b0 + 1] = 0
+            v[l0 + _LONG_N + li] += 1
+            v[b0 + (pbit >> 6)] |= 1 << (pbit & 63)
+            req_count, lo, hi = 0, 0, 0
+            for i in range(_LONG_N):
+                if v[l0 + i] > blk - _LONG_N:
+                    req_count += v[l0 + _LONG_N + i]
+                    b = l0 + 2 * _LONG_N + 2 * i
+                    lo |= v[b]
+                    hi |= v[b + 1]
+            v[1] = max(v[1], now)
+            v[2] = now
+            _SLOT.pack_into(self._buf, off, *v)
+        finally:
+            self._unlock(home, n)
+
+        zeros = _BITS - bin(lo).count("1") - bin(hi).count("1")
+        uniq = round(-_BITS * math.log(zeros / _BITS)) if zeros else round(_BITS * math.log(_BITS))
+        return req_count, interval, c10, max(1, uniq)
+
+    def stats(self):
+        used = sum(1 for i in range(self.slots)
+                   if struct.unpack_from("<Q", self._buf, i * _SLOT.size)[0])
+        return {"backend": self.name, "slots": self.slots, "used": used}
+
+
+# ───────────── redis ─────────────
+class RedisError(Exception):
+    pass
+
+
+class _RespConn:
+    """RESP2 연결 하나. pipeline() 은 명령 여러 개를 한 번에 보내고 응답을 순서대로 읽는다."""
+
+    def __init__(self, addr, db: int, timeout: float):
+        s = socket.create_connection(addr, timeout=timeout)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock, self._rf = s, s.makefile("rb")
+        if db:
+            self._send([("SELECT", db)])
+            self._read()
+
+    def close(self):
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _encode(cmd) -> bytes:
+        out = [b"*%d\r\n" % len(cmd)]
+        for a in cmd:
+            b = a if isinstance(a, bytes) else str(a).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(out)
+
+    def _send(self, cmds):
+        self._sock.sendall(b"".join(self._encode(c) for c in cmds))
+
+    def _read(self):
+        line = self._rf.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        t, body = line[:1], line[1:-2]
+        if t == b"+":
+            return body.decode()
+        if t == b"-":
+            return RedisError(body.decode())
+        if t == b":":
+            return int(body)
+        if t == b"$":
+            n = int(body)
+            if n < 0:
+                return None
+            data = self._rf.read(n + 2)
+            return data[:-2]
+        if t == b"*":
+            n = int(body)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise RedisError(f"bad reply {line!r}")
+
+    def pipeline(self, cmds: Sequence[tuple]) -> list:
+        self._send(cmds)
+        return [self._read() for _ in cmds]
+
+
+class _RespClient:
+    """
+    RESP2 최소 클라이언트 + 연결 풀 (최대 REDIS_POOL_SIZE 개).
+    실행기 스레드마다 쉬는 연결을 하나 꺼내 쓰므로 한 스레드의 왕복이 다른 스레드를 막지 않음.
+    풀이 모두 사용 중이면 연결이 반납될 때까지 대기 (각 왕복은 소켓 타임아웃으로 제한됨)
+    """
+
+    def __init__(self, url=REDIS_URL, timeout=REDIS_TIMEOUT, pool_size=REDIS_POOL_SIZE):
+        rest = url.split("://", 1)[-1]
+        hostport, _, db = rest.partition("/")
+        host, _, port = hostport.rpartition(":")
+        self.addr = (host or "127.0.0.1", int(port or 6379))
+        self.db = int(db or 0)
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+        self._idle: List[_RespConn] = []
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for c in idle:
+            c.close()
+
+    def pipeline(self, cmds: Sequence[tuple]) -> list:
+        with self._slots:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    conn = _RespConn(self.addr, self.db, self.timeout)
+                r = conn.pipeline(cmds)
+            except (OSError, ConnectionError):
+                if conn is not None:
+                    conn.close()               # 응답을 읽다 만 연결은 재사용하지 않음
+                raise
+            with self._lock:
+                self._idle.append(conn)
+            return r
+
+    def execute(self, *cmd):
+        r = self.pipeline([cmd])[0]
+        if isinstance(r, RedisError):
+            raise r
+        return r
+
+    def stats(self) -> dict:
+        return {"pool_size": self.pool_size, "idle": len(self._idle)}
+
+
+class RedisBackend(StateBackend):
+    """
+    키 (모두 TTL 부여)
+      {p}:rl:{ip}:{win}  빈도 윈도우 카운터 (INCR)
+      {p}:ev:{ip}        요청 시각 ZSET (score = ts)
+      {p}:pa:{ip}        경로 ZSET      (score = 마지막 등장 ts)
+      {p}:lt:{ip}        직전 요청 시각
+    ev / pa 는 시간(LONG_WINDOW)과 개수(MAX_EVENTS_PER_IP, 최근 것부터) 둘 다로 잘라 IP 하나가 키를 키우지 못함.
+    pa 는 "최근 등장한 경로 MAX_EVENTS_PER_IP 개"라서, IP 하나가 창 안에서 그보다 많이 요청하면
+    memory 백엔드("최근 요청 MAX_EVENTS_PER_IP 건 안의 고유 경로")보다 고유 경로 수가 클 수 있음
+    Redis 오류 시에는 프로세스 내부 백엔드로 대신 응답 (fail-open 보다 탐지 유지 우선).
+    오류가 나면 REDIS_COOLDOWN 초 동안은 Redis 를 시도하지 않고 바로 대체 백엔드를 씀
+    (장애 중 요청마다 REDIS_TIMEOUT 만큼 기다리지 않도록). 그 뒤 첫 호출이 다시 Redis 를 시도
+    """
+    name = "redis"
+
+    def __init__(self, url=REDIS_URL, prefix=REDIS_PREFIX):
+        self.client = _RespClient(url)
+        self.prefix = prefix
+        self.fallback = InProcessBackend()
+        self.errors = 0
+        self.skipped = 0                        # 쿨다운 중 Redis 없이 대체 백엔드로 처리한 호출 수
+        self._down_until = 0.0                  # time.monotonic() 기준. 이 시각 전에는 Redis 건너뜀
+        self._seq = itertools.count(1)          # ZADD 멤버 구분용. next() 는 GIL 아래 원자적 (스레드 실행기에서도 중복 없음)
+
+    # ─── 명령 생성 ───
+    def _rate_cmds(self, ip, now, window):
+        w = int(now // window)
+        cur = f"{self.prefix}:rl:{ip}:{w}"
+        return [("INCR", cur), ("EXPIRE", cur, int(2 * window) + 1),
+                ("GET", f"{self.prefix}:rl:{ip}:{w - 1}")]
+
+    @staticmethod
+    def _rate_result(r, now, window):
+        cur, prev = int(r[0]), int(r[2] or 0)
+        if not prev:
+            return float(cur)
+        w = int(now // window)
+        return cur + prev * (1.0 - (now - w * window) / window)
+
+    def _observe_cmds(self, ip, path, now):
+        p = self.prefix
+        ev, pa, lt = f"{p}:ev:{ip}", f"{p}:pa:{ip}", f"{p}:lt:{ip}"
+        lo = repr(now - LONG_WINDOW)
+        ttl = LONG_WINDOW + 1
+        return [
+            ("GETSET", lt, repr(now)),
+            ("ZADD", ev, repr(now), f"{now!r}:{os.getpid()}:{next(self._seq)}"),
+            ("ZREMRANGEBYSCORE", ev, "-inf", lo),
+            ("ZREMRANGEBYRANK", ev, 0, -(MAX_EVENTS_PER_IP + 1)),
+            ("ZCARD", ev),
+            ("ZCOUNT", ev, "(" + repr(now - SHORT_WINDOW), "+inf"),
+            ("ZADD", pa, repr(now), path),
+            ("ZREMRANGEBYSCORE", pa, "-inf", lo),
+            ("ZREMRANGEBYRANK", pa, 0, -(MAX_EVENTS_PER_IP + 1)),
+            ("ZCARD", pa),
+            ("EXPIRE", ev, ttl), ("EXPIRE", pa, ttl), ("EXPIRE", lt, ttl),
+        ]
+
+    @staticmethod
+    def _observe_result(r, now) -> Features:
+        last = float(r[0]) if r[0] is not None else 0.0
+        interval = now - last if last and last > now - LONG_WINDOW else 0
+        return int(r[4]), interval, int(r[5]), int(r[9])
+
+    def _available(self) -> bool:
+        if time.monotonic() < self._down_until:
+            self.skipped += 1
+            return False
+        return True
+
+    def _failed(self):
+        self.errors += 1
+        self._down_until = time.monotonic() + REDIS_COOLDOWN
+
+    def _run(self, cmds):
+        r = self.client.pipeline(cmds)
+        for x in r:
+            if isinstance(x, RedisError):
+                raise x
+        return r
+
+    # ─── 공개 API ───
+    def hit_rate(self, ip, now, window):
+        return self.hit_rate_many([(ip, now)], window)[0]
+
+    def observe(self, ip, path, now):
+        return self.observe_many([(ip, path, now)])[0]
+
+    def hit_rate_many(self, items, window):
+        items = list(items)
+        if not self._available():
+            return self.fallback.hit_rate_many(items, window)
+        try:
+            cmds = [c for ip, now in items for c in self._rate_cmds(ip, now, window)]
+            r = self._run(cmds) if cmds else []
+            return [self._rate_result(r[3 * i:3 * i + 3], now, window)
+                    for i, (_, now) in enumerate(items)]
+        except (OSError, ConnectionError, RedisError, ValueError):
+            self._failed()
+            return self.fallback.hit_rate_many(items, window)
+
+    def observe_many(self, items):
+        items = list(items)
+        if not self._available():
+            return self.fallback.observe_many(items)
+        try:
+            cmds = []
+            for ip, path, now in items:
+                cmds += self._observe_cmds(ip, path, now)
+            r = self._run(cmds) if cmds else []
+            k = len(cmds) // len(items) if items else 0
+            return [self._observe_result(r[k * i:k * (i + 1)], now)
+                    for i, (_, _, now) in enumerate(items)]
+        except (OSError, ConnectionError, RedisError, ValueError):
+            self._failed()
+            return self.fallback.observe_many(items)
+
+    def stats(self):
+        return {"backend": self.name, "server": "%s:%d" % self.client.addr,
+                "errors": self.errors, "skipped": self.skipped,
+                "down": time.monotonic() < self._down_until, "pool": self.client.stats(), "fallback": self.fallback.stats()}
+
+
+# ───────────── 생성 ─────────────
+_BACKENDS = {"memory": InProcessBackend, "shm": SharedMemoryBackend, "redis": RedisBackend}
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(kind: str = STATE_BACKEND, **kw) -> StateBackend:
+    try:
+        cls = _BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"unknown STATE_BACKEND: {kind}") from None
+    if cls is not InProcessBackend:
+        kw.pop("rate_window", None)
+        kw.pop("rate_capacity", None)
+    return cls(**kw)
+
+
+def get_backend(**kw) -> StateBackend:
+    """프로세스 공용 백엔드. 처음 호출할 때의 인자로 생성되고 이후에는 같은 객체를 반환."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(STATE_BACKEND, **kw)
+    return _backend
@@ -0,0 +1,411 @@
+# test_components.py (Component Tester)
+"""
+서버 없이 프로세스 안에서 돌리는 구성 요소 검사.
+기존 동작을 대체한 구성 요소가 원래 동작(또는 기준 구현)과 같은 결과를 내는지 확인합니다.
+사용법: python test_components.py   (실패가 하나라도 있으면 종료 코드 1)
+"""
+import random
+import sys
+import time
+
+_failures = []
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    """검사 결과를 출력하고 실패를 기록합니다."""
+    status = "통과" if ok else "실패"
+    print(f"  [{status}] {name:<40} {detail}")
+    if not ok:
+        _failures.append(name)
+    return ok
+
+# --- 테스트 케이스 정의 ---
+
+def test_limiter_window_math():
+    """SlidingWindowLimiter 두 버킷 보간이 타임스탬프 목록으로 직접 계산한 값과 같은지"""
+    print("--- 빈도 제한 윈도우 계산 테스트 ---")
+    from ratelimit import SlidingWindowLimiter
+    W = 60.0
+    lim = SlidingWindowLimiter(W, capacity=1000)
+
+    # 윈도우 0 에서 10 건 → 윈도우 1 중간(남은 비율 0.5) → 윈도우 2 중간 → 두 윈도우 이상 쉰 뒤
+    got = [lim.hit("1.1.1.1", float(t)) for t in range(10)]
+    check("같은 윈도우 안에서는 단순 카운트", got == [float(i + 1) for i in range(10)], str(got[-1]))
+    v = lim.hit("1.1.1.1", 90.0)
+    check("다음 윈도우 중간: 1 + 10 × 0.5", v == 6.0, str(v))
+    v = lim.hit("1.1.1.1", 150.0)
+    check("그다음 윈도우 중간: 1 + 1 × 0.5", v == 1.5, str(v))
+    v = lim.hit("1.1.1.1", 400.0)
+    check("두 윈도우 이상 쉰 뒤 이전 카운트 0", v == 1.0, str(v))
+
+    # 무작위 요청열: 추정치 = 현재 윈도우 수 + 이전 윈도우 수 × (윈도우 남은 비율)
+    rnd = random.Random(0)
+    lim = SlidingWindowLimiter(W, capacity=1000)
+    seen = {}
+    now, bad = 0.0, 0
+    for _ in range(20000):
+        now += rnd.expovariate(20.0) * rnd.choice((1, 1, 1, 50))
+        ip = f"10.0.0.{rnd.randrange(30)}"
+        ts = seen.setdefault(ip, [])
+        ts.append(now)
+        w = int(now // W)
+        cur = sum(1 for t in ts if int(t // W) == w)
+        prev = sum(1 for t in ts if int(t // W) == w - 1)
+        want = float(cur) if not prev else cur + prev * (1.0 - (now - w * W) / W)
+        del ts[:-cur - prev]
+        bad += lim.hit(ip, now) != want
+    check("무작위 요청열 기준 구현과 일치", bad == 0, f"불일치 {bad}/20000")
+
+def test_limiter_eviction():
+    """상한 도달 시 축출 / 나이 만료와 새 IP 등록 비용"""
+    print("\n--- 빈도 제한 상한 / 만료 테스트 ---")
+    from ratelimit import SlidingWindowLimiter
+
+    lim = SlidingWindowLimiter(60, capacity=100)
+    for i in range(100):
+        lim.hit(f"10.0.0.{i}", 0.0)
+    for i in range(300):
+        lim.hit("9.9.9.9", 1.0 + i * 0.001)              # 계속 요청하는 IP 는 가장 최근에 쉰 슬롯
+        lim.hit(f"10.1.{i // 256}.{i % 256}", 1.0 + i * 0.001)
+    st = lim.stats()
+    check("상한 유지", len(lim) <= 100 and st["slots"] <= 101, str(st))
+    check("상한 초과분 축출", st["evicted"] > 0 and st["expired"] == 0, f"evicted {st['evicted']}")
+    check("최근 요청한 IP 는 남음", "9.9.9.9" in lim._slot)
+
+    lim = SlidingWindowLimiter(60, capacity=100)
+    for i in range(100):
+        lim.hit(f"10.0.0.{i}", 0.0)
+    for i in range(100):
+        lim.hit(f"10.2.0.{i}", 1000.0)                   # idle_ttl(120초) 지난 슬롯부터 재사용
+    st = lim.stats()
+    check("만료 슬롯 재사용 (축출 없음)", st["evicted"] == 0 and st["expired"] == 100, str(st))
+
+    # 상한에 찬 뒤 새 IP 등록 비용이 상한 크기와 무관해야 함 (전체 순회 없음)
+    cost = {}
+    for cap in (1_000, 100_000):
+        lim = SlidingWindowLimiter(60, capacity=cap)
+        for i in range(cap):
+            lim.hit(f"a{i}", 0.0)
+        t0 = time.perf_counter()
+        for i in range(5_000):
+            lim.hit(f"b{i}", 1.0)
+        cost[cap] = (time.perf_counter() - t0) / 5_000 * 1e6
+    check("상한 도달 후 새 IP 등록 비용 일정", cost[100_000] < 10 * cost[1_000] + 20,
+          " / ".join(f"cap {k}: {v:.1f} µs" for k, v in cost.items()))
+
+def _state_sequence(n: int = 3000):
+    """
+    IP 몇 개가 몇 분 동안 경로 몇 개를 번갈아 요청하는 (ip, path, now) 목록.
+    끝에 IP 하나가 MAX_EVENTS_PER_IP 를 넘게 몰아서 요청하는 구간 (IP 당 이벤트 상한 확인)
+    """
+    from behavior_store import MAX_EVENTS_PER_IP
+    rnd = random.Random(1)
+    now, seq = 1.75e9, []
+    for _ in range(n):
+        now += round(rnd.expovariate(10.0) * rnd.choice((1, 1, 30)), 3)
+        seq.append((f"10.9.0.{rnd.randrange(5)}", f"/p{rnd.randrange(12)}", now))
+    for i in range(MAX_EVENTS_PER_IP + 500):
+        seq.append(("10.9.1.1", f"/b{i % 700}", round(now + 0.001 * (i + 1), 3)))
+    return seq
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def test_state_backend_parity():
+    """memory / redis 는 같은 값, shm 은 문서화한 근사 범위 안 (SharedMemoryBackend 참고)"""
+    print("\n--- 상태 백엔드 일치 테스트 ---")
+    import asyncio, os, tempfile, threading, uuid
+    import state_backend as sb
+    from bench_replay import DEFAULT_INPUT, load_requests
+
+    seq = _state_sequence()
+    mem = sb.create_backend("memory")
+    ref_rate = [mem.hit_rate(ip, now, 60) for ip, _, now in seq]
+    ref_obs = [mem.observe(ip, path, now) for ip, path, now in seq]
+
+    # redis: 저장소의 RESP 대역 서버를 스레드로 띄워 실제 프로토콜 / 파이프라인으로 비교
+    import resp_standin
+    port = _free_port()
+    threading.Thread(target=lambda: asyncio.run(resp_standin.serve(port)), daemon=True).start()
+    url = f"redis://127.0.0.1:{port}/0"
+    for _ in range(50):
+        try:
+            sb._RespClient(url).execute("PING")
+            break
+        except OSError:
+            time.sleep(0.05)
+    red = sb.create_backend("redis", url=url, prefix=f"t{uuid.uuid4().hex[:8]}")
+    rate, obs = [], []
+    for i in range(0, len(seq), 64):                     # 파이프라인 일괄 경로 (hit_rate_many / observe_many)
+        chunk = seq[i:i + 64]
+        for ip, _, now in chunk:
+            rate += red.hit_rate_many([(ip, now)], 60)
+        obs += red.observe_many(chunk)
+    check("redis 오류 없음 (대체 백엔드 미사용)", red.errors == 0 and red.skipped == 0, str(red.errors))
+    check("redis hit_rate = memory", rate == ref_rate,
+          f"불일치 {sum(a != b for a, b in zip(rate, ref_rate))}/{len(seq)}")
+    check("redis observe = memory", obs == ref_obs,
+          f"불일치 {sum(a != b for a, b in zip(obs, ref_obs))}/{len(seq)}")
+
+    # shm: hit_rate 는 같은 식, observe 는 버킷 / 비트맵 근사
+    name = f"waf_test_{uuid.uuid4().hex[:8]}"
+    with tempfile.TemporaryDirectory() as tmp:
+        shm = sb.create_backend("shm", name=name, slots=1024, lock_path=os.path.join(tmp, "lock"))
+        try:
+            rate = [shm.hit_rate(ip, now, 60) for ip, _, now in seq]
+            check("shm hit_rate = memory", rate == ref_rate,
+                  f"불일치 {sum(a != b for a, b in zip(rate, ref_rate))}/{len(seq)}")
+
+            reqs = load_requests(DEFAULT_INPUT)
+            mem = sb.create_backend("memory")
+            a = [mem.observe(q["ip"], q["path"], q["timestamp"]) for q in reqs]
+            b = [shm.observe(q["ip"], q["path"], q["timestamp"]) for q in reqs]
+            names = ("req_count", "interval", "req_count_in_last_10s", "unique_paths_in_last_60s")
+            diff = {f: sum(x[k] != y[k] for x, y in zip(a, b)) / len(reqs) for k, f in enumerate(names)}
+            check("shm observe 특징별 불일치 1 % 미만 (traffic_log)", max(diff.values()) < 0.01,
+                  " ".join(f"{f}={v:.3f}" for f, v in diff.items()))
+        finally:
+            from multiprocessing import resource_tracker
+            resource_tracker.register(shm._shm._name, "shared_memory")   # 백엔드가 추적 해제해 둔 것을 되돌린 뒤 삭제
+            shm._shm.close()
+            shm._shm.unlink()
+
+def _feature_rows():
+    """traffic_log.csv 특징 행 + 흔들어 본 행 + 학습 범위를 크게 벗어난 행"""
+    import numpy as np
+    import ml_detection
+    from bench_replay import DEFAULT_INPUT, load_requests
+    X = np.vstack([ml_detection._feature_row(d) for d in load_requests(DEFAULT_INPUT)])
+    rnd = np.random.default_rng(0)
+    return np.vstack([X, X * rnd.normal(1, 0.5, X.shape), rnd.normal(0, 1e3, (500, X.shape[1]))])
+
+def test_native_iforest_matches_sklearn():
+    """펼친 IsolationForest 추론기가 sklearn 과 decision_function / predict 모두 같은지"""
+    print("\n--- IsolationForest 추론기 일치 테스트 ---")
+    import os, tempfile, warnings
+    import joblib
+    import numpy as np
+    import iforest_native
+    from sklearn.ensemble import IsolationForest
+    warnings.filterwarnings("ignore")
+
+    X = _feature_rows()
+    model = joblib.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.pkl"))
+    native = iforest_native.export(model)
+    bad = iforest_native.check(model, native, X)
+    check("model.pkl 파이프라인", bad == 0, f"불일치 {bad}/{len(X)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "if.npz")
+        native.save(path)
+        bad = iforest_native.check(model, iforest_native.NativeIForest.load(path), X)
+    check("npz 저장 후 다시 적재", bad == 0, f"불일치 {bad}/{len(X)}")
+
+    # 스케일러 없는 단독 모델 + 특징 부분 추출(max_features < 1) 경로
+    forest = IsolationForest(n_estimators=50, max_features=0.5, random_state=0).fit(X[:1000])
+    bad = iforest_native.check(forest, iforest_native.export(forest), X)
+    check("단독 모델 / max_features=0.5", bad == 0, f"불일치 {bad}/{len(X)}")
+
+    row = X[:1]
+    same = native.decision_function(row)[0] == model.decision_function(row)[0]
+    check("1행 입력", bool(same), f"{native.decision_function(row)[0]:.6f}")
+
+def test_native_lof_matches_sklearn():
+    """TreeLOF / fit() 은 sklearn 과 같은 값, PrototypeLOF 는 판정 일치율 하한 이상"""
+    print("\n--- LOF 추론기 일치 테스트 ---")
+    import os, warnings
+    import joblib
+    import numpy as np
+    import lof_native
+    from sklearn.neighbors import LocalOutlierFactor
+    warnings.filterwarnings("ignore")
+
+    X = _feature_rows()
+    model = joblib.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "lof_model.pkl"))
+    tree = lof_native.export(model)
+    bad = int(np.count_nonzero(model.decision_function(X) != tree.decision_function(X)))
+    bad += int(np.count_nonzero(model.predict(X) != tree.predict(X)))
+    check("lof_model.pkl → TreeLOF", bad == 0, f"불일치 {bad}/{len(X)}")
+
+    # 재학습 경로: sklearn 없이 만든 기준 집합이 LocalOutlierFactor.fit 과 같은 값
+    train = lof_native._synthetic(3000, X.shape[1])
+    probe = np.vstack([lof_native._synthetic(1000, X.shape[1], seed=1),
+                       np.random.default_rng(2).normal(0, 8, (200, X.shape[1]))])
+    ref = LocalOutlierFactor(n_neighbors=20, novelty=True, contamination=0.1).fit(train)
+    mine = lof_native.fit(train, 20, 0.1)
+    err = float(np.max(np.abs(ref.decision_function(probe) - mine.decision_function(probe))))
+    bad = int(np.count_nonzero(ref.predict(probe) != mine.predict(probe)))
+    check("fit() = LocalOutlierFactor.fit", err == 0.0 and bad == 0 and ref.offset_ == mine.offset,
+          f"점수 최대 오차 {err:g}, 판정 불일치 {bad}")
+
+    lof = model.steps[-1][1] if hasattr(model, "steps") else model
+    acc = lof_native.accuracy(tree, lof_native.compress(tree, 1024, lof.contamination), X)
+    check("PrototypeLOF 판정 일치율 0.95 이상", acc["agreement"] >= 0.95,
+          f"agreement {acc['agreement']}, FP {acc['false_positive']}, FN {acc['false_negative']}")
+
+def test_reload_canary():
+    """번들 핫 리로드: 같은 판정의 새 번들은 교체, 이상치 비율 / 일치율 기준을 넘으면 거부 후 기존 모델 유지"""
+    print("\n--- 모델 핫 리로드 사전 검증 테스트 ---")
+    import copy, os, tempfile, warnings
+    import joblib
+    import numpy as np
+    import ml_detection as ml
+    import model_bundle
+    import train_pipeline
+    warnings.filterwarnings("ignore")
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    pk = {n: joblib.load(os.path.join(base, n + ".pkl"))
+          for n in ("model", "lof_model", "enc_method", "enc_accept", "enc_referer")}
+    with tempfile.TemporaryDirectory() as cache:       # 학습 파이프라인이 만든 traffic_log.csv 특징 행
+        X, _, _ = train_pipeline.load_features(train_pipeline.DEFAULT_INPUT, cache_dir=cache, log=lambda *a: None)
+        X = np.array(X, dtype=np.float64)
+    saved = (ml.BUNDLE_ROOT, ml._active, ml._previous, list(ml._recent),
+             set(ml._rejected_versions), dict(ml._reload_stats), ml._last_report)
+
+    def bundle(root, offset=None):
+        model = copy.deepcopy(pk["model"])
+        if offset is not None:
+            model.steps[-1][1].offset_ = offset          # IsolationForest 판정 경계만 옮긴 모델
+        time.sleep(1.1)                                  # 버전 이름이 초 단위 시각이라 같은 초에 두 번 저장 불가
+        return model_bundle.save(model, pk["lof_model"], pk["enc_method"], pk["enc_accept"],
+                                 pk["enc_referer"], ml._FEATURES, {"source": "test"}, root,
+                                 activate=False, canary=X[:200])
+
+    with tempfile.TemporaryDirectory() as root:
+        try:
+            ml.BUNDLE_ROOT = root
+            ml._recent.clear()
+            ml._recent.extend(X[:ml.ML_CANARY_SIZE])
+            forest = pk["model"].steps[-1][1]
+            offset = forest.offset_
+            scores = pk["model"].score_samples(X)
+
+            good = bundle(root)
+            rep = ml.reload_models(good)
+            check("같은 판정의 번들은 교체", rep["reloaded"] and ml._active.version == good,
+                  str(rep.get("canary")))
+            check("교체한 버전으로 CURRENT 갱신", model_bundle.current(root) == good)
+            rep = ml.reload_models(good)
+            check("이미 적용된 버전은 다시 적재하지 않음", not rep["reloaded"] and rep["reason"] == "already active")
+
+            noisy = bundle(root, offset=1.0)            # 모든 행이 이상치
+            rep = ml.reload_models(noisy)
+            check("이상치 비율 상한 초과 → 거부", not rep["reloaded"] and "anomaly rate" in rep.get("reason", ""),
+                  rep.get("reason", ""))
+            check("거부 후 기존 모델 / CURRENT 유지",
+                  ml._active.version == good and model_bundle.current(root) == good
+                  and noisy in ml._rejected_versions)
+
+            drift = bundle(root, offset=float(np.quantile(scores, 0.4)))   # 약 40 % 를 이상치로
+            rep = ml.reload_models(drift, min_agreement=0.9)
+            check("현재 모델과 일치율 하한 미달 → 거부", not rep["reloaded"] and "agreement" in rep.get("reason", ""),
+                  rep.get("reason", ""))
+            rep = ml.reload_models(drift, force=True, min_agreement=0.9)
+            check("force 면 검증 실패도 교체", rep["reloaded"] and ml._active.version == drift
+                  and ml._previous.version == good)
+            check("원래 모델 경계는 그대로 (번들 간 공유 없음)", forest.offset_ == offset)
+        finally:
+            (ml.BUNDLE_ROOT, ml._active, ml._previous, recent,
+             rejected, stats, ml._last_report) = saved
+            ml._recent.clear()
+            ml._recent.extend(recent)
+            ml._rejected_versions.clear()
+            ml._rejected_versions.update(rejected)
+            ml._reload_stats.update(stats)
+
+def test_window_features_match_store():
+    """일괄 window_features 가 BehaviorStore.observe 를 timestamp 순으로 돌린 값과 같은지"""
+    print("\n--- 학습 시간 윈도우 특징 일치 테스트 ---")
+    import numpy as np
+    import features
+    import train_pipeline
+    from behavior_store import BehaviorStore
+
+    # 같은 timestamp / 창 경계 / IP 당 상한(cap)이 섞이도록 작은 무작위 입력을 여러 번
+    rng = np.random.default_rng(0)
+    bad = rows = 0
+    for _ in range(300):
+        n = int(rng.integers(1, 200))
+        cap = int(rng.integers(2, 10))
+        ip = rng.integers(0, 4, n)
+        path = rng.integers(0, 5, n)
+        ts = np.round(rng.uniform(0, 200, n) / rng.choice([1, 5, 20]), 0 if rng.random() < 0.5 else 3)
+        out = np.stack(features.window_features(ip, ts, path, cap=cap), axis=1).astype(float)
+        store = BehaviorStore(max_events_per_ip=cap, max_total_events=10 ** 9)
+        ref = np.empty((n, 4))
+        for i in np.argsort(ts, kind="stable"):            # 같은 timestamp 는 입력 순서
+            ref[i] = store.observe(int(ip[i]), int(path[i]), float(ts[i]))
+        bad += int(np.count_nonzero((out != ref).any(axis=1)))
+        rows += n
+    check("무작위 입력 (cap 2~9, 동시각 포함)", bad == 0, f"불일치 {bad}/{rows}")
+
+    # traffic_log.csv: 학습 특징 행렬 전체 = 서빙 경로(_fill_row + BehaviorStore)
+    bad, n = train_pipeline.verify(train_pipeline.DEFAULT_INPUT, 1000)
+    check("traffic_log.csv 학습 행 = 서빙 행", bad == 0, f"불일치 {bad}/{n}")
+    bad, n = train_pipeline.verify(train_pipeline.DEFAULT_INPUT, 1000, chunk_rows=97)
+    check("작은 청크로 나눠 읽어도 같음", bad == 0, f"불일치 {bad}/{n}")
+
+def test_microbatch_ordering():
+    """MicroBatcher: 배치가 늦게 / 순서 없이 끝나도 호출자마다 자기 결과, 실패는 그 배치에만"""
+    print("\n--- 마이크로 배치 순서 테스트 ---")
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from microbatch import MicroBatcher
+
+    pool = ThreadPoolExecutor(8)
+    rnd = random.Random(2)
+
+    def fn(items):
+        time.sleep(rnd.uniform(0, 0.01))                  # 먼저 만든 배치가 나중에 끝나도록
+        if -1 in items:
+            raise ValueError("bad item")
+        return [x * 2 for x in items]
+
+    async def runner(f, items):
+        return await asyncio.get_running_loop().run_in_executor(pool, f, items)
+
+    async def main():
+        mb = MicroBatcher(fn, max_size=16, max_wait_us=200, runner=runner)
+        got = await asyncio.gather(*(mb.submit(i) for i in range(500)))
+        check("호출자마다 자기 결과 (runner)", got == [i * 2 for i in range(500)], str(mb.stats()["sizes"]))
+        check("배치 크기 상한", max(mb.stats()["sizes"]) <= 16 and mb.items == 500, f"batches {mb.batches}")
+
+        # 상한보다 적게 오면 max_wait 뒤 flush (타이머 경로)
+        t0 = time.perf_counter()
+        got = await asyncio.gather(*(mb.submit(i) for i in range(3)))
+        check("상한 미만은 대기 시간 뒤 flush", got == [0, 2, 4], f"{(time.perf_counter() - t0) * 1e3:.1f} ms")
+
+        # 실패한 배치의 호출자만 예외, 같은 시점의 다른 배치는 정상
+        got = await asyncio.gather(*(mb.submit(-1 if i == 20 else i) for i in range(48)),
+                                   return_exceptions=True)
+        failed = [i for i, r in enumerate(got) if isinstance(r, Exception)]
+        ok = [r for i, r in enumerate(got) if i not in failed] == [i * 2 for i in range(48) if i not in failed]
+        check("실패는 해당 배치에만 전달", failed == list(range(16, 32)) and ok, f"실패 {failed[:1]}..{failed[-1:]}")
+        await asyncio.sleep(0)
+        check("끝난 배치 태스크 참조 정리", not mb._tasks, str(len(mb._tasks)))
+
+        mb = MicroBatcher(fn, max_size=16, max_wait_us=200)
+        got = await asyncio.gather(*(mb.submit(i) for i in range(100)))
+        check("호출자마다 자기 결과 (이벤트 루프 실행)", got == [i * 2 for i in range(100)])
+
+    asyncio.run(main())
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    print("WAF 구성 요소 테스트를 시작합니다.\n")
+
+    test_limiter_window_math()
+    test_limiter_eviction()
+    test_state_backend_parity()
+    test_native_iforest_matches_sklearn()
+    test_native_lof_matches_sklearn()
+    test_reload_canary()
+    test_window_features_match_store()
+    test_microbatch_ordering()
+
+    print(f"\n실패 {len(_failures)} 건" + (f": {', '.join(_failures)}" if _failures else ""))
+    sys.exit(1 if _failures else 0)
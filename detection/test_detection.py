@@ -54,6 +54,23 @@ def test_rule_based_cases():
     result_geo = send_request(payload_geo)
     print_result(payload_geo["ip"], "차단 국가 (CN)", result_geo, payload_geo)
 
+def test_graphql_bracket_cases():
+    """주석 / 문자열 안의 괄호만 많은 GraphQL 쿼리 (오류 없이 판정이 나와야 함)"""
+    print("\n--- GraphQL 괄호 사전 검사 테스트 ---")
+    cases = {
+        "주석 안의 괄호":   "#" + "{" * 70 + "\n{ user { id } }",
+        "문자열 안의 괄호": '{ search(q: "' + "{" * 70 + '") { id } }',
+        "주석만 있는 쿼리": "#" + "{" * 70,
+        "문자열만 있는 쿼리": '"' + "{" * 70 + '"',
+    }
+    for name, query in cases.items():
+        payload = {"ip": "8.8.4.4", "headers": {"User-Agent": "Mozilla/5.0", "Content-Type": "application/json"},
+                   "path": "/graphql", "method": "POST", "graphql": query}
+        result = send_request(payload)
+        if result.get("method") == "error":
+            print(f"  [실패] {name}: {result.get('detail')}")
+        print_result(payload["ip"], f"GraphQL {name}", result, payload)
+
 def test_stateful_ml_cases():
     """상태 기반 ML 탐지 테스트 (연속적인 요청)"""
     print("\n--- 상태 기반 ML 탐지 테스트 ---")
@@ -175,6 +192,7 @@ if __name__ == "__main__":
     # 정의된 케이스 테스트
     test_normal_case()
     test_rule_based_cases()
+    test_graphql_bracket_cases()
     test_stateful_ml_cases()
 
     # 무작위 케이스 테스트
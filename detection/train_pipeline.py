@@ -0,0 +1,425 @@
+# train_pipeline.py
+"""
+청크 단위 학습 파이프라인 (수천만 행 로그 → 특징 행렬 캐시 → IsolationForest / LOF → 번들)
+──────────────────────────────────────────────
+  1. 읽기: CSV(pandas chunksize) 또는 Parquet(pyarrow 배치)를 CHUNK_ROWS 행씩. 원문 문자열은 청크 안에서만 유지
+     - 문자열 열은 pd.factorize 로 청크 안 고유값만 뽑아 features.py 함수를 고유값마다 한 번 호출
+     - 행마다 남기는 것은 정수 코드(IP / 경로 / method / Accept 타입 / Referer 도메인)와 timestamp,
+       auth_validity, cookie_count 뿐 (행당 약 30 바이트)
+  2. 시간 윈도우 특징: features.window_features (정렬 + searchsorted + 누적합, 파이썬 행 루프 없음).
+     행이 많으면 IP 단위로 WINDOW_PARTITION_ROWS 행 안팎의 파티션으로 나눠 계산 (창은 IP 별이라 결과 동일)
+  3. 인코더: 전체 어휘로 LabelEncoder 구성 (Referer 는 상위 REFERER_TOP 도메인 + __OTHER__)
+  4. 특징 행렬 X (행 × 13, float64) 를 CACHE_DIR/<키>/X.npy 로 기록. 키는 입력 파일(경로 / 크기 / 수정 시각)과
+     features.py 내용의 해시 → 같은 입력으로 다시 학습하면 1~3 단계를 건너뛰고 memmap 으로 바로 적재
+  5. 학습: IsolationForest 는 최대 IF_SAMPLE 행, LOF 는 최대 LOF_SAMPLE 행 무작위 표본
+     (행 수가 그보다 적으면 전체). 결과는 model_bundle 로 저장
+
+학습 특징은 서빙(ml_detection._fill_row + behavior_store)과 같은 함수 / 같은 창 규칙으로 계산됨.
+--verify N 은 앞 N 행을 서빙 경로로 재생해 특징 행이 비트 단위로 같은지 확인.
+
+사용법
+  python train_pipeline.py [traffic_log.csv | logs.parquet] [--chunk-rows N] [--cache-dir DIR] [--no-cache]
+                           [--features-only] [--verify N] [--legacy-pkl] [--report out.json]
+"""
+
+from __future__ import annotations
+import argparse, hashlib, json, os, shutil, sys, time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import features
+
+BASE_DIR      = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT = os.path.join(BASE_DIR, "traffic_log.csv")
+CACHE_DIR     = os.getenv("TRAIN_CACHE_DIR", os.path.join(BASE_DIR, ".feature_cache"))
+CACHE_FORMAT  = 1
+CHUNK_ROWS    = int(os.getenv("TRAIN_CHUNK_ROWS", "1000000"))
+WINDOW_PARTITION_ROWS = int(os.getenv("TRAIN_WINDOW_PARTITION_ROWS", "4000000"))
+IF_SAMPLE     = int(os.getenv("TRAIN_IF_SAMPLE", "1000000"))
+LOF_SAMPLE    = int(os.getenv("TRAIN_LOF_SAMPLE", "50000"))
+CANARY_ROWS   = 256
+CONTAMINATION = 0.1
+RANDOM_STATE  = 42
+
+STR_COLUMNS = ("ip", "method", "path", "referer", "authorization", "accept_type")
+COLUMNS     = STR_COLUMNS + ("timestamp", "cookie_count")
+# 값이 비어 있을 때 서빙 쪽 기본값 (bench_replay._csv_payload / ml_detection._fill_row 와 같음)
+DEFAULTS    = {"method": "GET", "path": "/"}
+
+
+# ───────────── 입력 ─────────────
+def read_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """COLUMNS 만 chunk_rows 행씩. 문자열 열의 빈 값은 "" (NaN 아님)."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq            # Parquet 입력에만 필요
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=list(COLUMNS)):
+            df = batch.to_pandas()
+            for c in STR_COLUMNS:
+                df[c] = df[c].fillna("").astype(str)
+            yield df
+        return
+    yield from pd.read_csv(path, usecols=list(COLUMNS), chunksize=chunk_rows,
+                           dtype={c: str for c in STR_COLUMNS + ("cookie_count",)},
+                           na_filter=False, float_precision="round_trip")
+
+
+class _Vocab:
+    """문자열 → 0 부터의 정수 id (청크 사이에서 유지) + 등장 횟수."""
+    __slots__ = ("ids", "counts")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def encode(self, values, transform=None) -> np.ndarray:
+        """values(Series) → id 배열. transform 이 있으면 고유값마다 변환한 결과를 어휘로 씀."""
+        codes, uniq = pd.factorize(values, sort=False)
+        ids = self.ids
+        if transform is not None:
+            uniq = [transform(u) for u in uniq]
+        gid = np.fromiter((ids.setdefault(u, len(ids)) for u in uniq), dtype=np.int32, count=len(uniq))
+        out = gid[codes]
+        if len(ids) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(ids) - len(self.counts), np.int64)])
+        self.counts += np.bincount(out, minlength=len(self.counts))
+        return out
+
+    def values(self) -> List[str]:
+        return list(self.ids)
+
+
+def _mapped(values, fn, dtype) -> np.ndarray:
+    """고유값마다 fn 을 한 번씩 호출해 행 배열로 펼침."""
+    codes, uniq = pd.factorize(values, sort=False)
+    return np.fromiter((fn(u) for u in uniq), dtype=dtype, count=len(uniq))[codes]
+
+
+def scan(path: str, chunk_rows: int = CHUNK_ROWS, log=print) -> dict:
+    """입력을 한 번 읽어 행별 정수 코드 / 수치 열과 어휘를 모음."""
+    vocab = {k: _Vocab() for k in ("ip", "path", "method", "accept", "referer")}
+    cols: Dict[str, list] = {k: [] for k in ("ip", "path", "method", "accept", "referer",
+                                            "ts", "auth", "cookie")}
+    rows, t0 = 0, time.perf_counter()
+    for df in read_chunks(path, chunk_rows):
+        for c, d in DEFAULTS.items():
+            df[c] = df[c].mask(df[c] == "", d)
+        cols["ip"].append(vocab["ip"].encode(df["ip"]))
+        cols["path"].append(vocab["path"].encode(df["path"]))
+        cols["method"].append(vocab["method"].encode(df["method"]))
+        cols["accept"].append(vocab["accept"].encode(df["accept_type"], features.accept_main))
+        cols["referer"].append(vocab["referer"].encode(df["referer"], features.referer_domain))
+        cols["ts"].append(df["timestamp"].to_numpy(dtype=np.float64))
+        cols["auth"].append(_mapped(df["authorization"], features.auth_validity, np.int8))
+        cols["cookie"].append(pd.to_numeric(df["cookie_count"], errors="coerce")
+                              .fillna(0).to_numpy(dtype=np.float64).astype(np.int32))
+        rows += len(df)
+        log(f"  읽음 {rows:,} 행 ({time.perf_counter() - t0:.1f}s)")
+    out = {"vocab": vocab}
+    for k in list(cols):                        # 열 하나씩 합쳐 청크 목록과 합친 배열이 동시에 많지 않게
+        parts = cols.pop(k)
+        out[k] = np.concatenate(parts) if parts else np.zeros(0)
+        if k in vocab:                          # 어휘 크기에 맞는 가장 작은 정수형 (method 등은 1 바이트)
+            out[k] = out[k].astype(np.min_scalar_type(max(len(vocab[k].ids) - 1, 0)), copy=False)
+        del parts
+    return out
+
+
+# ───────────── 특징 ─────────────
+def _windows(ip: np.ndarray, ts: np.ndarray, path: np.ndarray, ip_counts: np.ndarray,
+             partition_rows: int):
+    """
+    IP 를 행 수 누적합 기준으로 묶어 partition_rows 행 안팎의 파티션마다 window_features 계산.
+    (요청이 몰린 IP 하나는 나눌 수 없으므로 그 IP 의 파티션만 커짐)
+    """
+    n = len(ts)
+    if n <= partition_rows:
+        return features.window_features(ip, ts, path)
+    part_of = ((np.cumsum(ip_counts) - ip_counts) // partition_rows).astype(np.int32)
+    part_of = np.unique(part_of, return_inverse=True)[1].astype(np.int32)[ip]   # 빈 번호 없이
+    out = None
+    for k in range(int(part_of.max()) + 1):
+        sel = np.flatnonzero(part_of == k)
+        res = features.window_features(ip[sel], ts[sel], path[sel])
+        if out is None:
+            out = tuple(np.empty(n, dtype=v.dtype) for v in res)
+        for dst, v in zip(out, res):
+            dst[sel] = v
+        del sel, res
+    return out
+
+
+def _encoders(vocab: dict):
+    from sklearn.preprocessing import LabelEncoder
+
+    def fit(values):
+        enc = LabelEncoder()
+        enc.fit(np.array(values, dtype=object))
+        return enc
+
+    ref = vocab["referer"]
+    ranked = sorted((d for d in ref.values() if d is not None),
+                    key=lambda d: (-ref.counts[ref.ids[d]], d))
+    top = ranked[:features.REFERER_TOP]
+    return (fit(vocab["method"].values()), fit(vocab["accept"].values()),
+            fit(top + [features.REFERER_OTHER]))
+
+
+def _lookup(vocab: _Vocab, enc, default: int) -> np.ndarray:
+    """어휘 id → 인코더 코드 (인코더에 없는 값은 default)."""
+    code = {str(c): i for i, c in enumerate(enc.classes_)}
+    return np.array([code.get(v, default) if v is not None else default for v in vocab.values()],
+                    dtype=np.float64)
+
+
+def build_matrix(cols: dict, out_path: str, chunk_rows: int = CHUNK_ROWS,
+                 partition_rows: int = WINDOW_PARTITION_ROWS, log=print):
+    """
+    scan() 결과 → out_path 에 (행 × FEATURES) float64 npy 를 행 블록 단위로 기록. 인코더 3 개 반환.
+    (memmap 에 쓰면 더러운 페이지가 이 프로세스 RSS 로 잡히므로 일반 파일 쓰기)
+    """
+    vocab = cols["vocab"]
+    t0 = time.perf_counter()
+    windows = _windows(cols["ip"], cols["ts"], cols["path"], vocab["ip"].counts, partition_rows)
+    log(f"  시간 윈도우 특징 {time.perf_counter() - t0:.1f}s")
+
+    enc_method, enc_accept, enc_referer = _encoders(vocab)
+    codes = {f"path_{i}": c for i, c in enumerate(
+        np.array([features.path_stats(p) for p in vocab["path"].values()], dtype=np.float64).T)}
+    codes["method"]  = _lookup(vocab["method"], enc_method, -999)
+    accept_default   = {str(c): i for i, c in enumerate(enc_accept.classes_)}.get(features.ACCEPT_OTHER, -1)
+    codes["accept"]  = _lookup(vocab["accept"], enc_accept, accept_default)
+    referer_other    = list(enc_referer.classes_).index(features.REFERER_OTHER)
+    codes["referer"] = _lookup(vocab["referer"], enc_referer, referer_other)
+
+    n, nf = len(cols["ts"]), len(features.FEATURES)
+    f = open(out_path, "wb")
+    np.lib.format.write_array_header_1_0(f, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+                                             "fortran_order": False, "shape": (n, nf)})
+    for a in range(0, n, chunk_rows):
+        b = min(n, a + chunk_rows)
+        p = cols["path"][a:b]
+        block = np.empty((b - a, nf))
+        for j in range(4):                                          # path_depth .. uri_entropy
+            block[:, j] = codes[f"path_{j}"][p]
+        block[:, 4]  = cols["auth"][a:b]
+        block[:, 5]  = codes["referer"][cols["referer"][a:b]]
+        block[:, 6]  = codes["method"][cols["method"][a:b]]
+        block[:, 7]  = codes["accept"][cols["accept"][a:b]]
+        block[:, 8]  = cols["cookie"][a:b]
+        for j, w in enumerate(windows):                             # req_count .. unique_paths_in_last_60s
+            block[:, 9 + j] = w[a:b]
+        f.write(block.tobytes())
+    f.close()
+    log(f"  특징 행렬 {n:,} × {nf} ({time.perf_counter() - t0:.1f}s)")
+    return enc_method, enc_accept, enc_referer
+
+
+# ───────────── 캐시 ─────────────
+def cache_key(path: str) -> str:
+    st = os.stat(path)
+    with open(features.__file__, "rb") as f:
+        definition = hashlib.sha256(f.read()).hexdigest()
+    doc = {"input": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime_ns,
+           "format": CACHE_FORMAT, "features": definition}
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _load_cached(d: str):
+    from sklearn.preprocessing import LabelEncoder
+    with open(os.path.join(d, "vocab.json"), encoding="utf-8") as f:
+        doc = json.load(f)
+    encs = []
+    for name in ("enc_method", "enc_accept", "enc_referer"):
+        enc = LabelEncoder()
+        enc.classes_ = np.array(doc[name], dtype=object)
+        encs.append(enc)
+    return np.load(os.path.join(d, "X.npy"), mmap_mode="r"), tuple(encs), doc["info"]
+
+
+def load_features(path: str, chunk_rows: int = CHUNK_ROWS, cache_dir: Optional[str] = CACHE_DIR,
+                  log=print):
+    """
+    (X, (enc_method, enc_accept, enc_referer), info). cache_dir 가 있으면 캐시를 먼저 찾고,
+    없으면 만든 뒤 원자적으로(임시 디렉터리 → rename) 저장. cache_dir=None 이면 임시 파일에만 기록.
+    """
+    key = cache_key(path)
+    if cache_dir:
+        d = os.path.join(cache_dir, key)
+        if os.path.isfile(os.path.join(d, "vocab.json")):
+            X, encs, info = _load_cached(d)
+            log(f"특징 캐시 사용: {d} ({len(X):,} 행)")
+            return X, encs, dict(info, cached=True)
+    else:
+        import tempfile
+        cache_dir = tempfile.mkdtemp(prefix="features-")
+    tmp = os.path.join(cache_dir, f"{key}.tmp{os.getpid()}")
+    os.makedirs(tmp, exist_ok=True)
+
+    t0 = time.perf_counter()
+    log(f"특징 계산: {path}")
+    cols = scan(path, chunk_rows, log)
+    t_scan = time.perf_counter() - t0
+    encs = build_matrix(cols, os.path.join(tmp, "X.npy"), chunk_rows, log=log)
+    info = {"source": os.path.basename(path), "rows": int(len(cols["ts"])), "key": key,
+            "ips": len(cols["vocab"]["ip"].ids), "paths": len(cols["vocab"]["path"].ids),
+            "scan_sec": round(t_scan, 3), "build_sec": round(time.perf_counter() - t0, 3)}
+    del cols
+    with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump({name: [str(c) for c in enc.classes_]
+                   for name, enc in zip(("enc_method", "enc_accept", "enc_referer"), encs)}
+                  | {"info": info}, f, ensure_ascii=False)
+    d = os.path.join(cache_dir, key)
+    if os.path.isdir(d):
+        shutil.rmtree(d)
+    os.replace(tmp, d)
+    X, encs, _ = _load_cached(d)
+    return X, encs, dict(info, cached=False)
+
+
+# ───────────── 학습 ─────────────
+def _sample(X: np.ndarray, k: int, seed: int) -> np.ndarray:
+    """무작위 k 행 (원래 순서). X 가 memmap 이면 블록 단위 파일 읽기로 모음."""
+    if len(X) <= k:
+        return np.asarray(X)
+    idx = np.sort(np.random.default_rng(seed).choice(len(X), size=k, replace=False))
+    if not isinstance(X, np.memmap):
+        return X[idx]
+    # 흩어진 행을 memmap 으로 바로 모으면 파일 대부분의 페이지가 이 프로세스 RSS 로 잡힘
+    n, nf = X.shape
+    out = np.empty((k, nf), dtype=X.dtype)
+    with open(X.filename, "rb") as f:
+        for a in range(0, n, CHUNK_ROWS):
+            lo, hi = np.searchsorted(idx, [a, a + CHUNK_ROWS])
+            if lo == hi:
+                continue
+            f.seek(X.offset + a * nf * X.itemsize)
+            block = np.fromfile(f, dtype=X.dtype, count=min(CHUNK_ROWS, n - a) * nf).reshape(-1, nf)
+            out[lo:hi] = block[idx[lo:hi] - a]
+    return out
+
+
+def train(X: np.ndarray, if_sample: int = IF_SAMPLE, lof_sample: int = LOF_SAMPLE,
+          contamination: float = CONTAMINATION, random_state: int = RANDOM_STATE):
+    """StandardScaler → IsolationForest / LOF(novelty) 파이프라인 두 개."""
+    from sklearn.ensemble import IsolationForest
+    from sklearn.neighbors import LocalOutlierFactor
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    cols = features.FEATURES
+    pipe_if = make_pipeline(StandardScaler(), IsolationForest(contamination=contamination,
+                                                              random_state=random_state))
+    pipe_lof = make_pipeline(StandardScaler(), LocalOutlierFactor(novelty=True, contamination=contamination))
+    # 기존 train_model.py 처럼 열 이름이 있는 DataFrame 으로 학습
+    pipe_if.fit(pd.DataFrame(_sample(X, if_sample, random_state), columns=cols))
+    pipe_lof.fit(pd.DataFrame(_sample(X, lof_sample, random_state + 1), columns=cols))
+    return pipe_if, pipe_lof
+
+
+# ───────────── 서빙 경로와 일치 확인 ─────────────
+def verify(path: str, n: int, chunk_rows: int = CHUNK_ROWS):
+    """
+    앞 n 행만 담은 CSV 로 특징을 만들고, 같은 행을 bench_replay 처럼 timestamp 순으로
+    ml_detection._fill_row + BehaviorStore 에 통과시켜 비교. (다른 행 수, 비교한 행 수) 반환.
+    """
+    import csv, tempfile, types
+    from behavior_store import BehaviorStore
+    from bench_replay import _csv_payload
+    import ml_detection
+
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        rows = [r for _, r in zip(range(n), reader)]
+        fields = reader.fieldnames
+    with tempfile.TemporaryDirectory() as d:
+        head = os.path.join(d, "head.csv")
+        with open(head, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            w.writerows(rows)
+        X, (enc_method, enc_accept, enc_referer), _ = load_features(head, chunk_rows, d, log=lambda *_: None)
+        X = np.array(X)
+
+    m = types.SimpleNamespace(method_code=ml_detection._codes(enc_method),
+                              accept_code=ml_detection._codes(enc_accept),
+                              referer_code=ml_detection._codes(enc_referer))
+    m.accept_default = m.accept_code.get(features.ACCEPT_OTHER, -1)
+    m.referer_other = m.referer_code.get(features.REFERER_OTHER, -1)
+    store = BehaviorStore(max_total_events=len(rows) + 1)
+    ref = np.empty_like(X)
+    reqs = [_csv_payload(r) for r in rows]
+    for i in sorted(range(len(reqs)), key=lambda i: reqs[i]["timestamp"]):
+        data = reqs[i]
+        window = store.observe(data["ip"], data["path"], data["timestamp"])
+        ml_detection._fill_row(ref[i], data, window, m)
+    return int(np.count_nonzero((X != ref).any(axis=1))), len(rows)
+
+
+# ───────────── CLI ─────────────
+def _rss_peak_mb() -> float:
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="청크 단위 특징 계산 + 모델 학습 + 번들 저장")
+    ap.add_argument("input", nargs="?", default=DEFAULT_INPUT, help="CSV 또는 .parquet")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    ap.add_argument("--no-cache", action="store_true", help="특징 캐시를 쓰지도 저장하지도 않음")
+    ap.add_argument("--features-only", action="store_true", help="특징 행렬만 만들고 학습하지 않음")
+    ap.add_argument("--if-sample", type=int, default=IF_SAMPLE)
+    ap.add_argument("--lof-sample", type=int, default=LOF_SAMPLE)
+    ap.add_argument("--bundle-root", default=None, help="번들 저장 위치 (기본 models/)")
+    ap.add_argument("--legacy-pkl", action="store_true", help="model.pkl / lof_model.pkl / enc_*.pkl 도 기록")
+    ap.add_argument("--verify", type=int, default=0, metavar="N", help="앞 N 행을 서빙 경로와 비교")
+    ap.add_argument("--report", help="단계별 시간 / 최대 RSS 를 JSON 으로 저장")
+    args = ap.parse_args(argv)
+
+    if args.verify:
+        bad, n = verify(args.input, args.verify, args.chunk_rows)
+        print(f"서빙 경로와 비교: {n:,} 행 중 불일치 {bad}")
+        return 1 if bad else 0
+
+    report = {"input": args.input}
+    t0 = time.perf_counter()
+    X, (enc_method, enc_accept, enc_referer), info = load_features(
+        args.input, args.chunk_rows, None if args.no_cache else args.cache_dir)
+    report.update(info, features_sec=round(time.perf_counter() - t0, 3))
+
+    if not args.features_only:
+        import joblib, model_bundle
+        t1 = time.perf_counter()
+        pipe_if, pipe_lof = train(X, args.if_sample, args.lof_sample)
+        report["train_sec"] = round(time.perf_counter() - t1, 3)
+        print(f"학습 {report['train_sec']:.1f}s (IF {min(len(X), args.if_sample):,} 행, "
+              f"LOF {min(len(X), args.lof_sample):,} 행)")
+        if args.legacy_pkl:
+            for name, obj in (("model", pipe_if), ("lof_model", pipe_lof), ("enc_method", enc_method),
+                              ("enc_accept", enc_accept), ("enc_referer", enc_referer)):
+                joblib.dump(obj, os.path.join(BASE_DIR, name + ".pkl"))
+            print("저장 완료: model.pkl, lof_model.pkl, enc_*.pkl")
+        version = model_bundle.save(
+            pipe_if, pipe_lof, enc_method, enc_accept, enc_referer, features.FEATURES,
+            meta={"source": info["source"], "rows": info["rows"], "contamination": CONTAMINATION,
+                  "if_random_state": RANDOM_STATE, "if_rows": int(min(len(X), args.if_sample)),
+                  "lof_rows": int(min(len(X), args.lof_sample)),
+                  "lof_n_neighbors": int(pipe_lof.steps[-1][1].n_neighbors_), "feature_cache": info["key"]},
+            root=args.bundle_root or model_bundle.DEFAULT_ROOT,
+            # 핫 리로드 사전 검증용 학습 특징 행 표본
+            canary=_sample(X, CANARY_ROWS, 0),
+        )
+        print(f"번들 저장 완료: {os.path.join(args.bundle_root or 'models', version)}")
+
+    report.update(total_sec=round(time.perf_counter() - t0, 3), peak_rss_mb=round(_rss_peak_mb(), 1))
+    print(f"총 {report['total_sec']:.1f}s, 최대 RSS {report['peak_rss_mb']:.0f} MB")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())